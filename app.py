@@ -1,9 +1,24 @@
 import streamlit as st
-import tensorflow as tf
 
-from utils.bbox_utils import bbox, display_img_with_bbox
-from utils.image_utils import display_aug_image, image_aug
-from utils.seg_utils import seg, display_img_with_mask
+from utils.lazy_utils import STARTUP, tf, warm_up
+from utils.runtime_utils import apply_runtime_config
+
+with STARTUP.timed("import app modules"):
+    from utils.bbox_utils import bbox, display_img_with_bbox
+    from utils.display_utils import DEFAULT_DISPLAY_QUALITY, DISPLAY_FORMATS
+    from utils.export_utils import display_export_panel
+    from utils.image_utils import display_aug_image, image_aug
+    from utils.seg_utils import seg, display_img_with_mask
+    from utils.timing_utils import display_timings_panel
+    from utils.video_utils import display_video, video_aug
+
+
+def hide_gpus(tf_module):
+    try:
+        tf_module.config.set_visible_devices([], "GPU")
+    except:
+        pass
+
 
 def main():
     st.set_page_config(
@@ -19,28 +34,76 @@ def main():
     with st.sidebar:
         st.subheader("Choose Agumentation Type: ")
         option = st.selectbox(
-            "Select an option", ("Image", "Bounding-Box", "Segmentation")
+            "Select an option", ("Image", "Bounding-Box", "Segmentation", "Video")
+        )
+        num_samples = st.slider(
+            "Samples per view",
+            1,
+            16,
+            1,
+            help="Augment this many copies of the input in a single batched "
+            "layer call and show them as a grid.",
+        )
+        preview = st.checkbox(
+            "Preview resolution",
+            value=True,
+            help="Augment a copy downscaled to the display size. Layers with "
+            "pixel-sized arguments (e.g. crop sizes) behave differently on it.",
         )
+        if preview and st.button("Render full resolution"):
+            preview = False
+        with st.expander("Display encoding"):
+            st.selectbox("Format", DISPLAY_FORMATS, key="display_format")
+            st.slider(
+                "Quality",
+                10,
+                100,
+                DEFAULT_DISPLAY_QUALITY,
+                key="display_quality",
+                help="JPEG/WebP quality. Masks are always sent as PNG.",
+            )
+        show_timings = st.checkbox("Show stage timings", key="show_timings")
+        STARTUP.mark("page shell rendered")
 
         if option == "Image":
             layer, image = image_aug()
         if option == "Bounding-Box":
             layer, image, box, box_format = bbox()
         if option == "Segmentation":
-            inputs, outputs = seg()
+            seg_job, palette = seg(num_samples=num_samples, preview=preview)
+        if option == "Video":
+            layer, video_options = video_aug()
 
     if option == "Image":
-        display_aug_image(layer, image)
+        display_aug_image(layer, image, num_samples=num_samples, preview=preview)
     if option == "Bounding-Box":
-        display_img_with_bbox(image, box, layer, box_format)
+        display_img_with_bbox(
+            image, box, layer, box_format, num_samples=num_samples, preview=preview
+        )
     if option == "Segmentation":
-        display_img_with_mask(inputs, outputs)
+        display_img_with_mask(seg_job, palette)
+    if option == "Video":
+        display_video(layer, video_options, preview=preview)
 
+    with st.sidebar:
+        with st.expander("Export augmented dataset (TFRecord)"):
+            if option == "Bounding-Box":
+                display_export_panel("bbox", layer, box_format)
+            elif option == "Segmentation":
+                display_export_panel("seg", seg_job.args[0])
+            else:
+                display_export_panel("image", layer)
 
-if __name__ == "__main__":
-    try:
-        tf.config.set_visible_devices([], "GPU")
-    except:
-        pass
+    if show_timings:
+        with st.sidebar:
+            display_timings_panel()
 
+
+if __name__ == "__main__":
+    # TensorFlow and KerasCV are imported in the background while the page
+    # shell renders; GPUs are hidden and the thread pools sized as soon as
+    # TensorFlow is loaded, before it runs any op.
+    tf.on_load(hide_gpus)
+    tf.on_load(apply_runtime_config)
+    warm_up()
     main()
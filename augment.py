@@ -0,0 +1,109 @@
+"""Headless batch augmentation using the layer configurations of the demo.
+
+A manifest.json in the output directory maps every input to its output file.
+
+Example:
+    python augment.py --task image --layer RandomFlip \
+        --args '{"mode": "vertical"}' --input images/ --output out/
+"""
+import argparse
+import json
+import os
+
+from utils.catalog_utils import find_masks, list_image_files
+from utils.dataset_utils import (
+    ENCODERS,
+    MANIFEST_NAME,
+    build_augmentation_dataset,
+    output_files,
+    run_dataset,
+)
+from utils.layer_utils import TASK_CONFIGS, get_layer_from_config
+from utils.lazy_utils import tf
+from utils.precision_utils import DEFAULT_DTYPE, EXECUTION_DTYPES
+from utils.runtime_utils import apply_runtime_config
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--task", choices=list(TASK_CONFIGS), default="image")
+    parser.add_argument(
+        "--layer", required=True, help="Layer name from the task's LAYERS_CONFIG."
+    )
+    parser.add_argument(
+        "--args",
+        default="{}",
+        help="JSON object overriding the layer's default layer_args.",
+    )
+    parser.add_argument(
+        "--input",
+        nargs="+",
+        required=True,
+        help="Image directories, image files or .txt files listing image paths.",
+    )
+    parser.add_argument("--output", required=True, help="Output directory.")
+    parser.add_argument(
+        "--masks",
+        help="Directory of segmentation masks named like the images (seg task).",
+    )
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument(
+        "--image-size",
+        type=int,
+        nargs=2,
+        metavar=("HEIGHT", "WIDTH"),
+        help="Resize inputs to a fixed size. Without it, images are batched "
+        "with others of the same resolution.",
+    )
+    parser.add_argument(
+        "--dtype",
+        choices=EXECUTION_DTYPES,
+        default=DEFAULT_DTYPE,
+        help="Execution dtype; must be one the layer's config offers.",
+    )
+    parser.add_argument("--format", choices=list(ENCODERS), default="png")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    apply_runtime_config(tf)
+    layer = get_layer_from_config(
+        args.task, args.layer, json.loads(args.args), dtype=args.dtype
+    )
+
+    image_paths = list_image_files(args.input)
+    mask_paths = find_masks(image_paths, args.masks) if args.masks else None
+    os.makedirs(args.output, exist_ok=True)
+
+    dataset = build_augmentation_dataset(
+        layer,
+        image_paths,
+        args.output,
+        mask_paths=mask_paths,
+        batch_size=args.batch_size,
+        image_size=args.image_size,
+        image_format=args.format,
+    )
+    stats = run_dataset(dataset)
+    manifest = {
+        "task": args.task,
+        "layer": args.layer,
+        "args": json.loads(args.args),
+        "dtype": args.dtype,
+        "format": args.format,
+        **stats,
+        "files": output_files(
+            image_paths, args.output, args.format, masks=mask_paths is not None
+        ),
+    }
+    with open(os.path.join(args.output, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(
+        f"Augmented {stats['images']} images in {stats['seconds']:.2f}s "
+        f"({stats['images_per_second']:.1f} images/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Recommend TensorFlow thread pool sizes for concurrent augmentation.
+
+Each INTRAxINTER thread split runs in its own process (TensorFlow's pools can
+only be sized before its first op), benchmarking representative layers with
+1, 2, 4, ... concurrent callers.
+
+Example:
+    python autotune.py --concurrency 1 4 8 --sessions 8 --write-config runtime.json
+    KERASCV_DEMO_RUNTIME_CONFIG=runtime.json streamlit run app.py
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import typing
+
+from utils.runtime_utils import (
+    RuntimeConfig,
+    default_splits,
+    parse_split,
+    recommend_split,
+)
+
+
+DEFAULT_LAYERS = (
+    "image:RandomFlip",
+    "image:RandomRotation",
+    "image:RandomContrast",
+    "bbox:RandomRotation",
+    "seg:RandomFlip",
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--layers",
+        nargs="+",
+        default=list(DEFAULT_LAYERS),
+        metavar="TASK:LAYER",
+        help="LAYERS_CONFIG layers to benchmark.",
+    )
+    parser.add_argument(
+        "--splits",
+        nargs="+",
+        type=parse_split,
+        metavar="INTRAxINTER",
+        help="Thread splits to try; 0x0 is TensorFlow's default. Defaults to a "
+        "range derived from the number of cores.",
+    )
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 2, 4, 8])
+    parser.add_argument(
+        "--sessions",
+        type=int,
+        help="Concurrency to recommend a split for; defaults to the highest "
+        "--concurrency level.",
+    )
+    parser.add_argument("--resolution", type=int, nargs=2, default=[512, 512])
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--output", help="Write all trial results to this JSON file.")
+    parser.add_argument(
+        "--write-config", help="Write the recommended split to this config file."
+    )
+    parser.add_argument("--trial", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def run_trial(args):
+    """Benchmark every concurrency level under the thread split given in the
+    environment, printing one JSON result per level.
+    """
+    import tensorflow as tf
+
+    from utils.benchmark_utils import benchmark_concurrent
+    from utils.layer_utils import get_layer_from_config
+    from utils.parity_utils import make_inputs
+    from utils.runtime_utils import RUNTIME, apply_runtime_config
+
+    apply_runtime_config(tf, RUNTIME)
+    height, width = args.resolution
+    layers, inputs = [], []
+    for spec in args.layers:
+        task, layer_name = spec.split(":", 1)
+        layers.append(get_layer_from_config(task, layer_name))
+        inputs.append(make_inputs(task, height, width, args.batch_size))
+    for concurrency in args.concurrency:
+        result = benchmark_concurrent(layers, inputs, concurrency, args.iterations)
+        print(json.dumps({"concurrency": concurrency, **result}), flush=True)
+
+
+def spawn_trial(argv, split) -> typing.List[typing.Dict]:
+    config = RuntimeConfig(*split)
+    threads = {"intra_op_threads": split[0], "inter_op_threads": split[1]}
+    env = {**os.environ, **config.to_env()}
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--trial", *argv],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        error = (process.stderr.strip().splitlines() or ["failed"])[-1]
+        return [{**threads, "error": error}]
+    return [
+        {**threads, **json.loads(line)}
+        for line in process.stdout.splitlines()
+        if line.startswith("{")
+    ]
+
+
+def format_trial(result) -> str:
+    name = f"{result['intra_op_threads']}x{result['inter_op_threads']}"
+    if "error" in result:
+        return f"{name}: {result['error']}"
+    return (
+        f"{name} c{result['concurrency']}: p50 {result['p50_ms']:.2f}ms "
+        f"p90 {result['p90_ms']:.2f}ms {result['images_per_second']:.1f} img/s"
+    )
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.trial:
+        run_trial(args)
+        return
+
+    trial_argv = ["--layers", *args.layers]
+    trial_argv += ["--concurrency", *map(str, args.concurrency)]
+    trial_argv += ["--resolution", *map(str, args.resolution)]
+    trial_argv += ["--batch-size", str(args.batch_size)]
+    trial_argv += ["--iterations", str(args.iterations)]
+    results = []
+    for split in args.splits or default_splits(os.cpu_count() or 1):
+        for result in spawn_trial(trial_argv, split):
+            print(format_trial(result), flush=True)
+            results.append(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"cpu_count": os.cpu_count(), "results": results}, f, indent=2)
+
+    sessions = args.sessions or max(args.concurrency)
+    best = recommend_split(results, sessions)
+    if best is None:
+        sys.exit(f"No successful trial at concurrency {sessions}.")
+    config = RuntimeConfig(best["intra_op_threads"], best["inter_op_threads"])
+    print(f"Recommended for {sessions} concurrent sessions: {format_trial(best)}")
+    for name, value in config.to_env().items():
+        print(f"  {name}={value}")
+    print(f"  KERASCV_DEMO_WORKERS={sessions}")
+    if args.write_config:
+        with open(args.write_config, "w") as f:
+            json.dump(config._asdict(), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
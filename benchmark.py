@@ -0,0 +1,124 @@
+"""Benchmark every LAYERS_CONFIG layer across resolutions, batch sizes and
+execution modes.
+
+Example:
+    python benchmark.py --tasks image --output bench.json
+    python benchmark.py --tasks image --output new.json --baseline bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+
+import keras_cv
+import tensorflow as tf
+
+from utils.benchmark_utils import (
+    BATCH_SIZES,
+    MODES,
+    SYNTHETIC_RESOLUTIONS,
+    bundled_resolutions,
+    compare_to_baseline,
+    format_result,
+    run_benchmarks,
+)
+from utils.layer_utils import TASK_CONFIGS
+from utils.precision_utils import DEFAULT_DTYPE, EXECUTION_DTYPES
+from utils.runtime_utils import RUNTIME, apply_runtime_config
+
+
+def parse_resolution(value: str):
+    height, width = value.lower().split("x")
+    return int(height), int(width)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--tasks", nargs="+", choices=list(TASK_CONFIGS), default=list(TASK_CONFIGS)
+    )
+    parser.add_argument("--layers", nargs="+", help="Only benchmark these layers.")
+    parser.add_argument(
+        "--resolutions",
+        nargs="+",
+        type=parse_resolution,
+        metavar="HxW",
+        help="Defaults to the bundled image sizes plus "
+        + ", ".join(f"{h}x{w}" for h, w in SYNTHETIC_RESOLUTIONS),
+    )
+    parser.add_argument(
+        "--batch-sizes", nargs="+", type=int, default=list(BATCH_SIZES)
+    )
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument(
+        "--dtypes",
+        nargs="+",
+        choices=EXECUTION_DTYPES,
+        default=[DEFAULT_DTYPE],
+        help="Execution dtypes; each layer runs in those its config offers.",
+    )
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--output", help="Write results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare against a previous JSON result.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Relative p50 slowdown reported as a regression.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    apply_runtime_config(tf)
+    resolutions = args.resolutions or sorted(
+        set(bundled_resolutions()) | set(SYNTHETIC_RESOLUTIONS)
+    )
+    results = run_benchmarks(
+        tasks=args.tasks,
+        layers=args.layers,
+        resolutions=resolutions,
+        batch_sizes=args.batch_sizes,
+        modes=args.modes,
+        warmup=args.warmup,
+        iterations=args.iterations,
+        dtypes=args.dtypes,
+    )
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "tensorflow": tf.__version__,
+            "keras_cv": keras_cv.__version__,
+            "runtime": RUNTIME._asdict(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for regression in regressions:
+            change = (
+                "now fails"
+                if regression["ratio"] is None
+                else f"x{regression['ratio']:.2f}"
+            )
+            print(
+                f"REGRESSION {format_result(regression)} "
+                f"(baseline p50 {regression['baseline_p50_ms']:.2f}ms, {change})"
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,9 @@
-import keras_cv
 import streamlit as st
 
 
 LAYERS_CONFIG = {
     "RandomShear": {
-        "layer_cls": keras_cv.layers.RandomShear,
+        "layer_cls": "RandomShear",
         "layer_args": {
             "x_factor": 0.0,
             "y_factor": 0.0,
@@ -20,9 +19,10 @@ LAYERS_CONFIG = {
             "fill_mode": ["reflect", "wrap", "constant", "nearest"],
             "bounding_box_format": ["xyxy", "xywh"],
         },
+        "dtypes": ("float32",),
     },
     "RandomCrop": {
-        "layer_cls": keras_cv.layers.RandomCrop,
+        "layer_cls": "RandomCrop",
         "layer_args": {
             "height": 150,
             "width": 150,
@@ -33,9 +33,11 @@ LAYERS_CONFIG = {
             "width": (10, 512),
             "bounding_box_format": ["xyxy", "xywh"],
         },
+        # crop_and_resize needs float32 boxes and images.
+        "dtypes": ("float32",),
     },
     "RandomRotation": {
-        "layer_cls": keras_cv.layers.RandomRotation,
+        "layer_cls": "RandomRotation",
         "layer_args": {
             "factor": 0.0,
             "fill_mode": "reflect",
@@ -48,9 +50,10 @@ LAYERS_CONFIG = {
             "interpolation": ["nearest", "bilinear"],
             "bounding_box_format": ["xyxy", "xywh"],
         },
+        "dtypes": ("float32",),
     },
     "RandomTranslation": {
-        "layer_cls": keras_cv.layers.RandomTranslation,
+        "layer_cls": "RandomTranslation",
         "layer_args": {
             "height_factor": 0.0,
             "width_factor": 0.0,
@@ -65,9 +68,10 @@ LAYERS_CONFIG = {
             "interpolation": ["nearest", "bilinear"],
             "bounding_box_format": ["xyxy", "xywh"],
         },
+        "dtypes": ("float32",),
     },
     "RandomFlip": {
-        "layer_cls": keras_cv.layers.RandomFlip,
+        "layer_cls": "RandomFlip",
         "layer_args": {
             "mode": "horizontal",
             "rate": 0.5,
@@ -77,9 +81,10 @@ LAYERS_CONFIG = {
             "mode": ["horizontal", "vertical"],
             "bounding_box_format": ["xyxy", "xywh"],
         },
+        "dtypes": ("float32", "float16", "bfloat16", "uint8"),
     },
     "RandAugment": {
-        "layer_cls": keras_cv.layers.RandAugment,
+        "layer_cls": "RandAugment",
         "layer_args": {
             "value_range": (0, 255),
             "augmentations_per_image": 2,
@@ -97,7 +102,7 @@ LAYERS_CONFIG = {
         },
     },
     "Resizing": {
-        "layer_cls": keras_cv.layers.Resizing,
+        "layer_cls": "Resizing",
         "layer_args": {
             "height": 150,
             "width": 150,
@@ -111,4 +116,15 @@ LAYERS_CONFIG = {
             "bounding_box_format": ["xyxy", "xywh"],
         },
     },
-}
\ No newline at end of file
+}
+
+
+# Ordered multi-layer presets for the pipeline builder. Each stage names a
+# LAYERS_CONFIG entry and overrides some of its default `layer_args`.
+PIPELINES_CONFIG = {
+    "Flip, Rotate, Translate": [
+        {"layer": "RandomFlip", "layer_args": {"mode": "horizontal"}},
+        {"layer": "RandomRotation", "layer_args": {"factor": 0.1}},
+        {"layer": "RandomTranslation", "layer_args": {"height_factor": 0.1, "width_factor": 0.1}},
+    ],
+}
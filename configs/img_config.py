@@ -1,17 +1,18 @@
-import keras_cv
 import streamlit as st
 
 
+# Optional "dtypes" list the execution dtypes a layer is offered in; the float
+# dtypes by default. `python parity.py` checks them against float32.
 LAYERS_CONFIG = {
     "AutoContrast": {
-        "layer_cls": keras_cv.layers.AutoContrast,
+        "layer_cls": "AutoContrast",
         "layer_args": {
             "value_range": (0, 255),
         },
         "control_args": {},
     },
     "AugMix": {
-        "layer_cls": keras_cv.layers.AugMix,
+        "layer_cls": "AugMix",
         "layer_args": {
             "value_range": (0, 255),
             "severity": [0.01, 0.3],
@@ -25,18 +26,20 @@ LAYERS_CONFIG = {
             "chain_depth": [1, 5],
             "alpha": [0.01, 2.0],
         },
+        "dtypes": ("float32",),
     },
     "ChannelShuffle": {
-        "layer_cls": keras_cv.layers.ChannelShuffle,
+        "layer_cls": "ChannelShuffle",
         "layer_args": {
             "groups": 3,
         },
         "control_args": {
             "groups": [1, 3],
         },
+        "dtypes": ("float32", "float16", "bfloat16", "uint8"),
     },
     "GridMask": {
-        "layer_cls": keras_cv.layers.GridMask,
+        "layer_cls": "GridMask",
         "layer_args": {
             "ratio_factor": (0.0, 0.5),
             "rotation_factor": (0.0, 0.0),
@@ -49,7 +52,7 @@ LAYERS_CONFIG = {
         },
     },
     "RandomChannelShift": {
-        "layer_cls": keras_cv.layers.RandomChannelShift,
+        "layer_cls": "RandomChannelShift",
         "layer_args": {
             "value_range": (0, 255),
             "factor": 0.0,
@@ -60,16 +63,18 @@ LAYERS_CONFIG = {
         },
     },
     "RandomColorDegeneration": {
-        "layer_cls": keras_cv.layers.RandomColorDegeneration,
+        "layer_cls": "RandomColorDegeneration",
         "layer_args": {
             "factor": 0.0,
         },
         "control_args": {
             "factor": [0.0, 1.0],
         },
+        # Blending with the grayscale image drifts by up to ~30 levels in float16.
+        "dtypes": ("float32",),
     },
     "RandomCutout": {
-        "layer_cls": keras_cv.layers.RandomCutout,
+        "layer_cls": "RandomCutout",
         "layer_args": {
             "height_factor": (0.5, 0.5),
             "width_factor": (0.5, 0.5),
@@ -83,7 +88,7 @@ LAYERS_CONFIG = {
         },
     },
     "RandomHue": {
-        "layer_cls": keras_cv.layers.RandomHue,
+        "layer_cls": "RandomHue",
         "layer_args": {
             "factor": 0.0,
             "value_range": (0, 255),
@@ -91,18 +96,22 @@ LAYERS_CONFIG = {
         "control_args": {
             "factor": [0.0, 1.0],
         },
+        # bfloat16 rounds the hue angle, shifting some pixels by ~10 levels.
+        "dtypes": ("float32", "float16"),
     },
     "RandomSaturation": {
-        "layer_cls": keras_cv.layers.RandomSaturation,
+        "layer_cls": "RandomSaturation",
         "layer_args": {
             "factor": 0.0,
         },
         "control_args": {
             "factor": [0.0, 1.0],
         },
+        # bfloat16 shifts strongly saturated pixels by up to ~10 levels.
+        "dtypes": ("float32", "float16"),
     },
     "RandomContrast": {
-        "layer_cls": keras_cv.layers.RandomContrast,
+        "layer_cls": "RandomContrast",
         "layer_args": {
             "value_range": (0, 255),
             "factor": 0.0,
@@ -110,9 +119,11 @@ LAYERS_CONFIG = {
         "control_args": {
             "factor": [0.0, 1.0],
         },
+        # The mean-centred rescale drifts by tens of levels in reduced precision.
+        "dtypes": ("float32",),
     },
     "RandomBrightness": {
-        "layer_cls": keras_cv.layers.RandomBrightness,
+        "layer_cls": "RandomBrightness",
         "layer_args": {
             "value_range": (0, 255),
             "factor": 0.0,
@@ -122,7 +133,7 @@ LAYERS_CONFIG = {
         },
     },
     "RandomSharpness": {
-        "layer_cls": keras_cv.layers.RandomSharpness,
+        "layer_cls": "RandomSharpness",
         "layer_args": {
             "value_range": (0, 255),
             "factor": 0.0,
@@ -130,9 +141,11 @@ LAYERS_CONFIG = {
         "control_args": {
             "factor": (0.0, 1.0),
         },
+        # The blur kernel drifts by up to ~25 levels in float16 and bfloat16.
+        "dtypes": ("float32",),
     },
     "RandomShear": {
-        "layer_cls": keras_cv.layers.RandomShear,
+        "layer_cls": "RandomShear",
         "layer_args": {
             "x_factor": 0.0,
             "y_factor": 0.0,
@@ -148,7 +161,7 @@ LAYERS_CONFIG = {
         },
     },
     "RandomCrop": {
-        "layer_cls": keras_cv.layers.RandomCrop,
+        "layer_cls": "RandomCrop",
         "layer_args": {
             "height": 150,
             "width": 150,
@@ -157,9 +170,11 @@ LAYERS_CONFIG = {
             "height": (10, 512),
             "width": (10, 512),
         },
+        # crop_and_resize needs float32 boxes and images.
+        "dtypes": ("float32",),
     },
     "RandomRotation": {
-        "layer_cls": keras_cv.layers.RandomRotation,
+        "layer_cls": "RandomRotation",
         "layer_args": {
             "factor": 0.0,
             "fill_mode": "reflect",
@@ -172,7 +187,7 @@ LAYERS_CONFIG = {
         },
     },
     "RandomTranslation": {
-        "layer_cls": keras_cv.layers.RandomTranslation,
+        "layer_cls": "RandomTranslation",
         "layer_args": {
             "height_factor": 0.0,
             "width_factor": 0.0,
@@ -187,7 +202,7 @@ LAYERS_CONFIG = {
         },
     },
     "RandomFlip": {
-        "layer_cls": keras_cv.layers.RandomFlip,
+        "layer_cls": "RandomFlip",
         "layer_args": {
             "mode": "horizontal",
             "rate": 0.5,
@@ -195,9 +210,10 @@ LAYERS_CONFIG = {
         "control_args": {
             "mode": ["horizontal", "vertical"],
         },
+        "dtypes": ("float32", "float16", "bfloat16", "uint8"),
     },
     "Solarization": {
-        "layer_cls": keras_cv.layers.Solarization,
+        "layer_cls": "Solarization",
         "layer_args": {
             "value_range": (0, 255),
             "addition_factor": 0.0,
@@ -209,7 +225,7 @@ LAYERS_CONFIG = {
         },
     },
     "RandAugment": {
-        "layer_cls": keras_cv.layers.RandAugment,
+        "layer_cls": "RandAugment",
         "layer_args": {
             "value_range": (0, 255),
             "augmentations_per_image": 2,
@@ -225,7 +241,7 @@ LAYERS_CONFIG = {
         },
     },
     "Resizing": {
-        "layer_cls": keras_cv.layers.Resizing,
+        "layer_cls": "Resizing",
         "layer_args": {
             "height": 150,
             "width": 150,
@@ -238,14 +254,15 @@ LAYERS_CONFIG = {
         },
     },
     "Grayscale": {
-        "layer_cls": keras_cv.layers.Grayscale,
+        "layer_cls": "Grayscale",
         "layer_args": {
             "output_channels": 1,
         },
         "control_args": {},
+        "dtypes": ("float32", "float16", "bfloat16", "uint8"),
     },
     "Equalization": {
-        "layer_cls": keras_cv.layers.Equalization,
+        "layer_cls": "Equalization",
         "layer_args": {
             "value_range": (0, 255),
             "bins": 0,
@@ -254,4 +271,20 @@ LAYERS_CONFIG = {
             "bins": [0, 255]
         },
     },
-}
\ No newline at end of file
+}
+
+
+# Ordered multi-layer presets for the pipeline builder. Each stage names a
+# LAYERS_CONFIG entry and overrides some of its default `layer_args`.
+PIPELINES_CONFIG = {
+    "Flip, Rotate, Hue": [
+        {"layer": "RandomFlip", "layer_args": {"mode": "horizontal"}},
+        {"layer": "RandomRotation", "layer_args": {"factor": 0.15}},
+        {"layer": "RandomHue", "layer_args": {"factor": 0.3}},
+    ],
+    "Color jitter": [
+        {"layer": "RandomBrightness", "layer_args": {"factor": 0.2}},
+        {"layer": "RandomContrast", "layer_args": {"factor": 0.2}},
+        {"layer": "RandomSaturation", "layer_args": {"factor": 0.5}},
+    ],
+}
@@ -1,10 +1,9 @@
-import keras_cv
 import streamlit as st
 
 
 LAYERS_CONFIG = {
     "RandomFlip": {
-        "layer_cls": keras_cv.layers.RandomFlip,
+        "layer_cls": "RandomFlip",
         "layer_args": {
             "mode": "horizontal",
             "rate": 0.5,
@@ -12,5 +11,15 @@ LAYERS_CONFIG = {
         "control_args": {
             "mode": ["horizontal", "vertical"],
         },
+        "dtypes": ("float32", "float16", "bfloat16", "uint8"),
     },
-}
\ No newline at end of file
+}
+
+
+# Ordered multi-layer presets for the pipeline builder. Each stage names a
+# LAYERS_CONFIG entry and overrides some of its default `layer_args`.
+PIPELINES_CONFIG = {
+    "Flip": [
+        {"layer": "RandomFlip", "layer_args": {"mode": "horizontal"}},
+    ],
+}
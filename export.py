@@ -0,0 +1,130 @@
+"""Export K augmentations per sample to sharded TFRecord files.
+
+Example:
+    python export.py --task image --layer RandomFlip --input images/ \
+        --output export/ --copies 4 --num-shards 8
+    python export.py --task bbox --pipeline "Flip, Rotate, Translate" \
+        --annotations instances.json --images-dir images/ --output export/
+"""
+import argparse
+import json
+
+from utils.annotation_utils import load_annotations
+from utils.box_utils import BOX_FORMATS
+from utils.catalog_utils import find_masks, list_image_files
+from utils.export_utils import (
+    EXPORT_FORMATS,
+    export_tfrecords,
+    samples_from_annotations,
+    samples_from_files,
+)
+from utils.layer_utils import TASK_CONFIGS, get_layer_from_config
+from utils.lazy_utils import tf
+from utils.precision_utils import DEFAULT_DTYPE, EXECUTION_DTYPES
+from utils.pipeline_utils import get_preset_pipeline
+from utils.runtime_utils import apply_runtime_config
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--task", choices=list(TASK_CONFIGS), default="image")
+    layer = parser.add_mutually_exclusive_group(required=True)
+    layer.add_argument("--layer", help="Layer name from the task's LAYERS_CONFIG.")
+    layer.add_argument("--pipeline", help="Preset name from PIPELINES_CONFIG.")
+    parser.add_argument(
+        "--args",
+        default="{}",
+        help="JSON object overriding the layer's default layer_args.",
+    )
+    parser.add_argument(
+        "--input",
+        nargs="+",
+        help="Image directories, image files or .txt files listing image paths.",
+    )
+    parser.add_argument(
+        "--masks",
+        help="Directory of segmentation masks named like the images (seg task).",
+    )
+    parser.add_argument(
+        "--annotations", help="COCO JSON file or VOC XML directory (bbox task)."
+    )
+    parser.add_argument(
+        "--images-dir", help="Directory of the images named in --annotations."
+    )
+    parser.add_argument("--output", required=True, help="Output directory.")
+    parser.add_argument("--copies", type=int, default=4)
+    parser.add_argument("--num-shards", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--dtype",
+        choices=EXECUTION_DTYPES,
+        default=DEFAULT_DTYPE,
+        help="Execution dtype; must be one the layer's config offers.",
+    )
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="jpeg")
+    parser.add_argument("--box-format", choices=BOX_FORMATS, default="xywh")
+    args = parser.parse_args(argv)
+    if args.pipeline and args.args != "{}":
+        parser.error("--args only applies to --layer")
+    if args.annotations and not args.images_dir:
+        parser.error("--annotations requires --images-dir")
+    if not args.annotations and not args.input:
+        parser.error("either --input or --annotations is required")
+    return args
+
+
+def print_progress(done: int, total: int):
+    if done % 100 == 0 or done == total:
+        print(f"{done}/{total} samples", flush=True)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    apply_runtime_config(tf)
+    overrides = json.loads(args.args)
+    # Boxes are fed to and stored from the layer in the exported format.
+    fixed_args = {"bounding_box_format": args.box_format} if args.task == "bbox" else {}
+    if args.pipeline:
+        layer = get_preset_pipeline(
+            args.task, args.pipeline, fixed_args=fixed_args, dtype=args.dtype
+        )
+    else:
+        overrides.update(fixed_args)
+        layer = get_layer_from_config(
+            args.task, args.layer, overrides, dtype=args.dtype
+        )
+
+    if args.annotations:
+        samples = samples_from_annotations(
+            load_annotations(args.annotations), args.images_dir
+        )
+    else:
+        image_paths = list_image_files(args.input)
+        mask_paths = find_masks(image_paths, args.masks) if args.masks else None
+        samples = samples_from_files(image_paths, mask_paths)
+
+    manifest = export_tfrecords(
+        layer,
+        samples,
+        args.output,
+        copies=args.copies,
+        num_shards=args.num_shards,
+        num_writers=args.workers,
+        image_format=args.format,
+        bounding_box_format=args.box_format,
+        metadata={
+            "task": args.task,
+            "pipeline": args.pipeline,
+            "dtype": args.dtype,
+            "layer_args": overrides,
+        },
+        progress=print_progress,
+    )
+    print(
+        f"Wrote {manifest['records']} records to {len(manifest['shards'])} shards "
+        f"in {manifest['seconds']:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Compare every LAYERS_CONFIG layer in each execution dtype against float32.
+
+With --fast, compare the NumPy/OpenCV fast path against keras_cv instead;
+with --compiled, compare compiled layers against eager ones.
+
+Example:
+    python parity.py --tasks image --dtypes float16 bfloat16 uint8
+    python parity.py --all --output parity.json
+    python parity.py --fast --samples 512
+    python parity.py --compiled
+"""
+import argparse
+import json
+import sys
+import typing
+
+from utils.layer_utils import TASK_CONFIGS
+from utils.parity_utils import (
+    COMPILED_PARITY_CASES,
+    FAST_PARITY_CASES,
+    compiled_parity_report,
+    fast_parity_report,
+    format_compiled_parity,
+    format_fast_parity,
+    format_parity,
+    parity_report,
+)
+from utils.precision_utils import EXECUTION_DTYPES, supported_dtypes
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--tasks", nargs="+", choices=list(TASK_CONFIGS), default=list(TASK_CONFIGS)
+    )
+    parser.add_argument("--layers", nargs="+", help="Only check these layers.")
+    parser.add_argument(
+        "--dtypes", nargs="+", choices=EXECUTION_DTYPES, default=list(EXECUTION_DTYPES)
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Also check dtypes a layer's config does not offer, e.g. to find "
+        "layers that could be offered in uint8.",
+    )
+    parser.add_argument("--resolution", type=int, nargs=2, default=[256, 256])
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.0,
+        help="Largest mean absolute difference, in uint8 pixel levels.",
+    )
+    parser.add_argument(
+        "--p99-tolerance",
+        type=int,
+        default=2,
+        help="Largest difference of 99%% of the pixels, in uint8 pixel levels.",
+    )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="Check the NumPy/OpenCV fast path of the image layers instead.",
+    )
+    parser.add_argument(
+        "--compiled",
+        action="store_true",
+        help="Check that compiled layers match eager ones at a non-bucket size.",
+    )
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=256,
+        help="Samples per random fast-path case.",
+    )
+    parser.add_argument("--output", help="Write the report to this JSON file.")
+    return parser.parse_args(argv)
+
+
+def check_fast_path(args) -> typing.List[typing.Dict]:
+    report = []
+    for layer_name in FAST_PARITY_CASES:
+        if args.layers and layer_name not in args.layers:
+            continue
+        for result in fast_parity_report(
+            layer_name, samples=args.samples, seed=args.seed
+        ):
+            print(format_fast_parity(result))
+            report.append(result)
+    return report
+
+
+def check_compiled(args) -> typing.List[typing.Dict]:
+    report = []
+    for task in args.tasks:
+        for layer_name in COMPILED_PARITY_CASES.get(task, {}):
+            if args.layers and layer_name not in args.layers:
+                continue
+            result = compiled_parity_report(task, layer_name)
+            print(format_compiled_parity(result))
+            report.append(result)
+    return report
+
+
+def check_dtypes(args) -> typing.List[typing.Dict]:
+    height, width = args.resolution
+    report = []
+    for task in args.tasks:
+        for layer_name, layer_config in TASK_CONFIGS[task].items():
+            if args.layers and layer_name not in args.layers:
+                continue
+            dtypes = [
+                dtype
+                for dtype in args.dtypes
+                if args.all or dtype in supported_dtypes(layer_config)
+            ]
+            try:
+                results = parity_report(
+                    task,
+                    layer_name,
+                    dtypes,
+                    height=height,
+                    width=width,
+                    batch_size=args.batch_size,
+                    seed=args.seed,
+                    tolerance=args.tolerance,
+                    p99_tolerance=args.p99_tolerance,
+                )
+            except Exception as e:
+                # The float32 reference itself failed.
+                error = f"{type(e).__name__}: {e}".splitlines()[0]
+                print(f"{task}/{layer_name}: {error}")
+                continue
+            for result in results:
+                print(format_parity(result))
+            report += results
+    return report
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.fast:
+        report = check_fast_path(args)
+    elif args.compiled:
+        report = check_compiled(args)
+    else:
+        report = check_dtypes(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    # Offered dtypes or fast-path layers that fail parity are bugs.
+    if any(result.get("supported", True) and not result["valid"] for result in report):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Serve the demo's image, bbox and segmentation layers over HTTP.
+
+Concurrent requests for the same layer, args, dtype and shape bucket are
+micro-batched into single layer calls.
+
+Example:
+    python serve.py --port 8600 --max-batch-size 16 --max-wait-ms 5
+    curl -s localhost:8600/metrics
+
+    POST /augment/image  {"layer": "RandomFlip", "args": {}, "image": "<base64>"}
+    POST /augment/bbox   {..., "boxes": [[x, y, w, h]], "classes": [0],
+                          "box_format": "xywh"}
+    POST /augment/seg    {..., "mask": "<base64 PNG>"}
+"""
+import argparse
+
+from utils.lazy_utils import keras_cv, tf
+from utils.runtime_utils import apply_runtime_config
+from utils.service_utils import (
+    AugmentationHandler,
+    AugmentationServer,
+    AugmentationService,
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=5.0,
+        help="How long the first request of a batch waits for others to join.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Batches run concurrently; with one, requests queue into larger "
+        "batches while a batch runs.",
+    )
+    parser.add_argument("--max-queue-depth", type=int, default=1024)
+    parser.add_argument(
+        "--no-pad-buckets",
+        action="store_true",
+        help="Only batch images of exactly the same size, also for pointwise "
+        "layers.",
+    )
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--verbose", action="store_true", help="Log every request.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    apply_runtime_config(tf)
+    keras_cv.load()
+    service = AugmentationService(
+        max_batch_size=args.max_batch_size,
+        max_wait=args.max_wait_ms / 1000,
+        workers=args.workers,
+        max_queue_depth=args.max_queue_depth,
+        pad_buckets=not args.no_pad_buckets,
+        timeout=args.timeout,
+    )
+    AugmentationHandler.verbose = args.verbose
+    server = AugmentationServer((args.host, args.port), service)
+    print(f"Serving on http://{args.host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
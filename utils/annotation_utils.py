@@ -0,0 +1,310 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import typing
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from utils.box_utils import BoxStore
+
+
+INDEX_VERSION = 1
+
+
+def iter_json_array(path: str, key: str, chunk_size: int = 1 << 20):
+    """Yield the elements of the top-level array `key` of a large JSON file
+    one at a time, reading the file in chunks instead of parsing it whole.
+    """
+    decoder = json.JSONDecoder()
+    start_pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    with open(path, encoding="utf-8") as f:
+        buffer = ""
+        # Find the start of the array.
+        while True:
+            match = start_pattern.search(buffer)
+            if match:
+                buffer = buffer[match.end() :]
+                break
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            # Keep a tail in case the key is split across chunks.
+            buffer = buffer[-len(key) - 16 :] + chunk
+
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer) and buffer[position] == "]":
+                return
+            try:
+                if position >= len(buffer):
+                    raise ValueError("need more data")
+                element, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise ValueError(f"Truncated JSON array {key!r} in {path!r}")
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield element
+
+
+class _ColumnBuilder:
+    """Accumulate annotation rows in preallocated, geometrically grown
+    arrays rather than Python lists of per-box objects.
+    """
+
+    def __init__(self, capacity: int = 4096):
+        self.image_ids = np.zeros(capacity, dtype=np.int64)
+        self.boxes = np.zeros((capacity, 4), dtype=np.float32)
+        self.classes = np.zeros(capacity, dtype=np.int32)
+        self.count = 0
+
+    def append(self, image_id, box, class_id):
+        if self.count == len(self.image_ids):
+            capacity = 2 * len(self.image_ids)
+            self.image_ids = np.resize(self.image_ids, capacity)
+            self.boxes = np.resize(self.boxes, (capacity, 4))
+            self.classes = np.resize(self.classes, capacity)
+        self.image_ids[self.count] = image_id
+        self.boxes[self.count] = box
+        self.classes[self.count] = class_id
+        self.count += 1
+
+    def save(self, index_dir: str, image_ids: np.ndarray):
+        """Write boxes grouped by image together with per-image offsets, so
+        the boxes of any image are a single contiguous slice.
+        """
+        order = np.argsort(self.image_ids[: self.count], kind="stable")
+        sorted_ids = self.image_ids[: self.count][order]
+        offsets = np.searchsorted(sorted_ids, image_ids, side="left")
+        ends = np.searchsorted(sorted_ids, image_ids, side="right")
+        np.save(os.path.join(index_dir, "boxes.npy"), self.boxes[: self.count][order])
+        np.save(os.path.join(index_dir, "classes.npy"), self.classes[: self.count][order])
+        np.save(os.path.join(index_dir, "image_ids.npy"), image_ids)
+        np.save(
+            os.path.join(index_dir, "offsets.npy"),
+            np.stack([offsets, ends], axis=1).astype(np.int64),
+        )
+
+
+def _source_signature(path: str) -> typing.Dict:
+    if os.path.isdir(path):
+        # The directory's own mtime changes when XML files are added, removed
+        # or saved by rename; the newest file mtime catches in-place edits.
+        mtimes = [
+            entry.stat().st_mtime_ns
+            for entry in os.scandir(path)
+            if entry.name.endswith(".xml")
+        ]
+        return {
+            "files": len(mtimes),
+            "mtime_ns": os.stat(path).st_mtime_ns,
+            "newest_ns": max(mtimes, default=0),
+        }
+    stat = os.stat(path)
+    return {"files": 1, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _write_meta(index_dir, source, annotation_format, images, categories):
+    with open(os.path.join(index_dir, "images.json"), "w") as f:
+        json.dump(images, f)
+    meta = {
+        "version": INDEX_VERSION,
+        "source": os.path.abspath(source),
+        "format": annotation_format,
+        "signature": _source_signature(source),
+        "categories": categories,
+    }
+    # Written last: its presence marks a complete index.
+    with open(os.path.join(index_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def _replace_index(build: typing.Callable, source: str, index_dir: str):
+    """Run `build(source, tmp_dir)` on a temporary sibling of `index_dir` and
+    swap the result into place, so readers never see a partly written index.
+    """
+    parent, name = os.path.split(os.path.abspath(index_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix=f".{name}.")
+    try:
+        # mkdtemp creates the directory private to this user.
+        os.chmod(tmp_dir, 0o755)
+        build(source, tmp_dir)
+        if os.path.exists(index_dir):
+            # A non-empty directory cannot be replaced in one step: move the
+            # old index aside first and delete it once the new one is in place.
+            old_dir = tempfile.mkdtemp(dir=parent, prefix=f".{name}.old.")
+            os.replace(index_dir, os.path.join(old_dir, name))
+            os.replace(tmp_dir, index_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        else:
+            os.replace(tmp_dir, index_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def build_coco_index(annotation_file: str, index_dir: str):
+    _replace_index(_build_coco_index, annotation_file, index_dir)
+
+
+def _build_coco_index(annotation_file: str, index_dir: str):
+    categories = {
+        category["id"]: category["name"]
+        for category in iter_json_array(annotation_file, "categories")
+    }
+    images = [
+        {
+            "id": image["id"],
+            "file_name": image["file_name"],
+            "width": image.get("width"),
+            "height": image.get("height"),
+        }
+        for image in iter_json_array(annotation_file, "images")
+    ]
+    columns = _ColumnBuilder()
+    for annotation in iter_json_array(annotation_file, "annotations"):
+        if "bbox" in annotation:
+            columns.append(
+                annotation["image_id"], annotation["bbox"], annotation["category_id"]
+            )
+    columns.save(index_dir, np.array([image["id"] for image in images], dtype=np.int64))
+    _write_meta(
+        index_dir,
+        annotation_file,
+        "coco",
+        images,
+        {str(key): value for key, value in categories.items()},
+    )
+
+
+def build_voc_index(xml_dir: str, index_dir: str):
+    _replace_index(_build_voc_index, xml_dir, index_dir)
+
+
+def _build_voc_index(xml_dir: str, index_dir: str):
+    class_ids = {}
+    images = []
+    columns = _ColumnBuilder()
+    for image_id, name in enumerate(
+        sorted(name for name in os.listdir(xml_dir) if name.endswith(".xml"))
+    ):
+        root = ET.parse(os.path.join(xml_dir, name)).getroot()
+        size = root.find("size")
+        images.append(
+            {
+                "id": image_id,
+                "file_name": root.findtext("filename"),
+                "width": int(size.findtext("width")) if size is not None else None,
+                "height": int(size.findtext("height")) if size is not None else None,
+            }
+        )
+        for obj in root.iter("object"):
+            box = obj.find("bndbox")
+            x1, y1, x2, y2 = (
+                float(box.findtext(tag)) for tag in ("xmin", "ymin", "xmax", "ymax")
+            )
+            class_id = class_ids.setdefault(obj.findtext("name"), len(class_ids))
+            columns.append(image_id, (x1, y1, x2 - x1, y2 - y1), class_id)
+    columns.save(index_dir, np.arange(len(images), dtype=np.int64))
+    _write_meta(
+        index_dir,
+        xml_dir,
+        "voc",
+        images,
+        {str(class_id): name for name, class_id in class_ids.items()},
+    )
+
+
+class AnnotationIndex:
+    """Read side of an on-disk annotation index.
+
+    Box arrays are memory-mapped, and every image's boxes are one contiguous
+    slice located through a per-image offset table, so looking up an image
+    never re-parses the annotation file.
+    """
+
+    def __init__(self, index_dir: str, attempts: int = 3):
+        for attempt in range(attempts):
+            # A rebuild swaps in a new directory; reload if that happened
+            # while the files were being opened, so they all come from one.
+            try:
+                inode = os.stat(index_dir).st_ino
+                self._load(index_dir)
+                if os.stat(index_dir).st_ino == inode:
+                    return
+            except FileNotFoundError:
+                if attempt == attempts - 1:
+                    raise
+        raise RuntimeError(f"{index_dir} kept changing while it was opened")
+
+    def _load(self, index_dir: str):
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            self.meta = json.load(f)
+        with open(os.path.join(index_dir, "images.json")) as f:
+            self.images = json.load(f)
+        self.categories = {int(key): value for key, value in self.meta["categories"].items()}
+        self._boxes = np.load(os.path.join(index_dir, "boxes.npy"), mmap_mode="r")
+        self._classes = np.load(os.path.join(index_dir, "classes.npy"), mmap_mode="r")
+        self._offsets = np.load(os.path.join(index_dir, "offsets.npy"), mmap_mode="r")
+        self._positions = {image["id"]: index for index, image in enumerate(self.images)}
+
+    def __len__(self):
+        return len(self.images)
+
+    def image_info(self, position: int) -> typing.Dict:
+        return self.images[position]
+
+    def boxes(self, image_id) -> BoxStore:
+        """Boxes of `image_id` in xywh format with their class ids."""
+        start, end = self._offsets[self._positions[image_id]]
+        return BoxStore.from_arrays(
+            np.array(self._boxes[start:end]),
+            np.array(self._classes[start:end]),
+            box_format="xywh",
+        )
+
+
+def _index_is_current(index_dir: str, source: str) -> bool:
+    meta_path = os.path.join(index_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return (
+        meta.get("version") == INDEX_VERSION
+        and meta.get("signature") == _source_signature(source)
+    )
+
+
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def load_annotations(source: str, index_dir: typing.Optional[str] = None) -> AnnotationIndex:
+    """Open the index for a COCO JSON file or a Pascal VOC XML directory,
+    (re)building it on disk first if it is missing or older than the source.
+    Opened indexes are shared by all sessions of the process.
+    """
+    source = os.path.abspath(source)
+    index_dir = index_dir or source.rstrip(os.sep) + ".index"
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(index_dir)
+        if index is not None and _index_is_current(index_dir, source):
+            return index
+        if not _index_is_current(index_dir, source):
+            if os.path.isdir(source):
+                build_voc_index(source, index_dir)
+            else:
+                build_coco_index(source, index_dir)
+        index = AnnotationIndex(index_dir)
+        _INDEXES[index_dir] = index
+        return index
@@ -1,20 +1,45 @@
-import io
-import os
 import cv2
+import os
 import typing
 
 import numpy as np
 import pandas as pd
 import streamlit as st
-import tensorflow as tf
-from keras_cv.visualization import draw_bounding_boxes
-from PIL import Image
-
-from configs.bbox_config import LAYERS_CONFIG
 
-
-def download_images_bbox():
-    root_dir = "images/"
+from configs.bbox_config import LAYERS_CONFIG, PIPELINES_CONFIG
+from utils.annotation_utils import load_annotations
+from utils.box_utils import BoxStore, convert_boxes, pad_batch
+from utils.cache_utils import LRUCache
+from utils.catalog_utils import get_catalog
+from utils.decode_utils import content_hash, decode_file, decode_image
+from utils.display_utils import make_grid, resize_to_max_side, show_image
+from utils.layer_utils import get_layer, get_seeded_layer
+from utils.lazy_utils import keras_cv, tf, wait_for
+from utils.pipeline_utils import select_pipeline
+from utils.precision_utils import (
+    round_to_uint8,
+    select_dtype,
+    supported_dtypes,
+    to_layer_input,
+)
+from utils.result_cache_utils import cached_result, select_seed
+from utils.timing_utils import TIMINGS
+from utils.worker_utils import Job, job_token, render_job
+
+
+IMAGE_FOLDER = "images/"
+BOX_COLOR = (0, 224, 0)
+
+# Input images with their boxes drawn, keyed by image and box table contents.
+OVERLAY_CACHE = LRUCache(
+    max_entries=16, max_bytes=128 * 1024 * 1024, sizeof=lambda array: array.nbytes
+)
+
+
+def default_images_bbox():
+    """Annotations for the bundled images. Pixel data is not read here; it is
+    loaded lazily from the image catalog once an image is selected.
+    """
     default_images = {}
 
     image_data = {
@@ -45,21 +70,21 @@ def download_images_bbox():
     }
 
     for image_name, image_info in image_data.items():
-        image_path = os.path.join(root_dir, image_info["filename"])
-        with open(image_path, "rb") as f:
-            image_content = f.read()
-
-        boxes_df = pd.DataFrame(image_info["boxes"])
+        boxes_df = pd.DataFrame(image_info["boxes"]).astype(np.float32)
+        boxes_df["class"] = 0
 
         default_images[image_name] = {
-            "image": image_content,
+            "filename": image_info["filename"],
             "boxes": boxes_df,
         }
 
     return default_images
 
 
-def image_dropdown(image_dict=download_images_bbox()):
+def image_dropdown(image_dict=None):
+    if image_dict is None:
+        image_dict = default_images_bbox()
+
     st.subheader("Select an Image")
     image_option = st.selectbox(
         "Select an option",
@@ -75,28 +100,71 @@ def image_dropdown(image_dict=download_images_bbox()):
             label_visibility="collapsed",
         )
 
-    if uploaded_image is not None:
+    with st.expander("Load annotations (COCO / VOC)"):
+        annotation_path = st.text_input(
+            "COCO JSON file or VOC XML directory", key="annotation_path"
+        )
+        annotation_images = st.text_input("Images directory", key="annotation_images")
+        annotated = None
+        if annotation_path and annotation_images:
+            try:
+                with TIMINGS.stage("bbox", "annotation_index"):
+                    index = load_annotations(annotation_path)
+            except (OSError, ValueError) as error:
+                st.error(f"Could not load annotations: {error}")
+            else:
+                position = st.number_input(
+                    f"Image (0 - {len(index) - 1})",
+                    min_value=0,
+                    max_value=max(len(index) - 1, 0),
+                    value=0,
+                    key="annotation_position",
+                )
+                if len(index):
+                    annotated = index.image_info(position)
+                    st.caption(annotated["file_name"])
+
+    if annotated is not None:
+        image_path = os.path.join(annotation_images, annotated["file_name"])
+        try:
+            with TIMINGS.stage("bbox", "decode") as timing:
+                image = decode_file(image_path)
+                timing.image = image
+        except OSError as error:
+            # E.g. the annotations list an image missing from the directory.
+            st.error(f"Could not read {image_path}: {error}")
+            st.stop()
+        box_store = index.boxes(annotated["id"])
+        boxes = pd.DataFrame(box_store.boxes, columns=["x", "y", "w", "h"])
+        boxes["class"] = box_store.classes
+    elif uploaded_image is not None:
         st.subheader("Select BBox Type")
         options = st.selectbox(
             "Select an option",
             ["xywh", "xyxy"],
             index=0,
         )
-        image = Image.open(uploaded_image).convert("RGB")
+        with TIMINGS.stage("bbox", "decode") as timing:
+            image = decode_image(uploaded_image)
+            timing.image = image
 
         if options == "xywh":
             boxes = pd.DataFrame({"x": [0], "y": [0], "w": [0], "h": [0]})
         elif options == "xyxy":
             boxes = pd.DataFrame({"x": [0], "y": [0], " x": [0], " y": [0]})
+        boxes = boxes.astype(np.float32)
+        boxes["class"] = 0
     else:
         image_data = image_dict[image_option]
-        image = Image.open(io.BytesIO(image_data["image"])).convert("RGB")
+        with TIMINGS.stage("bbox", "decode") as timing:
+            image = get_catalog(IMAGE_FOLDER).load_image(image_data["filename"])
+            timing.image = image
         boxes = image_data["boxes"]
 
-    return np.array(image), boxes
+    return image, boxes
 
 
-def Preprocessing(layer, image, box_format="xywh", boxes=None):
+def Preprocessing(layer, image, box_format="xywh", boxes=None, num_samples=1):
     """
     bounding_boxes = {
         # num_boxes may be a Ragged dimension
@@ -107,43 +175,156 @@ def Preprocessing(layer, image, box_format="xywh", boxes=None):
     Input Format : {"images": tf.cast(image, tf.float32),
                     "bounding_boxes": bounding_boxes}
 
+    `boxes` may be a `BoxStore` (carrying real class ids) or an `(N, 4)` array.
+    With `num_samples > 1` the inputs are tiled into a batch and augmented
+    in a single layer call; the input overlay is still drawn only once.
+
+    Results of seeded layers are cached.
+
     Reference : https://keras.io/guides/keras_cv/object_detection_keras_cv/
     """
-    image = image.copy()
-    inputs = {
-        "images": tf.expand_dims(tf.convert_to_tensor(image, dtype=tf.float32), axis=0)
-    }
+    if boxes is not None and not isinstance(boxes, BoxStore):
+        boxes = BoxStore.from_arrays(boxes, box_format=box_format)
+    return cached_result(
+        "bbox",
+        layer,
+        lambda: _preprocessing(layer, image, box_format, boxes, num_samples),
+        image,
+        box_format,
+        boxes.boxes if boxes is not None else None,
+        boxes.classes if boxes is not None else None,
+        num_samples,
+    )
+
 
-    if boxes is not None:
-        boxes = tf.expand_dims(tf.convert_to_tensor(boxes, dtype=tf.float32), axis=0)
-        inputs["bounding_boxes"] = {
-            "boxes": boxes,
-            "classes": tf.zeros(shape=boxes.shape[:-1]),
+def _preprocessing(layer, image, box_format, boxes, num_samples):
+
+    with TIMINGS.stage("bbox", "to_tensor", layer, image):
+        inputs = {
+            "images": tf.expand_dims(to_layer_input(image, layer), axis=0)
         }
 
-    bounding_boxes = inputs.get("bounding_boxes", {}).copy()
-    input_image = draw_bounding_boxes(
-        inputs["images"],
-        bounding_boxes,
-        color=(0, 224, 0),
-        bounding_box_format=box_format,
-    )
+        if boxes is not None:
+            inputs["bounding_boxes"] = tf.nest.map_structure(
+                tf.convert_to_tensor, pad_batch([boxes])
+            )
 
-    outputs = layer(inputs)
-    if "bounding_boxes" in outputs:
-        output_image = draw_bounding_boxes(
-            outputs["images"],
-            outputs["bounding_boxes"],
-            color=(0, 224, 0),
-            bounding_box_format=box_format,
+    with TIMINGS.stage("bbox", "draw_input", layer, image):
+        input_image = draw_input_overlay(image, boxes, box_format)
+
+    if num_samples > 1:
+        inputs = tf.nest.map_structure(
+            lambda tensor: tf.repeat(tensor, num_samples, axis=0), inputs
         )
-    else:
-        output_image = np.array(outputs["images"]).astype(np.uint8)
+
+    with TIMINGS.stage("bbox", "layer", layer, image):
+        outputs = layer(inputs)
+    with TIMINGS.stage("bbox", "draw_output", layer, image):
+        output_images = round_to_uint8(outputs["images"])
+        if "bounding_boxes" in outputs:
+            output_boxes, output_classes = _dense_boxes(outputs["bounding_boxes"])
+            output_image = draw_boxes(
+                output_images,
+                output_boxes,
+                output_classes,
+                box_format=box_format,
+            )
+        else:
+            output_image = np.array(output_images)
     return input_image, output_image
 
 
+def _dense_boxes(bounding_boxes):
+    """Boxes and classes of a (possibly ragged) keras_cv box dict as dense
+    numpy arrays, padded with class -1.
+    """
+    boxes, classes = bounding_boxes["boxes"], bounding_boxes["classes"]
+    if isinstance(boxes, tf.RaggedTensor):
+        boxes = boxes.to_tensor(default_value=-1)
+        classes = classes.to_tensor(default_value=-1)
+    return np.asarray(boxes), np.asarray(classes)
+
+
+def _to_uint8_batch(images):
+    images = np.asarray(images)
+    if images.dtype != np.uint8:
+        images = np.clip(np.rint(images), 0, 255).astype(np.uint8)
+    else:
+        images = images.copy()
+    if images.shape[-1] == 1:
+        images = np.repeat(images, 3, axis=-1)
+    return np.ascontiguousarray(images)
+
+
+def draw_boxes(
+    images,
+    boxes,
+    classes=None,
+    box_format="xywh",
+    color=BOX_COLOR,
+    thickness=2,
+):
+    """Draw a batch of boxes with cv2 straight into a uint8 copy of `images`.
+
+    `boxes` has shape (batch, num_boxes, 4) in `box_format`; boxes whose class
+    is -1 are padding and are skipped.
+    """
+    canvas = _to_uint8_batch(images)
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(len(canvas), -1, 4)
+    if classes is None:
+        valid = np.ones(boxes.shape[:2], dtype=bool)
+    else:
+        valid = np.asarray(classes).reshape(boxes.shape[:2]) != -1
+    boxes = convert_boxes(boxes, box_format, "xyxy", image_shape=canvas.shape[1:])
+    boxes = np.rint(boxes).astype(np.int32)
+    for image, image_boxes, image_valid in zip(canvas, boxes, valid):
+        for x1, y1, x2, y2 in image_boxes[image_valid].tolist():
+            cv2.rectangle(image, (x1, y1), (x2, y2), color, thickness)
+    return canvas
+
+
+def draw_input_overlay(image, boxes, box_format="xywh"):
+    """Draw `boxes` on the unaugmented `image`, reusing the previous drawing
+    when neither the image nor the box table changed.
+    """
+    if boxes is None:
+        return _to_uint8_batch(image[np.newaxis])
+    key = (
+        content_hash(np.ascontiguousarray(image)),
+        image.shape,
+        content_hash(np.ascontiguousarray(boxes.boxes)),
+        len(boxes),
+        box_format,
+    )
+
+    def draw():
+        overlay = draw_boxes(
+            image[np.newaxis], boxes.boxes[np.newaxis], box_format=box_format
+        )
+        overlay.flags.writeable = False
+        return overlay
+
+    return OVERLAY_CACHE.get_or_create(key, draw)
+
+
 def select_layer_bbox_aug():
     st.subheader("Select a Layer")
+    wait_for(keras_cv)
+    mode = st.radio(
+        "Mode", ["Single layer", "Pipeline"], horizontal=True, key="layer_mode"
+    )
+    if mode == "Pipeline":
+        box_format = st.selectbox(
+            "bounding_box_format", ["xywh", "xyxy"], key="pipeline_box_format"
+        )
+        layer = select_pipeline(
+            "bbox",
+            LAYERS_CONFIG,
+            PIPELINES_CONFIG,
+            fixed_args={"bounding_box_format": box_format},
+        )
+        return layer, box_format
+
     layer_option = st.selectbox(
         "Select an option", list(LAYERS_CONFIG.keys()), index=0, key="layer_option"
     )
@@ -157,9 +338,24 @@ def select_layer_bbox_aug():
 
     # Set control arguments
     layer_args = set_control_args(control_args, layer_args)
-
-    # Instantiate layer
-    layer = layer_cls(**layer_args)
+    dtype = select_dtype(supported_dtypes(layer_config), key="execution_dtype")
+
+    # Instantiate layer, reusing a cached instance when possible
+    compiled = st.checkbox(
+        "Compiled mode (tf.function)",
+        key="compiled_mode",
+        help="Run the layer as a graph, with inputs bucketed to a few fixed "
+        "resolutions so new image sizes do not trigger retracing.",
+    )
+    seed = select_seed()
+    if seed is not None:
+        layer = get_seeded_layer(layer_option, layer_cls, layer_args, seed, dtype)
+    else:
+        layer = get_layer(
+            layer_option, layer_cls, layer_args, compiled=compiled, dtype=dtype
+        )
+    if compiled and seed is None:
+        st.caption(f"Graphs traced so far: {layer.trace_count}")
 
     return layer, box_format
 
@@ -170,6 +366,7 @@ def display_editable_table(boxes):
         "y": st.column_config.NumberColumn(default=0, format="%d"),
         "w": st.column_config.NumberColumn(default=0, format="%d"),
         "h": st.column_config.NumberColumn(default=0, format="%d"),
+        "class": st.column_config.NumberColumn(default=0, format="%d", step=1),
     }
 
     boxes = st.data_editor(
@@ -179,19 +376,47 @@ def display_editable_table(boxes):
         hide_index=True,
     )
 
-    np_boxes = np.array(boxes.values.tolist())
-    return np_boxes
+    return BoxStore.from_dataframe(boxes)
+
+
+def display_img_with_bbox(
+    image, bbox, layer, box_format="xywh", num_samples=1, preview=False
+):
+    if not isinstance(bbox, BoxStore):
+        bbox = BoxStore.from_arrays(bbox, box_format=box_format)
+    if preview:
+        # Boxes stay in full-resolution coordinates in the editable table and
+        # are only rescaled for the preview.
+        image, scale = resize_to_max_side(image)
+        bbox = bbox.scaled(scale)
+
+    job = Job(
+        Preprocessing,
+        (layer, image),
+        {"box_format": box_format, "boxes": bbox, "num_samples": num_samples},
+        # The store is rebuilt on every rerun, so identify boxes by content.
+        token=job_token(
+            layer,
+            image,
+            box_format,
+            num_samples,
+            content_hash(bbox.boxes.tobytes() + bbox.classes.tobytes()),
+        ),
+    )
+    render_job(
+        "bbox", job, lambda result: _display_img_with_bbox(layer, image, *result)
+    )
 
 
-def display_img_with_bbox(image, bbox, layer, box_format="xywh"):
-    images, aug_image = Preprocessing(layer, image, box_format=box_format, boxes=bbox)
+def _display_img_with_bbox(layer, image, images, aug_image):
     col1, _, col3 = st.columns([0.45, 0.1, 0.45], gap="large")
-    with col1:
-        st.subheader("Input Image with bbox")
-        st.image(images[0], use_column_width=True)
-    with col3:
-        st.subheader("Output Image with bbox")
-        st.image(aug_image, use_column_width=True)
+    with TIMINGS.stage("bbox", "display", layer, image):
+        with col1:
+            st.subheader("Input Image with bbox")
+            show_image(images[0])
+        with col3:
+            st.subheader("Output Image with bbox")
+            show_image(make_grid(aug_image))
 
 
 def set_control_args(control_args: typing.Dict, layer_args: typing.Dict):
@@ -219,6 +444,7 @@ def set_control_args(control_args: typing.Dict, layer_args: typing.Dict):
 
 def bbox():
     image, bbox = image_dropdown()
-    np_boxes = display_editable_table(bbox)
+    box_store = display_editable_table(bbox)
     layer, box_format = select_layer_bbox_aug()
-    return layer, image, np_boxes, box_format
+    box_store.box_format = box_format
+    return layer, image, box_store, box_format
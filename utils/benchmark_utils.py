@@ -0,0 +1,218 @@
+import concurrent.futures
+import itertools
+import time
+import typing
+
+import numpy as np
+import tensorflow as tf
+
+from utils.catalog_utils import get_catalog
+from utils.fast_utils import fast_layer_cls
+from utils.layer_utils import TASK_CONFIGS, get_fast_layer, get_layer_from_config
+from utils.parity_utils import cast_images, make_inputs
+from utils.precision_utils import DEFAULT_DTYPE, supported_dtypes
+
+
+SYNTHETIC_RESOLUTIONS = ((256, 256), (512, 512), (1024, 1024))
+BATCH_SIZES = (1, 8)
+# "fast" is the NumPy/OpenCV path, benchmarked for the layers it covers.
+MODES = ("eager", "compiled", "fast")
+
+
+def bundled_resolutions(image_dir: str = "images/") -> typing.List[typing.Tuple[int, int]]:
+    return sorted(
+        {(entry.height, entry.width) for entry in get_catalog(image_dir).entries()}
+    )
+
+
+def _sync(outputs):
+    # Force any pending work before stopping the clock.
+    for tensor in tf.nest.flatten(outputs, expand_composites=True):
+        if not isinstance(tensor, np.ndarray):
+            tensor.numpy()
+
+
+def benchmark_layer(layer, inputs, warmup: int = 2, iterations: int = 10) -> typing.Dict:
+    warmup_times = []
+    for _ in range(warmup):
+        start = time.perf_counter()
+        _sync(layer(inputs))
+        warmup_times.append(time.perf_counter() - start)
+
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        _sync(layer(inputs))
+        times.append(time.perf_counter() - start)
+
+    batch_size = int(tf.nest.flatten(inputs)[0].shape[0])
+    times_ms = 1000 * np.array(times)
+    return {
+        "first_call_ms": 1000 * warmup_times[0] if warmup_times else None,
+        "p50_ms": float(np.percentile(times_ms, 50)),
+        "p90_ms": float(np.percentile(times_ms, 90)),
+        "p99_ms": float(np.percentile(times_ms, 99)),
+        "images_per_second": float(batch_size / np.mean(times)),
+    }
+
+
+def run_benchmarks(
+    tasks: typing.Sequence[str] = tuple(TASK_CONFIGS),
+    layers: typing.Optional[typing.Sequence[str]] = None,
+    resolutions: typing.Optional[typing.Sequence[typing.Tuple[int, int]]] = None,
+    batch_sizes: typing.Sequence[int] = BATCH_SIZES,
+    modes: typing.Sequence[str] = MODES,
+    warmup: int = 2,
+    iterations: int = 10,
+    log: typing.Callable = print,
+    dtypes: typing.Sequence[str] = (DEFAULT_DTYPE,),
+) -> typing.List[typing.Dict]:
+    """Benchmark every configured layer with its default `layer_args` in each
+    of `dtypes` it supports. The "fast" mode only covers float32 image layers
+    with a NumPy/OpenCV implementation and is fed uint8 arrays.
+
+    Layers that fail to build or run are recorded with an `error` instead of
+    aborting the sweep.
+    """
+    if resolutions is None:
+        resolutions = sorted(set(bundled_resolutions()) | set(SYNTHETIC_RESOLUTIONS))
+
+    results = []
+    for task in tasks:
+        for layer_name in TASK_CONFIGS[task]:
+            if layers and layer_name not in layers:
+                continue
+            layer_dtypes = supported_dtypes(TASK_CONFIGS[task][layer_name])
+            for dtype, mode, (height, width), batch_size in itertools.product(
+                [dtype for dtype in dtypes if dtype in layer_dtypes],
+                modes,
+                resolutions,
+                batch_sizes,
+            ):
+                layer_config = TASK_CONFIGS[task][layer_name]
+                layer_args = layer_config["layer_args"]
+                if mode == "fast" and (
+                    task != "image"
+                    or dtype != DEFAULT_DTYPE
+                    or fast_layer_cls(layer_config["layer_cls"], layer_args) is None
+                ):
+                    continue
+                result = {
+                    "task": task,
+                    "layer": layer_name,
+                    "mode": mode,
+                    "dtype": dtype,
+                    "height": height,
+                    "width": width,
+                    "batch_size": batch_size,
+                }
+                try:
+                    inputs = make_inputs(task, height, width, batch_size)
+                    if mode == "fast":
+                        layer = get_fast_layer(
+                            layer_name, layer_config["layer_cls"], layer_args
+                        )
+                        inputs = np.asarray(inputs).astype(np.uint8)
+                    else:
+                        layer = get_layer_from_config(
+                            task, layer_name, compiled=mode == "compiled", dtype=dtype
+                        )
+                        inputs = cast_images(inputs, dtype)
+                    result.update(benchmark_layer(layer, inputs, warmup, iterations))
+                except Exception as e:
+                    result["error"] = f"{type(e).__name__}: {e}".splitlines()[0]
+                log(format_result(result))
+                results.append(result)
+    return results
+
+
+def format_result(result: typing.Dict) -> str:
+    name = (
+        f"{result['task']}/{result['layer']} {result['mode']} "
+        f"{result.get('dtype', DEFAULT_DTYPE)} "
+        f"{result['height']}x{result['width']} b{result['batch_size']}"
+    )
+    if "error" in result:
+        return f"{name}: {result['error']}"
+    return (
+        f"{name}: p50 {result['p50_ms']:.2f}ms p90 {result['p90_ms']:.2f}ms "
+        f"{result['images_per_second']:.1f} img/s"
+    )
+
+
+def _result_key(result: typing.Dict):
+    # Baselines recorded before dtypes were benchmarked ran in float32.
+    return tuple(
+        result[key] for key in ("task", "layer", "mode", "height", "width", "batch_size")
+    ) + (result.get("dtype", DEFAULT_DTYPE),)
+
+
+def compare_to_baseline(
+    results: typing.List[typing.Dict],
+    baseline: typing.List[typing.Dict],
+    tolerance: float = 0.2,
+) -> typing.List[typing.Dict]:
+    """Return the results whose median latency regressed by more than
+    `tolerance` (relative) against the matching baseline entry, and those
+    that ran in the baseline but now fail (with a `ratio` of None).
+    """
+    baseline = {
+        _result_key(result): result for result in baseline if "error" not in result
+    }
+    regressions = []
+    for result in results:
+        previous = baseline.get(_result_key(result))
+        if previous is None:
+            continue
+        if "error" in result:
+            regressions.append(
+                {**result, "baseline_p50_ms": previous["p50_ms"], "ratio": None}
+            )
+            continue
+        ratio = result["p50_ms"] / previous["p50_ms"]
+        if ratio > 1 + tolerance:
+            regressions.append(
+                {**result, "baseline_p50_ms": previous["p50_ms"], "ratio": ratio}
+            )
+    return regressions
+
+
+def benchmark_concurrent(
+    layers: typing.Sequence,
+    inputs: typing.Sequence,
+    concurrency: int,
+    iterations: int = 10,
+    warmup: int = 1,
+) -> typing.Dict:
+    """Run `concurrency` threads that each call every layer on its inputs
+    `iterations` times, like that many sessions augmenting at once, and
+    report the per-call latency and total throughput.
+    """
+    for layer, layer_inputs in zip(layers, inputs):
+        for _ in range(warmup):
+            _sync(layer(layer_inputs))
+
+    def worker():
+        times = []
+        for _ in range(iterations):
+            for layer, layer_inputs in zip(layers, inputs):
+                start = time.perf_counter()
+                _sync(layer(layer_inputs))
+                times.append(time.perf_counter() - start)
+        return times
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+        futures = [pool.submit(worker) for _ in range(concurrency)]
+        times = [t for future in futures for t in future.result()]
+    elapsed = time.perf_counter() - start
+
+    images = sum(
+        int(tf.nest.flatten(layer_inputs)[0].shape[0]) for layer_inputs in inputs
+    )
+    times_ms = 1000 * np.array(times)
+    return {
+        "p50_ms": float(np.percentile(times_ms, 50)),
+        "p90_ms": float(np.percentile(times_ms, 90)),
+        "images_per_second": float(concurrency * iterations * images / elapsed),
+    }
@@ -0,0 +1,161 @@
+import numpy as np
+
+from utils.lazy_utils import tf
+
+
+BOX_FORMATS = ("xyxy", "xywh", "center_xywh", "rel_xyxy")
+
+
+def _to_xyxy(boxes, box_format, image_shape=None):
+    if box_format == "xyxy":
+        return boxes
+    x, y, a, b = np.moveaxis(boxes, -1, 0)
+    if box_format == "xywh":
+        return np.stack([x, y, x + a, y + b], axis=-1)
+    if box_format == "center_xywh":
+        return np.stack([x - a / 2, y - b / 2, x + a / 2, y + b / 2], axis=-1)
+    if box_format == "rel_xyxy":
+        height, width = image_shape[:2]
+        return boxes * np.array([width, height, width, height], dtype=boxes.dtype)
+    raise ValueError(
+        f"Unsupported box format {box_format!r}, expected one of {BOX_FORMATS}"
+    )
+
+
+def _from_xyxy(boxes, box_format, image_shape=None):
+    if box_format == "xyxy":
+        return boxes
+    x1, y1, x2, y2 = np.moveaxis(boxes, -1, 0)
+    if box_format == "xywh":
+        return np.stack([x1, y1, x2 - x1, y2 - y1], axis=-1)
+    if box_format == "center_xywh":
+        return np.stack([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], axis=-1)
+    if box_format == "rel_xyxy":
+        height, width = image_shape[:2]
+        return boxes / np.array([width, height, width, height], dtype=boxes.dtype)
+    raise ValueError(
+        f"Unsupported box format {box_format!r}, expected one of {BOX_FORMATS}"
+    )
+
+
+def convert_boxes(boxes, source: str, target: str, image_shape=None) -> np.ndarray:
+    """Vectorized conversion of an `(..., 4)` box array between formats.
+    `image_shape` (height, width, ...) is required for relative formats.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32)
+    if source == target:
+        return boxes
+    return _from_xyxy(_to_xyxy(boxes, source, image_shape), target, image_shape)
+
+
+class BoxStore:
+    """Columnar, preallocated storage for the boxes of one image.
+
+    Coordinates live in a single `(capacity, 4)` float32 array and class ids
+    in an int32 array next to it, so conversions and tensor creation work on
+    whole columns instead of per-row Python objects. Capacity grows
+    geometrically when boxes are appended.
+    """
+
+    def __init__(self, capacity: int = 64, box_format: str = "xywh"):
+        self._boxes = np.zeros((capacity, 4), dtype=np.float32)
+        self._classes = np.zeros(capacity, dtype=np.int32)
+        self.count = 0
+        self.box_format = box_format
+
+    @classmethod
+    def from_arrays(cls, boxes, classes=None, box_format: str = "xywh"):
+        # `np.asarray` does not copy arrays that are already float32/int32.
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        if classes is None:
+            classes = np.zeros(len(boxes), dtype=np.int32)
+        store = cls(capacity=0, box_format=box_format)
+        store._boxes = boxes
+        store._classes = np.asarray(classes, dtype=np.int32).reshape(-1)
+        store.count = len(boxes)
+        return store
+
+    @classmethod
+    def from_dataframe(
+        cls, df, box_format: str = "xywh", class_column: str = "class"
+    ):
+        """Build a store from an editor table whose first four non-class
+        columns are the coordinates. They are gathered into one float32
+        array in a single copy; the store adopts it without copying again.
+        """
+        coordinate_columns = [
+            column for column in df.columns if column != class_column
+        ]
+        boxes = df[coordinate_columns[:4]].to_numpy(dtype=np.float32)
+        classes = None
+        if class_column in df.columns:
+            classes = df[class_column].fillna(0).to_numpy(dtype=np.int32, copy=False)
+        # Rows added in the editor but not filled in yet.
+        valid = ~np.isnan(boxes).any(axis=1)
+        if not valid.all():
+            boxes = boxes[valid]
+            classes = classes[valid] if classes is not None else None
+        return cls.from_arrays(boxes, classes, box_format=box_format)
+
+    @property
+    def boxes(self) -> np.ndarray:
+        return self._boxes[: self.count]
+
+    @property
+    def classes(self) -> np.ndarray:
+        return self._classes[: self.count]
+
+    def __len__(self):
+        return self.count
+
+    def append(self, boxes, classes=None):
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        if classes is None:
+            classes = np.zeros(len(boxes), dtype=np.int32)
+        needed = self.count + len(boxes)
+        if needed > len(self._boxes):
+            capacity = max(needed, 2 * len(self._boxes), 64)
+            grown_boxes = np.zeros((capacity, 4), dtype=np.float32)
+            grown_classes = np.zeros(capacity, dtype=np.int32)
+            grown_boxes[: self.count] = self.boxes
+            grown_classes[: self.count] = self.classes
+            self._boxes, self._classes = grown_boxes, grown_classes
+        self._boxes[self.count : needed] = boxes
+        self._classes[self.count : needed] = classes
+        self.count = needed
+
+    def convert(self, box_format: str, image_shape=None) -> "BoxStore":
+        boxes = convert_boxes(self.boxes, self.box_format, box_format, image_shape)
+        return BoxStore.from_arrays(boxes, self.classes, box_format=box_format)
+
+    def scaled(self, scale: float) -> "BoxStore":
+        """Boxes for the same image resized by `scale` (absolute formats)."""
+        if self.box_format.startswith("rel"):
+            return self
+        return BoxStore.from_arrays(
+            self.boxes * np.float32(scale), self.classes, box_format=self.box_format
+        )
+
+
+def pad_batch(stores, pad_to: int = None):
+    """Stack stores into dense `(batch, max_boxes, 4)` boxes and
+    `(batch, max_boxes)` classes, padding with -1 as keras_cv expects.
+    """
+    max_boxes = max([len(store) for store in stores] + [pad_to or 0])
+    boxes = np.full((len(stores), max_boxes, 4), -1, dtype=np.float32)
+    classes = np.full((len(stores), max_boxes), -1, dtype=np.float32)
+    for index, store in enumerate(stores):
+        boxes[index, : len(store)] = store.boxes
+        classes[index, : len(store)] = store.classes
+    return {"boxes": boxes, "classes": classes}
+
+
+def ragged_batch(stores):
+    """Concatenate stores into ragged `(batch, None, 4)` keras_cv inputs."""
+    row_lengths = [len(store) for store in stores]
+    boxes = np.concatenate([store.boxes for store in stores]).reshape(-1, 4)
+    classes = np.concatenate([store.classes for store in stores]).astype(np.float32)
+    return {
+        "boxes": tf.RaggedTensor.from_row_lengths(boxes, row_lengths),
+        "classes": tf.RaggedTensor.from_row_lengths(classes, row_lengths),
+    }
@@ -0,0 +1,122 @@
+import threading
+import typing
+from collections import OrderedDict
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe least-recently-used cache shared by every Streamlit session
+    served from the same process.
+
+    When `max_bytes` is set, `sizeof(value)` is charged against that budget
+    and the least recently used entries are evicted until the cache fits.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 64,
+        max_bytes: typing.Optional[int] = None,
+        sizeof: typing.Optional[typing.Callable] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        # key -> [lock, number of threads using it] for in-flight builds.
+        self._building = {}
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if self.max_bytes is not None and size > self.max_bytes:
+                # Never cache a single value that would blow the whole budget.
+                return
+            self._discard(key)
+            self._data[key] = value
+            self._sizes[key] = size
+            self.current_bytes += size
+            self._evict()
+
+    def get_or_create(self, key, factory: typing.Callable):
+        """Return the value for `key`, building it with `factory()` on a miss.
+        Concurrent misses for one key wait for a single build; builds of
+        other keys are not blocked.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            building = self._building.setdefault(key, [threading.Lock(), 0])
+            building[1] += 1
+        try:
+            with building[0]:
+                with self._lock:
+                    value = self._data.get(key, _MISSING)
+                    if value is not _MISSING:
+                        self._data.move_to_end(key)
+                if value is _MISSING:
+                    value = factory()
+                    self.put(key, value)
+        finally:
+            with self._lock:
+                building[1] -= 1
+                if not building[1]:
+                    del self._building[key]
+        return value
+
+    def _discard(self, key):
+        if key in self._data:
+            del self._data[key]
+            self.current_bytes -= self._sizes.pop(key)
+
+    def _evict(self):
+        while len(self._data) > self.max_entries or (
+            self.max_bytes is not None and self.current_bytes > self.max_bytes
+        ):
+            key, _ = self._data.popitem(last=False)
+            self.current_bytes -= self._sizes.pop(key)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.current_bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> typing.Dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
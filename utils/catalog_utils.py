@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+import typing
+
+import numpy as np
+from PIL import Image
+
+from utils.decode_utils import decode_file
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+class CatalogEntry(typing.NamedTuple):
+    name: str
+    path: str
+    size: int
+    mtime_ns: int
+    width: int
+    height: int
+
+
+class ImageCatalog:
+    """Lightweight index of the images in `root_dir`.
+
+    Only file metadata and image headers are read while indexing; pixel data
+    is decoded lazily (straight from a memory map of the file) the first time
+    an image is requested, and the index is refreshed incrementally so only
+    new or modified files are re-inspected.
+    """
+
+    def __init__(
+        self,
+        root_dir: str,
+        extensions: typing.Tuple[str, ...] = IMAGE_EXTENSIONS,
+        refresh_interval: float = 2.0,
+    ):
+        self.root_dir = root_dir
+        self.extensions = extensions
+        self.refresh_interval = refresh_interval
+        self._entries = {}
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+        self.refresh(force=True)
+
+    def refresh(self, force: bool = False):
+        if not force and time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        with self._lock:
+            entries = {}
+            with os.scandir(self.root_dir) as it:
+                for dir_entry in it:
+                    if not dir_entry.is_file() or not dir_entry.name.lower().endswith(
+                        self.extensions
+                    ):
+                        continue
+                    stat = dir_entry.stat()
+                    if stat.st_size == 0:
+                        continue
+                    entry = self._entries.get(dir_entry.name)
+                    if (
+                        entry is None
+                        or entry.size != stat.st_size
+                        or entry.mtime_ns != stat.st_mtime_ns
+                    ):
+                        entry = self._index_file(dir_entry.name, dir_entry.path, stat)
+                    if entry is not None:
+                        entries[entry.name] = entry
+            self._entries = entries
+            self._last_refresh = time.monotonic()
+
+    def _index_file(self, name, path, stat) -> typing.Optional[CatalogEntry]:
+        try:
+            # Opening an image only parses its header, not the pixel data.
+            with Image.open(path) as image:
+                width, height = image.size
+        except (OSError, SyntaxError):
+            return None
+        return CatalogEntry(name, path, stat.st_size, stat.st_mtime_ns, width, height)
+
+    def names(self) -> typing.List[str]:
+        self.refresh()
+        return sorted(self._entries)
+
+    def entries(self) -> typing.List[CatalogEntry]:
+        self.refresh()
+        return [self._entries[name] for name in sorted(self._entries)]
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def __getitem__(self, name) -> CatalogEntry:
+        return self._entries[name]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load_image(self, name: str, mode: str = "RGB", dtype=np.uint8) -> np.ndarray:
+        return decode_file(self._entries[name].path, mode=mode, dtype=dtype)
+
+
+_CATALOGS = {}
+_CATALOGS_LOCK = threading.Lock()
+
+
+def get_catalog(root_dir: str) -> ImageCatalog:
+    """Return the process-wide catalog for `root_dir`, building it on first
+    use.
+    """
+    root_dir = os.path.abspath(root_dir)
+    with _CATALOGS_LOCK:
+        if root_dir not in _CATALOGS:
+            _CATALOGS[root_dir] = ImageCatalog(root_dir)
+        return _CATALOGS[root_dir]
+
+
+def list_image_files(inputs: typing.Sequence[str]) -> typing.List[str]:
+    """Expand directories (non-recursively), image files and `.txt` file
+    lists (one path per line) into a sorted list of image paths.
+    """
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(
+                os.path.join(item, name)
+                for name in os.listdir(item)
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        elif item.endswith(".txt"):
+            with open(item) as f:
+                paths.extend(line.strip() for line in f if line.strip())
+        else:
+            paths.append(item)
+    return sorted(paths)
+
+
+def find_masks(image_paths: typing.Sequence[str], mask_dir: str) -> typing.List[str]:
+    """Pair every image with the file in `mask_dir` that has the same stem."""
+    masks = {
+        os.path.splitext(name)[0]: os.path.join(mask_dir, name)
+        for name in os.listdir(mask_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    }
+    mask_paths = []
+    for path in image_paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if stem not in masks:
+            raise FileNotFoundError(f"No mask for {path!r} in {mask_dir!r}")
+        mask_paths.append(masks[stem])
+    return mask_paths
@@ -0,0 +1,147 @@
+import threading
+import typing
+
+from utils.lazy_utils import tf
+from utils.precision_utils import execution_dtype
+
+
+RESOLUTION_BUCKETS = (256, 512, 1024, 2048)
+
+# Layers that transform every pixel independently of its position and of the
+# rest of the image. Zero padding up to the bucket and cropping afterwards is
+# exact for them; every other layer is resized into the bucket instead.
+POINTWISE_LAYERS = {
+    "ChannelShuffle",
+    "Grayscale",
+    "RandomBrightness",
+    "RandomChannelShift",
+    "RandomColorDegeneration",
+    "RandomHue",
+    "RandomSaturation",
+    "Solarization",
+}
+
+
+def bucket_size(size: int, buckets: typing.Sequence[int] = RESOLUTION_BUCKETS) -> int:
+    for bucket in buckets:
+        if size <= bucket:
+            return bucket
+    largest = buckets[-1]
+    return -(-size // largest) * largest
+
+
+def _to_dense(tensor):
+    if isinstance(tensor, tf.RaggedTensor):
+        tensor = tensor.to_tensor(default_value=-1)
+    return tf.cast(tensor, tf.float32)
+
+
+class CompiledLayer:
+    """Run `layer` inside `tf.function`s with fixed input signatures.
+
+    Pointwise layers get their inputs zero padded into a small set of
+    resolution buckets, which is exact for them, so each bucket is traced
+    once and outputs are cropped back to the input resolution. Every other
+    layer is traced once with dynamic height and width instead: padding or
+    resampling would move rotation centres, pull padding into reflected
+    fills and change image statistics, so its output would no longer match
+    the eager layer.
+    """
+
+    def __init__(self, layer, layer_name: str, buckets=RESOLUTION_BUCKETS):
+        self.layer = layer
+        self.layer_name = layer_name
+        self.buckets = buckets
+        self.bucket_mode = "pad" if layer_name in POINTWISE_LAYERS else "dynamic"
+        self.execution_dtype = execution_dtype(layer)
+        self.trace_count = 0
+        self._functions = {}
+        self._lock = threading.Lock()
+
+    def _traced_call(self, inputs):
+        # Python side effects only run while tracing.
+        self.trace_count += 1
+        # keras_cv casts inputs to the compute dtype by reassigning dict keys,
+        # which tf.function rejects on its own arguments; hand it a copy.
+        inputs = dict(inputs)
+        if "bounding_boxes" in inputs:
+            inputs["bounding_boxes"] = dict(inputs["bounding_boxes"])
+        outputs = self.layer(inputs)
+        if isinstance(outputs, dict) and "bounding_boxes" in outputs:
+            # Boxes stay float32 whatever dtype the images run in.
+            outputs = dict(outputs)
+            outputs["bounding_boxes"] = {
+                key: tf.cast(value, tf.float32)
+                for key, value in outputs["bounding_boxes"].items()
+            }
+        return outputs
+
+    def _get_function(self, inputs):
+        # Batch size, and for unbucketed layers height and width, are dynamic.
+        dynamic = 1 if self.bucket_mode == "pad" else 3
+        signature = {
+            key: tf.TensorSpec(
+                [None] * dynamic + inputs[key].shape[dynamic:].as_list(),
+                inputs[key].dtype,
+            )
+            for key in ("images", "segmentation_masks")
+            if key in inputs
+        }
+        if "bounding_boxes" in inputs:
+            signature["bounding_boxes"] = {
+                "boxes": tf.TensorSpec([None, None, 4], tf.float32),
+                "classes": tf.TensorSpec([None, None], tf.float32),
+            }
+        key = tuple(tf.nest.flatten(signature))
+        with self._lock:
+            if key not in self._functions:
+                self._functions[key] = tf.function(
+                    self._traced_call, input_signature=[signature]
+                )
+            return self._functions[key]
+
+    def __call__(self, inputs):
+        is_dict = isinstance(inputs, dict)
+        if not is_dict:
+            inputs = {"images": inputs}
+        inputs = dict(inputs)
+        images = tf.cast(inputs["images"], self.execution_dtype)
+        # A bare image may be passed unbatched, like an eager layer call.
+        unbatched = not is_dict and images.shape.rank == 3
+        if unbatched:
+            images = tf.expand_dims(images, axis=0)
+        inputs["images"] = images
+        if "segmentation_masks" in inputs:
+            inputs["segmentation_masks"] = tf.convert_to_tensor(
+                inputs["segmentation_masks"]
+            )
+        if "bounding_boxes" in inputs:
+            inputs["bounding_boxes"] = {
+                key: _to_dense(inputs["bounding_boxes"][key])
+                for key in ("boxes", "classes")
+            }
+
+        height, width = int(images.shape[1]), int(images.shape[2])
+        if self.bucket_mode == "pad":
+            bucket_h = bucket_size(height, self.buckets)
+            bucket_w = bucket_size(width, self.buckets)
+            for key in ("images", "segmentation_masks"):
+                if key in inputs:
+                    inputs[key] = tf.image.pad_to_bounding_box(
+                        inputs[key], 0, 0, bucket_h, bucket_w
+                    )
+
+        outputs = self._get_function(inputs)(inputs)
+        if not isinstance(outputs, dict):
+            outputs = {"images": outputs}
+        outputs = dict(outputs)
+
+        if self.bucket_mode == "pad":
+            for key in ("images", "segmentation_masks"):
+                if key in outputs:
+                    outputs[key] = outputs[key][:, :height, :width, :]
+
+        if not is_dict:
+            outputs = outputs["images"]
+            return outputs[0] if unbatched else outputs
+        return outputs
@@ -0,0 +1,163 @@
+import os
+import time
+import typing
+
+import tensorflow as tf
+
+from utils.precision_utils import round_to_uint8, to_layer_input
+from utils.runtime_utils import dataset_options
+
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+ENCODERS = {
+    "png": lambda image: tf.io.encode_png(image),
+    "jpeg": lambda image: tf.io.encode_jpeg(image, quality=95),
+}
+
+
+MANIFEST_NAME = "manifest.json"
+
+
+def _output_path(stem: str, output_dir: str, suffix: str, image_format: str) -> str:
+    extension = "jpg" if image_format == "jpeg" else image_format
+    return os.path.join(output_dir, f"{stem}{suffix}.{extension}")
+
+
+def output_files(
+    image_paths: typing.Sequence[str],
+    output_dir: str,
+    image_format: str = "png",
+    masks: bool = False,
+) -> typing.List[typing.Dict[str, str]]:
+    """Map every input image to the file(s) it is written to in `output_dir`.
+
+    Outputs are named by the input's stem; when an earlier input already
+    claimed a stem (`a.jpg` and `a.png`, or the same name in two input
+    directories) a numeric suffix is added (`a_1`).
+    """
+    used = set()
+    files = []
+    for path in image_paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        unique, count = stem, 0
+        while unique in used:
+            count += 1
+            unique = f"{stem}_{count}"
+        used.add(unique)
+        entry = {
+            "input": path,
+            "output": _output_path(unique, output_dir, "", image_format),
+        }
+        if masks:
+            entry["mask_output"] = _output_path(unique, output_dir, "_mask", "png")
+        files.append(entry)
+    return files
+
+
+def _decode(path, channels=3):
+    image = tf.io.decode_image(
+        tf.io.read_file(path), channels=channels, expand_animations=False
+    )
+    return tf.cast(image, tf.float32)
+
+
+def build_augmentation_dataset(
+    layer,
+    image_paths: typing.Sequence[str],
+    output_dir: str,
+    mask_paths: typing.Optional[typing.Sequence[str]] = None,
+    batch_size: int = 32,
+    image_size: typing.Optional[typing.Tuple[int, int]] = None,
+    image_format: str = "png",
+) -> tf.data.Dataset:
+    """Stream images (and optional segmentation masks) through `layer` and
+    write the encoded results to `output_dir`.
+
+    Decoding, augmentation and encoding/writing all run as parallel
+    `tf.data` maps. Without `image_size`, images are grouped into batches of
+    identical resolution so that no resizing is needed. Output names follow
+    `output_files`.
+    """
+    encode = ENCODERS[image_format]
+    files = output_files(
+        image_paths, output_dir, image_format, masks=mask_paths is not None
+    )
+    elements = {
+        "path": list(image_paths),
+        "output": [entry["output"] for entry in files],
+    }
+    if mask_paths is not None:
+        elements["mask_path"] = list(mask_paths)
+        elements["mask_output"] = [entry["mask_output"] for entry in files]
+
+    def load(element):
+        element = dict(element)
+        element["images"] = _decode(element.pop("path"))
+        if "mask_path" in element:
+            element["segmentation_masks"] = _decode(element.pop("mask_path"))
+        if image_size is not None:
+            element["images"] = tf.image.resize(element["images"], image_size)
+            if "segmentation_masks" in element:
+                element["segmentation_masks"] = tf.image.resize(
+                    element["segmentation_masks"], image_size, method="nearest"
+                )
+        return element
+
+    def augment(batch):
+        batch = dict(batch)
+        inputs = {"images": to_layer_input(batch.pop("images"), layer)}
+        if "segmentation_masks" in batch:
+            inputs["segmentation_masks"] = batch.pop("segmentation_masks")
+        outputs = layer(inputs)
+        if not isinstance(outputs, dict):
+            outputs = {"images": outputs}
+        batch["images"] = outputs["images"]
+        if "segmentation_masks" in inputs:
+            batch["segmentation_masks"] = outputs["segmentation_masks"]
+        return batch
+
+    def write(element):
+        tf.io.write_file(element["output"], encode(round_to_uint8(element["images"])))
+        if "segmentation_masks" in element:
+            tf.io.write_file(
+                element["mask_output"],
+                tf.io.encode_png(round_to_uint8(element["segmentation_masks"])),
+            )
+        return element["output"]
+
+    dataset = tf.data.Dataset.from_tensor_slices(elements)
+    dataset = dataset.map(load, num_parallel_calls=AUTOTUNE, deterministic=False)
+    if image_size is not None:
+        dataset = dataset.batch(batch_size)
+    else:
+        dataset = dataset.group_by_window(
+            key_func=lambda element: tf.cast(
+                tf.shape(element["images"])[0] * 65536
+                + tf.shape(element["images"])[1],
+                tf.int64,
+            ),
+            reduce_func=lambda _, window: window.batch(batch_size),
+            window_size=batch_size,
+        )
+    dataset = dataset.map(augment, num_parallel_calls=AUTOTUNE, deterministic=False)
+    dataset = dataset.unbatch()
+    dataset = dataset.map(write, num_parallel_calls=AUTOTUNE, deterministic=False)
+    return dataset.prefetch(AUTOTUNE).with_options(dataset_options(tf))
+
+
+def run_dataset(dataset: tf.data.Dataset, log_every: int = 1000) -> typing.Dict:
+    """Drain `dataset`, printing progress, and return throughput stats."""
+    count = 0
+    start = time.perf_counter()
+    for _ in dataset:
+        count += 1
+        if log_every and count % log_every == 0:
+            elapsed = time.perf_counter() - start
+            print(f"{count} images, {count / elapsed:.1f} images/s", flush=True)
+    elapsed = time.perf_counter() - start
+    return {
+        "images": count,
+        "seconds": elapsed,
+        "images_per_second": count / elapsed if elapsed > 0 else 0.0,
+    }
@@ -0,0 +1,70 @@
+import hashlib
+import io
+import mmap
+import os
+import typing
+
+import numpy as np
+from PIL import Image
+
+from utils.cache_utils import LRUCache
+
+
+DECODE_CACHE_MB = int(os.environ.get("KERASCV_DEMO_DECODE_CACHE_MB", 256))
+
+DECODED_IMAGE_CACHE = LRUCache(
+    max_entries=1024,
+    max_bytes=DECODE_CACHE_MB * 1024 * 1024,
+    sizeof=lambda array: array.nbytes,
+)
+
+
+def content_hash(content) -> str:
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+def decode_image(
+    content,
+    mode: str = "RGB",
+    dtype=np.uint8,
+    key: typing.Optional[typing.Hashable] = None,
+    cache: bool = True,
+) -> np.ndarray:
+    """Decode encoded image bytes, a memory map or a Streamlit `UploadedFile`
+    to an array, caching the result by content hash (or by `key` when the
+    caller already has a cheaper identity) so reruns skip the decode
+    entirely. Bulk jobs that read each image once pass `cache=False` to keep
+    the shared cache for interactive sessions.
+
+    The returned array is shared between sessions and therefore read-only;
+    copy it before modifying it in place.
+    """
+    if hasattr(content, "getvalue"):
+        content = content.getvalue()
+
+    def decode():
+        stream = content if hasattr(content, "seek") else io.BytesIO(content)
+        image = Image.open(stream).convert(mode)
+        array = np.asarray(image, dtype=dtype)
+        array.flags.writeable = False
+        return array
+
+    if not cache:
+        return decode()
+    if key is None:
+        key = content_hash(content)
+    key = (key, mode, np.dtype(dtype).str)
+    return DECODED_IMAGE_CACHE.get_or_create(key, decode)
+
+
+def decode_file(
+    path: str, mode: str = "RGB", dtype=np.uint8, cache: bool = True
+) -> np.ndarray:
+    """Decode an image file straight from a memory map, cached by path, size
+    and modification time so the file is not hashed on every call.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            return decode_image(content, mode=mode, dtype=dtype, key=key, cache=cache)
@@ -0,0 +1,152 @@
+import math
+import typing
+
+import cv2
+import numpy as np
+import streamlit as st
+
+from utils.cache_utils import LRUCache
+from utils.decode_utils import content_hash
+
+try:
+    # libjpeg-turbo bindings; SIMD-accelerated and RGB-native.
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
+
+
+# Roughly the width of a display column; augmenting more pixels than this is
+# wasted work in preview mode because `st.image` scales the result down.
+PREVIEW_MAX_SIDE = 768
+
+DISPLAY_FORMATS = ("JPEG", "WebP", "PNG")
+DEFAULT_DISPLAY_FORMAT = "JPEG"
+DEFAULT_DISPLAY_QUALITY = 85
+
+ENCODED_IMAGE_CACHE = LRUCache(max_entries=256, max_bytes=64 * 1024 * 1024, sizeof=len)
+
+
+def resize_to_max_side(
+    image, max_side: int = PREVIEW_MAX_SIDE, interpolation=cv2.INTER_AREA
+):
+    """Downscale `image` so that its longest side is at most `max_side`.
+
+    Returns the resized image and the scale factor that was applied, so that
+    coordinates (e.g. bounding boxes) can be rescaled consistently. Images that
+    are already small enough are returned unchanged with a scale of 1.
+    """
+    height, width = image.shape[:2]
+    scale = max_side / max(height, width)
+    if scale >= 1:
+        return image, 1.0
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    resized = cv2.resize(np.asarray(image), size, interpolation=interpolation)
+    if resized.ndim == 2 and np.ndim(image) == 3:
+        resized = resized[..., np.newaxis]
+    return resized, scale
+
+
+def make_grid(images, columns: int = 4, padding: int = 4, pad_value: int = 255):
+    """Tile a batch of equally sized images into a single grid image so that
+    the whole batch is rendered with one `st.image` call.
+    """
+    images = np.asarray(images)
+    if images.ndim == 3:
+        return images
+    num_images, height, width, channels = images.shape
+    columns = max(1, min(columns, num_images))
+    rows = math.ceil(num_images / columns)
+
+    grid = np.full(
+        (
+            rows * height + (rows - 1) * padding,
+            columns * width + (columns - 1) * padding,
+            channels,
+        ),
+        pad_value,
+        dtype=images.dtype,
+    )
+    for index, image in enumerate(images):
+        row, column = divmod(index, columns)
+        top = row * (height + padding)
+        left = column * (width + padding)
+        grid[top : top + height, left : left + width] = image
+    return grid
+
+
+def to_uint8(image) -> np.ndarray:
+    """Round and clip to uint8 in one pass; uint8 input is not copied."""
+    image = np.asarray(image)
+    if image.dtype == np.uint8:
+        return image
+    return np.clip(np.rint(image), 0, 255).astype(np.uint8)
+
+
+def encode_image(
+    image,
+    image_format: str = DEFAULT_DISPLAY_FORMAT,
+    quality: int = DEFAULT_DISPLAY_QUALITY,
+) -> bytes:
+    """Encode an RGB or single-channel uint8 image for display. JPEG uses
+    `simplejpeg` when it is installed and OpenCV otherwise; PNG is written
+    with fast, light compression.
+    """
+    image = np.ascontiguousarray(to_uint8(image))
+    if image.ndim == 3 and image.shape[-1] == 1:
+        image = image[..., 0]
+    if image_format == "JPEG" and simplejpeg is not None:
+        if image.ndim == 2:
+            return simplejpeg.encode_jpeg(
+                image[..., np.newaxis], quality=quality, colorspace="GRAY"
+            )
+        return simplejpeg.encode_jpeg(image, quality=quality, colorspace="RGB")
+
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    if image_format == "JPEG":
+        extension, params = ".jpg", [cv2.IMWRITE_JPEG_QUALITY, quality]
+    elif image_format == "WebP":
+        extension, params = ".webp", [cv2.IMWRITE_WEBP_QUALITY, quality]
+    elif image_format == "PNG":
+        extension, params = ".png", [cv2.IMWRITE_PNG_COMPRESSION, 1]
+    else:
+        raise ValueError(
+            f"Unsupported display format {image_format!r}, "
+            f"expected one of {DISPLAY_FORMATS}"
+        )
+    ok, encoded = cv2.imencode(extension, image, params)
+    if not ok:
+        raise ValueError(f"Could not encode image as {image_format}")
+    return encoded.tobytes()
+
+
+def cached_encode(
+    image,
+    image_format: str = DEFAULT_DISPLAY_FORMAT,
+    quality: int = DEFAULT_DISPLAY_QUALITY,
+) -> bytes:
+    """`encode_image`, cached by pixel content so that reruns showing the same
+    (e.g. cached or input) image skip the encode.
+    """
+    image = np.ascontiguousarray(to_uint8(image))
+    digest = content_hash(memoryview(image).cast("B"))
+    key = (digest, image.shape, image_format, quality)
+    return ENCODED_IMAGE_CACHE.get_or_create(
+        key, lambda: encode_image(image, image_format, quality)
+    )
+
+
+def show_image(image, caption: typing.Optional[str] = None, lossless: bool = False):
+    """`st.image` for arrays, sending bytes encoded in the sidebar's display
+    format instead of a full-resolution PNG. `lossless` forces PNG, e.g. for
+    masks whose hard edges JPEG would smear.
+    """
+    image_format = st.session_state.get("display_format", DEFAULT_DISPLAY_FORMAT)
+    quality = st.session_state.get("display_quality", DEFAULT_DISPLAY_QUALITY)
+    if lossless:
+        image_format = "PNG"
+    st.image(
+        cached_encode(image, image_format, quality),
+        caption=caption,
+        use_column_width=True,
+    )
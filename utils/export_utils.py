@@ -0,0 +1,414 @@
+import json
+import os
+import queue
+import threading
+import time
+import typing
+
+import numpy as np
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from utils.annotation_utils import load_annotations
+from utils.box_utils import BoxStore, convert_boxes, pad_batch
+from utils.catalog_utils import find_masks, list_image_files
+from utils.decode_utils import decode_file
+from utils.display_utils import encode_image
+from utils.lazy_utils import tf
+from utils.mask_utils import decode_mask_file
+from utils.precision_utils import round_to_uint8, to_layer_input
+from utils.timing_utils import describe_layer
+
+
+EXPORT_FORMATS = ("jpeg", "png")
+
+MANIFEST_NAME = "manifest.json"
+
+POLL_INTERVAL = 0.1
+
+
+class ExportSample(typing.NamedTuple):
+    image_path: str
+    boxes: typing.Optional[BoxStore] = None
+    mask_path: typing.Optional[str] = None
+
+
+def samples_from_files(
+    image_paths: typing.Sequence[str],
+    mask_paths: typing.Optional[typing.Sequence[str]] = None,
+) -> typing.List[ExportSample]:
+    mask_paths = mask_paths or [None] * len(image_paths)
+    return [
+        ExportSample(image_path, mask_path=mask_path)
+        for image_path, mask_path in zip(image_paths, mask_paths)
+    ]
+
+
+def samples_from_annotations(index, image_dir: str) -> typing.List[ExportSample]:
+    """One sample per image of an `AnnotationIndex`, with its xywh boxes."""
+    return [
+        ExportSample(
+            os.path.join(image_dir, info["file_name"]), boxes=index.boxes(info["id"])
+        )
+        for info in index.images
+    ]
+
+
+def shard_path(output_dir: str, shard: int, num_shards: int) -> str:
+    return os.path.join(output_dir, f"data-{shard:05d}-of-{num_shards:05d}.tfrecord")
+
+
+def _bytes_feature(value: bytes):
+    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+
+
+def _int64_feature(values):
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=list(values)))
+
+
+def _float_feature(values):
+    return tf.train.Feature(float_list=tf.train.FloatList(value=list(values)))
+
+
+def serialize_record(record: typing.Dict, image_format: str) -> bytes:
+    """Encode one augmented sample as a `tf.train.Example`."""
+    image = record["image"]
+    features = {
+        "image/encoded": _bytes_feature(encode_image(image, image_format.upper(), 95)),
+        "image/format": _bytes_feature(image_format.encode()),
+        "image/height": _int64_feature([image.shape[0]]),
+        "image/width": _int64_feature([image.shape[1]]),
+        "image/source": _bytes_feature(record["source"].encode()),
+        "image/augmentation_index": _int64_feature([record["copy"]]),
+    }
+    if "boxes" in record:
+        features["image/object/bbox"] = _float_feature(record["boxes"].reshape(-1))
+        features["image/object/class"] = _int64_feature(record["classes"])
+        features["image/object/bbox_format"] = _bytes_feature(
+            record["bounding_box_format"].encode()
+        )
+    if "mask" in record:
+        features["image/segmentation/encoded"] = _bytes_feature(
+            encode_image(record["mask"], "PNG")
+        )
+    example = tf.train.Example(features=tf.train.Features(feature=features))
+    return example.SerializeToString()
+
+
+class _ShardWriters:
+    """Writer threads that each own the shards `shard % num_writers == index`.
+
+    Records are handed over through bounded queues, so encoding and writing
+    overlap with augmentation while at most `queue_size` augmented records
+    per writer are held in memory.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        num_shards: int,
+        num_writers: int,
+        image_format: str,
+        queue_size: int = 64,
+    ):
+        self.output_dir = output_dir
+        self.num_shards = num_shards
+        self.image_format = image_format
+        self.counts = [0] * num_shards
+        self.errors = []
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(num_writers)]
+        self._threads = [
+            threading.Thread(
+                target=self._write, args=(index,), name=f"export-writer-{index}"
+            )
+            for index in range(num_writers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _write(self, index: int):
+        writers = {}
+        try:
+            for shard in range(index, self.num_shards, len(self._queues)):
+                writers[shard] = tf.io.TFRecordWriter(
+                    shard_path(self.output_dir, shard, self.num_shards)
+                )
+            while True:
+                item = self._queues[index].get()
+                if item is None:
+                    break
+                shard, record = item
+                if self.errors:
+                    # Keep draining so the producer never blocks.
+                    continue
+                writers[shard].write(serialize_record(record, self.image_format))
+                self.counts[shard] += 1
+        except Exception as error:
+            self.errors.append(error)
+            while self._queues[index].get() is not None:
+                pass
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+    def put(self, shard: int, record: typing.Dict):
+        if self.errors:
+            raise self.errors[0]
+        self._queues[shard % len(self._queues)].put((shard, record))
+
+    def close(self):
+        for records in self._queues:
+            records.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self.errors:
+            raise self.errors[0]
+
+
+def _dense_output_boxes(bounding_boxes):
+    boxes, classes = bounding_boxes["boxes"], bounding_boxes["classes"]
+    if isinstance(boxes, tf.RaggedTensor):
+        boxes = boxes.to_tensor(default_value=-1)
+        classes = classes.to_tensor(default_value=-1)
+    return np.asarray(boxes), np.asarray(classes)
+
+
+def _remove_shards(output_dir: str, num_shards: int):
+    for shard in range(num_shards):
+        path = shard_path(output_dir, shard, num_shards)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _augment_sample(layer, sample, copies, bounding_box_format):
+    """Augment `copies` versions of one sample in a single batched call."""
+    # Each sample is read once; keep the shared decode cache for the pages.
+    image = decode_file(sample.image_path, cache=False)
+    inputs = {"images": to_layer_input(image, layer)[tf.newaxis]}
+    if sample.boxes is not None:
+        boxes = BoxStore.from_arrays(
+            convert_boxes(
+                sample.boxes.boxes,
+                sample.boxes.box_format,
+                bounding_box_format,
+                image.shape,
+            ),
+            sample.boxes.classes,
+            box_format=bounding_box_format,
+        )
+        inputs["bounding_boxes"] = tf.nest.map_structure(
+            tf.convert_to_tensor, pad_batch([boxes])
+        )
+    if sample.mask_path is not None:
+        ids = decode_mask_file(sample.mask_path, cache=False).ids
+        inputs["segmentation_masks"] = tf.convert_to_tensor(ids, dtype=tf.uint8)[
+            tf.newaxis, ..., tf.newaxis
+        ]
+    inputs = tf.nest.map_structure(
+        lambda tensor: tf.repeat(tensor, copies, axis=0), inputs
+    )
+
+    outputs = layer(inputs)
+    if not isinstance(outputs, dict):
+        outputs = {"images": outputs}
+    images = np.asarray(round_to_uint8(outputs["images"]))
+    records = [
+        {"image": images[copy], "source": sample.image_path, "copy": copy}
+        for copy in range(copies)
+    ]
+    if "bounding_boxes" in inputs:
+        boxes, classes = _dense_output_boxes(outputs["bounding_boxes"])
+        for copy, record in enumerate(records):
+            valid = classes[copy] >= 0
+            record["boxes"] = boxes[copy][valid].astype(np.float32)
+            record["classes"] = classes[copy][valid].astype(np.int64)
+            record["bounding_box_format"] = bounding_box_format
+    if "segmentation_masks" in inputs:
+        masks = np.asarray(round_to_uint8(outputs["segmentation_masks"]))
+        for copy, record in enumerate(records):
+            record["mask"] = masks[copy]
+    return records
+
+
+def export_tfrecords(
+    layer,
+    samples: typing.Sequence[ExportSample],
+    output_dir: str,
+    copies: int = 4,
+    num_shards: int = 8,
+    num_writers: int = 4,
+    image_format: str = "jpeg",
+    bounding_box_format: str = "xywh",
+    metadata: typing.Optional[typing.Dict] = None,
+    progress: typing.Optional[typing.Callable[[int, int], None]] = None,
+) -> typing.Dict:
+    """Write `copies` augmentations of every sample to sharded TFRecords.
+
+    Record `i * copies + k` (copy `k` of sample `i`) goes to shard
+    `(i * copies + k) % num_shards`, so shard sizes differ by at most one
+    record and the copies of one sample are spread over different shards.
+    A `manifest.json` describing the shards and features is written last, so
+    a directory without one holds no complete export: a stale manifest is
+    removed first and the shards are removed again if the export fails.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    num_writers = max(1, min(num_writers, num_shards))
+    start = time.perf_counter()
+    writers = _ShardWriters(output_dir, num_shards, num_writers, image_format)
+    try:
+        try:
+            for index, sample in enumerate(samples):
+                records = _augment_sample(layer, sample, copies, bounding_box_format)
+                for copy, record in enumerate(records):
+                    writers.put((index * copies + copy) % num_shards, record)
+                if progress is not None:
+                    progress(index + 1, len(samples))
+        finally:
+            writers.close()
+    except BaseException:
+        _remove_shards(output_dir, num_shards)
+        raise
+
+    features = ["image/encoded", "image/format", "image/height", "image/width"]
+    features += ["image/source", "image/augmentation_index"]
+    if any(sample.boxes is not None for sample in samples):
+        features += ["image/object/bbox", "image/object/class"]
+        features += ["image/object/bbox_format"]
+    if any(sample.mask_path is not None for sample in samples):
+        features += ["image/segmentation/encoded"]
+    manifest = {
+        "layer": describe_layer(layer),
+        "samples": len(samples),
+        "copies": copies,
+        "records": sum(writers.counts),
+        "image_format": image_format,
+        "bounding_box_format": bounding_box_format,
+        "features": features,
+        "shards": [
+            {
+                "path": os.path.basename(shard_path(output_dir, shard, num_shards)),
+                "records": count,
+            }
+            for shard, count in enumerate(writers.counts)
+        ],
+        "seconds": time.perf_counter() - start,
+        **(metadata or {}),
+    }
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    return manifest
+
+
+class ExportJob:
+    """`export_tfrecords` running on its own thread, so that script reruns
+    neither block on the export nor restart it.
+    """
+
+    def __init__(self, output_dir: str, **kwargs):
+        self.output_dir = output_dir
+        self.done = 0
+        self.total = 0
+        self.manifest = None
+        self.error = None
+        self._thread = threading.Thread(
+            target=self._run, args=(kwargs,), name="export", daemon=True
+        )
+        self._thread.start()
+
+    def _progress(self, done: int, total: int):
+        self.done, self.total = done, total
+
+    def _run(self, kwargs):
+        try:
+            self.manifest = export_tfrecords(
+                output_dir=self.output_dir, progress=self._progress, **kwargs
+            )
+        except Exception as error:
+            self.error = error
+
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+
+# The latest export of every session.
+EXPORTS = {}
+
+
+def display_export_panel(task: str, layer, bounding_box_format: str = "xywh"):
+    """Sidebar form exporting the currently selected layer or pipeline."""
+    ctx = get_script_run_ctx()
+    session_id = ctx.session_id if ctx is not None else None
+    with st.form(key="export"):
+        if task == "bbox":
+            annotations = st.text_input("COCO JSON file or VOC XML directory")
+            image_dir = st.text_input("Images directory")
+        else:
+            image_dir = st.text_input("Images directory")
+        mask_dir = st.text_input("Masks directory") if task == "seg" else None
+        output_dir = st.text_input("Output directory", value="export")
+        copies = st.number_input("Augmentations per sample", 1, 64, 4)
+        num_shards = st.number_input("Shards", 1, 1024, 8)
+        num_writers = st.number_input("Writer threads", 1, 32, 4)
+        image_format = st.selectbox("Image format", EXPORT_FORMATS)
+        submitted = st.form_submit_button("Export")
+    job = EXPORTS.get(session_id)
+    if submitted:
+        if job is not None and job.running():
+            st.warning("Wait for the running export to finish.")
+        elif not image_dir or (task == "bbox" and not annotations):
+            st.error("Enter the dataset location first.")
+            return
+        else:
+            try:
+                if task == "bbox":
+                    samples = samples_from_annotations(
+                        load_annotations(annotations), image_dir
+                    )
+                else:
+                    image_paths = list_image_files([image_dir])
+                    mask_paths = find_masks(image_paths, mask_dir) if mask_dir else None
+                    samples = samples_from_files(image_paths, mask_paths)
+            except (OSError, ValueError) as error:
+                st.error(f"Could not load the dataset: {error}")
+                return
+            job = EXPORTS[session_id] = ExportJob(
+                output_dir,
+                layer=layer,
+                samples=samples,
+                copies=int(copies),
+                num_shards=int(num_shards),
+                num_writers=int(num_writers),
+                image_format=image_format,
+                bounding_box_format=bounding_box_format,
+                metadata={"task": task},
+            )
+    if job is not None:
+        _display_export_job(job)
+        EXPORTS.pop(session_id, None)
+
+
+def _display_export_job(job: ExportJob):
+    # Updating the bar lets Streamlit stop this run when a widget changes;
+    # the export keeps going and the next run picks its progress up again.
+    progress_bar = st.progress(0.0)
+    while job.running():
+        fraction = job.done / job.total if job.total else 0.0
+        progress_bar.progress(
+            fraction, text=f"Exporting... {job.done}/{job.total} samples"
+        )
+        time.sleep(POLL_INTERVAL)
+    progress_bar.empty()
+    if job.error is not None:
+        st.error(
+            f"Export to {job.output_dir} failed, partial shards were removed: "
+            f"{type(job.error).__name__}: {job.error}"
+        )
+        return
+    manifest = job.manifest
+    st.success(
+        f"Wrote {manifest['records']} records to {len(manifest['shards'])} shards "
+        f"in {job.output_dir}"
+    )
@@ -0,0 +1,223 @@
+import threading
+import typing
+
+import cv2
+import numpy as np
+
+from utils.display_utils import to_uint8
+
+
+# tf.image.rgb_to_grayscale weights.
+GRAYSCALE_WEIGHTS = np.array([[0.2989, 0.587, 0.114]], dtype=np.float32)
+
+# tf.image.resize methods with an OpenCV equivalent. "nearest" has none (TF
+# floors float32 half-pixel coordinates), so it is gathered with NumPy.
+CV2_INTERPOLATIONS = {"bilinear": cv2.INTER_LINEAR, "area": cv2.INTER_AREA}
+
+
+def _factor_range(factor, min_value=0.0) -> typing.Tuple[float, float]:
+    """keras_cv's `parse_factor`: a scalar `f` means `(min_value, f)`."""
+    if isinstance(factor, (int, float)):
+        return float(min_value), float(factor)
+    return float(factor[0]), float(factor[1])
+
+
+def _full_range(layer_args: typing.Dict) -> bool:
+    return tuple(layer_args.get("value_range", (0, 255))) == (0, 255)
+
+
+class FastLayer:
+    """NumPy/OpenCV implementation of a keras_cv layer for uint8 images.
+
+    Subclasses follow the keras_cv layer's `layer_args` semantics and sample
+    the same distributions, but draw from a NumPy generator, so outputs are
+    statistically (not bitwise) equivalent. `supports` tells whether a set
+    of `layer_args` can be handled; anything else falls back to keras_cv.
+    Calls accept one image or a batch, as arrays or tensors, and return
+    uint8 arrays rounded like the keras_cv outputs.
+    """
+
+    execution_dtype = "uint8"
+
+    def __init__(self, layer_name: str, layer_args: typing.Dict, seed=None):
+        self.layer_name = layer_name
+        self.layer_args = dict(layer_args)
+        self._rng = np.random.default_rng(seed)
+        # Generators are not thread-safe and layers are shared by sessions.
+        self._lock = threading.Lock()
+
+    @classmethod
+    def supports(cls, layer_args: typing.Dict) -> bool:
+        return True
+
+    def uniform(self, low: float, high: float, size) -> np.ndarray:
+        with self._lock:
+            return self._rng.uniform(low, high, size)
+
+    def __call__(self, inputs):
+        if isinstance(inputs, dict):
+            return {**inputs, "images": self(inputs["images"])}
+        images = to_uint8(np.asarray(inputs))
+        if images.ndim == 3:
+            return self.augment(images[np.newaxis])[0]
+        return self.augment(images)
+
+    def augment(self, images: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+class FastRandomFlip(FastLayer):
+    def augment(self, images):
+        mode = self.layer_args.get("mode", "horizontal")
+        rate = self.layer_args.get("rate", 0.5)
+        outputs = images
+        for axis, flipped_mode in ((2, "horizontal"), (1, "vertical")):
+            if flipped_mode not in mode:
+                continue
+            flips = self.uniform(0, 1, len(images)) > 1.0 - rate
+            flipped = np.flip(outputs, axis=axis)
+            outputs = np.where(flips[:, None, None, None], flipped, outputs)
+        return np.ascontiguousarray(outputs)
+
+
+class FastGrayscale(FastLayer):
+    @classmethod
+    def supports(cls, layer_args):
+        return layer_args.get("output_channels", 1) in (1, 3)
+
+    def augment(self, images):
+        # cv2.transform rounds and saturates to uint8 like `round_to_uint8`.
+        gray = np.stack([cv2.transform(image, GRAYSCALE_WEIGHTS) for image in images])
+        gray = gray[..., np.newaxis]
+        if self.layer_args.get("output_channels", 1) == 3:
+            gray = np.repeat(gray, 3, axis=-1)
+        return gray
+
+
+class FastResizing(FastLayer):
+    @classmethod
+    def supports(cls, layer_args):
+        return (
+            layer_args.get("interpolation", "bilinear")
+            in (*CV2_INTERPOLATIONS, "nearest")
+            and not layer_args.get("crop_to_aspect_ratio", False)
+            and not layer_args.get("pad_to_aspect_ratio", False)
+        )
+
+    @staticmethod
+    def _nearest_indices(size: int, input_size: int) -> np.ndarray:
+        scale = np.float32(input_size) / np.float32(size)
+        centers = np.arange(size, dtype=np.float32) + np.float32(0.5)
+        return np.minimum(np.floor(centers * scale).astype(int), input_size - 1)
+
+    def augment(self, images):
+        height, width = self.layer_args["height"], self.layer_args["width"]
+        method = self.layer_args.get("interpolation", "bilinear")
+        if method == "nearest":
+            rows = self._nearest_indices(height, images.shape[1])
+            columns = self._nearest_indices(width, images.shape[2])
+            return np.ascontiguousarray(images[:, rows][:, :, columns])
+        size = (width, height)
+        interpolation = CV2_INTERPOLATIONS[method]
+        resized = [
+            cv2.resize(image, size, interpolation=interpolation) for image in images
+        ]
+        return np.stack(resized).reshape(len(images), size[1], size[0], -1)
+
+
+class _LookupLayer(FastLayer):
+    """Layers that map every pixel value through a per-image (and possibly
+    per-channel) table, applied to uint8 images with `cv2.LUT`.
+    """
+
+    @classmethod
+    def supports(cls, layer_args):
+        return _full_range(layer_args)
+
+    def tables(self, images: np.ndarray) -> np.ndarray:
+        """`(batch, channels, 256)` float tables of output values."""
+        raise NotImplementedError
+
+    def augment(self, images):
+        tables = to_uint8(np.clip(self.tables(images), 0, 255))
+        # cv2.LUT takes a `(1, 256, channels)` table and drops a single channel.
+        tables = np.ascontiguousarray(tables.transpose(0, 2, 1)[:, np.newaxis])
+        outputs = np.stack(
+            [cv2.LUT(image, table) for table, image in zip(tables, images)]
+        )
+        return outputs.reshape(images.shape)
+
+
+class FastRandomBrightness(_LookupLayer):
+    def tables(self, images):
+        factor = self.layer_args["factor"]
+        if isinstance(factor, (int, float)):
+            factor = (-factor, factor)
+        deltas = 255.0 * self.uniform(factor[0], factor[1], len(images))
+        values = np.arange(256, dtype=np.float32)
+        tables = values[np.newaxis] + deltas[:, np.newaxis]
+        return np.repeat(tables[:, np.newaxis], images.shape[-1], axis=1)
+
+
+class FastRandomContrast(_LookupLayer):
+    def tables(self, images):
+        factor = self.layer_args["factor"]
+        lower, upper = (factor, factor) if isinstance(factor, (int, float)) else factor
+        factors = self.uniform(1 - lower, 1 + upper, len(images))
+        means = images.mean(axis=(1, 2), dtype=np.float32)
+        means = means[..., np.newaxis]
+        values = np.arange(256, dtype=np.float32)
+        return (values - means) * factors[:, np.newaxis, np.newaxis] + means
+
+
+class FastSolarization(_LookupLayer):
+    def tables(self, images):
+        additions = self.uniform(
+            *_factor_range(self.layer_args.get("addition_factor", 0.0)), len(images)
+        )
+        thresholds = self.uniform(
+            *_factor_range(self.layer_args.get("threshold_factor", 0.0)), len(images)
+        )
+        values = np.arange(256, dtype=np.float32)
+        results = np.clip(values[np.newaxis] + additions[:, np.newaxis], 0, 255)
+        tables = np.where(results < thresholds[:, np.newaxis], results, 255 - results)
+        return np.repeat(tables[:, np.newaxis], images.shape[-1], axis=1)
+
+
+class FastChannelShuffle(FastLayer):
+    def augment(self, images):
+        groups = self.layer_args.get("groups", 3)
+        batch_size, height, width, channels = images.shape
+        if channels % groups:
+            raise ValueError(
+                "The number of input channels should be divisible by the number "
+                f"of groups. Received: channels={channels}, groups={groups}"
+            )
+        orders = np.argsort(self.uniform(0, 1, (batch_size, groups)), axis=-1)
+        grouped = images.reshape(batch_size, height, width, groups, -1)
+        shuffled = np.stack(
+            [image[..., order, :] for image, order in zip(grouped, orders)]
+        )
+        return shuffled.reshape(images.shape)
+
+
+FAST_LAYERS = {
+    "ChannelShuffle": FastChannelShuffle,
+    "Grayscale": FastGrayscale,
+    "RandomBrightness": FastRandomBrightness,
+    "RandomContrast": FastRandomContrast,
+    "RandomFlip": FastRandomFlip,
+    "Resizing": FastResizing,
+    "Solarization": FastSolarization,
+}
+
+
+def fast_layer_cls(layer_cls, layer_args: typing.Dict):
+    """The `FastLayer` class for a config's `layer_cls` and `layer_args`, or
+    None if they need keras_cv.
+    """
+    name = layer_cls if isinstance(layer_cls, str) else layer_cls.__name__
+    fast_cls = FAST_LAYERS.get(name)
+    if fast_cls is None or not fast_cls.supports(layer_args):
+        return None
+    return fast_cls
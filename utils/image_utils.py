@@ -1,76 +1,128 @@
-import io
-import os
 import typing
 
 import numpy as np
 import streamlit as st
-import tensorflow as tf
-from PIL import Image
 
-from configs.img_config import LAYERS_CONFIG
-
-
-def download_images():
-    image_folder = "images/"
-    default_images = {}
-
-    for filename in os.listdir(image_folder):
-        if (
-            filename.endswith(".jpg")
-            or filename.endswith(".jpeg")
-            or filename.endswith(".png")
-        ):
-            image_path = os.path.join(image_folder, filename)
-            with open(image_path, "rb") as f:
-                default_images[filename] = f.read()
-    return default_images
+from configs.img_config import LAYERS_CONFIG, PIPELINES_CONFIG
+from utils.catalog_utils import get_catalog
+from utils.decode_utils import decode_image
+from utils.display_utils import make_grid, resize_to_max_side, show_image
+from utils.fast_utils import FastLayer
+from utils.layer_utils import get_fast_layer, get_layer, get_seeded_layer
+from utils.lazy_utils import keras_cv, tf, wait_for
+from utils.pipeline_utils import select_pipeline
+from utils.precision_utils import (
+    DEFAULT_DTYPE,
+    round_to_uint8,
+    select_dtype,
+    supported_dtypes,
+    to_layer_input,
+)
+from utils.result_cache_utils import cached_result, select_seed
+from utils.timing_utils import TIMINGS
+from utils.worker_utils import Job, job_token, render_job
+
+
+IMAGE_FOLDER = "images/"
+DEFAULT_IMAGE = "cat.jpeg"
+
+
+def process_image(image, layer, num_samples=1):
+    """Apply `layer` to `image`. With `num_samples > 1` the image is tiled into
+    a batch and augmented in a single layer call, returning a batch of
+    independently augmented samples. Results of seeded layers are cached.
+    """
+    return cached_result(
+        "image",
+        layer,
+        lambda: _process_image(image, layer, num_samples),
+        image,
+        num_samples,
+    )
 
 
-def process_image(image, layer):
-    processed_image = layer(image)
-    processed_image: np.ndarray = processed_image.numpy()
-    processed_image = np.round(processed_image).astype(np.uint8)
+def _process_image(image, layer, num_samples=1):
+    if isinstance(layer, FastLayer):
+        # NumPy/OpenCV path: no tensor conversion or TF dispatch.
+        with TIMINGS.stage("image", "layer", layer, image):
+            if num_samples > 1:
+                image = np.repeat(image[np.newaxis], num_samples, axis=0)
+            return layer(image)
+
+    with TIMINGS.stage("image", "to_tensor", layer, image):
+        image = to_layer_input(image, layer)
+        if num_samples > 1:
+            image = tf.repeat(tf.expand_dims(image, axis=0), num_samples, axis=0)
+    with TIMINGS.stage("image", "layer", layer, image):
+        processed_image = layer(image)
+        processed_image: np.ndarray = round_to_uint8(processed_image).numpy()
     return processed_image
 
 
-def image_aug(image_dict=download_images()):
+def image_aug(catalog=None):
+    if catalog is None:
+        catalog = get_catalog(IMAGE_FOLDER)
+
     st.subheader("Select an Image")
     image_option = st.selectbox(
         "Select an option",
-        ["Default Image"] + list(image_dict.keys()),
+        ["Default Image"] + catalog.names(),
         index=0,
         key="image_option",
     )
     uploaded_image = None
-    if image_option == "Default Image":
-        image = Image.open(io.BytesIO(image_dict["cat.jpeg"]))
-    else:
+    if image_option != "Default Image":
         with st.expander("Upload an image"):
             uploaded_image = st.file_uploader("", type=["jpg", "jpeg", "png"])
+
+    with TIMINGS.stage("image", "decode") as timing:
         if uploaded_image is not None:
-            image = Image.open(uploaded_image)
+            image = decode_image(uploaded_image)
+        elif image_option == "Default Image":
+            image = catalog.load_image(DEFAULT_IMAGE)
         else:
-            image = Image.open(io.BytesIO(image_dict[image_option]))
+            image = catalog.load_image(image_option)
+        timing.image = image
 
     layer = select_layer_for_image_aug()
     return layer, image
 
 
-def display_aug_image(layer, image):
+def display_aug_image(layer, image, num_samples=1, preview=False):
+    if preview:
+        image, _ = resize_to_max_side(image)
+
     col1, col2, col3 = st.columns([1, 0.1, 1])
 
     with col1:
         st.subheader("Original Image")
-        st.image(image, use_column_width=True)
+        with TIMINGS.stage("image", "display", layer, image):
+            show_image(image)
+
+    def render(processed_image):
+        with TIMINGS.stage("image", "display", layer, image):
+            show_image(make_grid(processed_image))
 
     with col3:
         st.subheader("Processed Image")
-        processed_image = process_image(image, layer)
-        st.image(processed_image, use_column_width=True)
+        job = Job(
+            process_image,
+            (image, layer),
+            {"num_samples": num_samples},
+            token=job_token(image, layer, num_samples),
+        )
+        render_job("image", job, render)
 
 
 def select_layer_for_image_aug():
     st.subheader("Select a Layer")
+    mode = st.radio(
+        "Mode", ["Single layer", "Pipeline"], horizontal=True, key="layer_mode"
+    )
+    if mode == "Pipeline":
+        wait_for(keras_cv)
+        return select_pipeline("image", LAYERS_CONFIG, PIPELINES_CONFIG)
+
     layer_option = st.selectbox(
         "Select an option", list(LAYERS_CONFIG.keys()), index=0, key="layer_option"
     )
@@ -78,7 +130,36 @@ def select_layer_for_image_aug():
     layer_args = LAYERS_CONFIG[layer_option]["layer_args"]
     control_args = LAYERS_CONFIG[layer_option]["control_args"]
     layer_args = set_control_args(control_args, layer_args)
-    layer = layer_cls(**layer_args)
+    dtype = select_dtype(
+        supported_dtypes(LAYERS_CONFIG[layer_option]), key="execution_dtype"
+    )
+    compiled = st.checkbox(
+        "Compiled mode (tf.function)",
+        key="compiled_mode",
+        help="Run the layer as a graph, with inputs bucketed to a few fixed "
+        "resolutions so new image sizes do not trigger retracing.",
+    )
+    seed = select_seed()
+    if seed is None and not compiled and dtype == DEFAULT_DTYPE:
+        fast_layer = get_fast_layer(layer_option, layer_cls, layer_args)
+        if fast_layer is not None and st.checkbox(
+            "NumPy/OpenCV fast path",
+            value=True,
+            key="fast_path",
+            help="Run this layer without TensorFlow for near-instant previews. "
+            "Outputs are statistically equivalent to keras_cv, not identical.",
+        ):
+            return fast_layer
+
+    wait_for(keras_cv)
+    if seed is not None:
+        layer = get_seeded_layer(layer_option, layer_cls, layer_args, seed, dtype)
+    else:
+        layer = get_layer(
+            layer_option, layer_cls, layer_args, compiled=compiled, dtype=dtype
+        )
+    if compiled and seed is None:
+        st.caption(f"Graphs traced so far: {layer.trace_count}")
     return layer
 
 
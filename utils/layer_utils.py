@@ -0,0 +1,187 @@
+import inspect
+import threading
+import typing
+
+from configs import bbox_config, img_config, seg_config
+from utils.cache_utils import LRUCache
+from utils.compile_utils import CompiledLayer
+from utils.fast_utils import fast_layer_cls
+from utils.lazy_utils import resolve_layer_cls, tf
+from utils.precision_utils import DEFAULT_DTYPE, supported_dtypes
+
+
+LAYER_CACHE = LRUCache(max_entries=32)
+
+# Layers whose output a seed does not pin down, so their seeded results are
+# never cached.
+NONDETERMINISTIC_LAYERS = ("AugMix", "GridMask")
+
+# Seeded calls reset the global TensorFlow seed, which keras_cv's factor
+# samplers draw from, so only one runs at a time.
+_SEED_LOCK = threading.Lock()
+
+TASK_CONFIGS = {
+    "image": img_config.LAYERS_CONFIG,
+    "bbox": bbox_config.LAYERS_CONFIG,
+    "seg": seg_config.LAYERS_CONFIG,
+}
+
+TASK_PIPELINES = {
+    "image": img_config.PIPELINES_CONFIG,
+    "bbox": bbox_config.PIPELINES_CONFIG,
+    "seg": seg_config.PIPELINES_CONFIG,
+}
+
+
+def freeze_args(value):
+    """Convert `layer_args` into a canonical, hashable form usable as a cache
+    key. Dicts are sorted by key and lists become tuples so that
+    `{"severity": [0.01, 0.3]}` and `{"severity": (0.01, 0.3)}` map to the
+    same layer.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze_args(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze_args(item) for item in value)
+    return value
+
+
+def _build_layer(layer_cls, layer_args: typing.Dict, dtype: str, **kwargs):
+    layer_cls = resolve_layer_cls(layer_cls)
+    if dtype != DEFAULT_DTYPE:
+        kwargs["dtype"] = dtype
+    return layer_cls(**layer_args, **kwargs)
+
+
+def get_layer(
+    layer_name: str,
+    layer_cls,
+    layer_args: typing.Dict,
+    compiled: bool = False,
+    dtype: str = DEFAULT_DTYPE,
+):
+    """Return a built layer for `layer_name` and `layer_args`, reusing the
+    instance (and the graphs it has already traced) across reruns and
+    sessions. `layer_cls` may be a class or a `keras_cv.layers` name, which
+    is only imported when the layer is first built.
+
+    With `compiled=True` the layer is wrapped in a `CompiledLayer`, which runs
+    it as a shape-bucketed `tf.function`. `dtype` is the execution dtype the
+    layer computes in and expects its images in.
+    """
+    key = (layer_name, freeze_args(layer_args), dtype)
+    layer_args = dict(layer_args)
+    layer = LAYER_CACHE.get_or_create(
+        key, lambda: _build_layer(layer_cls, layer_args, dtype)
+    )
+    if not compiled:
+        return layer
+    return LAYER_CACHE.get_or_create(
+        key + ("compiled",), lambda: CompiledLayer(layer, layer_name)
+    )
+
+
+class SeededLayer:
+    """Deterministic variant of a layer: the instance is built once with
+    `seed`, and its random generator and the global TensorFlow seed are reset
+    to `seed` before every call, so equal inputs always give equal outputs.
+    Its `cache_key` identifies the result for the on-disk result cache; it is
+    None for `NONDETERMINISTIC_LAYERS`, whose results are not reproducible.
+    """
+
+    def __init__(
+        self,
+        layer_name: str,
+        layer_cls,
+        layer_args: typing.Dict,
+        seed: int,
+        dtype: str = DEFAULT_DTYPE,
+    ):
+        self.layer_name = layer_name
+        self.layer_cls = layer_cls
+        self.layer_args = dict(layer_args)
+        self.seed = seed
+        self.execution_dtype = dtype
+        cls_name = getattr(layer_cls, "__name__", layer_cls)
+        self.deterministic = cls_name not in NONDETERMINISTIC_LAYERS
+        self.cache_key = (
+            (layer_name, freeze_args(layer_args), seed, dtype)
+            if self.deterministic
+            else None
+        )
+        self._layer = None
+        self._seeded = False
+
+    def _get_layer(self):
+        if self._layer is None:
+            layer_cls = resolve_layer_cls(self.layer_cls)
+            kwargs = {}
+            # Deterministic layers such as `Resizing` take no `seed`.
+            if "seed" in inspect.signature(layer_cls).parameters:
+                kwargs["seed"] = self.seed
+            self._layer = _build_layer(
+                layer_cls, self.layer_args, self.execution_dtype, **kwargs
+            )
+            self._seeded = "seed" in kwargs
+        return self._layer
+
+    def __call__(self, inputs):
+        with _SEED_LOCK:
+            layer = self._get_layer()
+            if self._seeded:
+                generator = getattr(layer, "_random_generator", None)
+                if hasattr(generator, "reset_from_seed"):
+                    generator.reset_from_seed(self.seed)
+                tf.random.set_seed(self.seed)
+            return layer(inputs)
+
+
+def get_seeded_layer(
+    layer_name: str,
+    layer_cls,
+    layer_args: typing.Dict,
+    seed: int,
+    dtype: str = DEFAULT_DTYPE,
+) -> SeededLayer:
+    key = (layer_name, freeze_args(layer_args), "seed", seed, dtype)
+    return LAYER_CACHE.get_or_create(
+        key, lambda: SeededLayer(layer_name, layer_cls, layer_args, seed, dtype)
+    )
+
+
+def get_fast_layer(layer_name: str, layer_cls, layer_args: typing.Dict):
+    """Return the cached NumPy/OpenCV `FastLayer` for `layer_name`, or None if
+    the layer or its args are not covered by the fast path.
+    """
+    fast_cls = fast_layer_cls(layer_cls, layer_args)
+    if fast_cls is None:
+        return None
+    key = (layer_name, freeze_args(layer_args), "fast")
+    return LAYER_CACHE.get_or_create(key, lambda: fast_cls(layer_name, layer_args))
+
+
+def get_layer_from_config(
+    task: str,
+    layer_name: str,
+    overrides: typing.Optional[typing.Dict] = None,
+    compiled: bool = False,
+    dtype: str = DEFAULT_DTYPE,
+):
+    """Build `layer_name` from the `LAYERS_CONFIG` of `task` ("image", "bbox"
+    or "seg"), with `overrides` applied on top of its default `layer_args`.
+    """
+    layers_config = TASK_CONFIGS[task]
+    if layer_name not in layers_config:
+        raise ValueError(
+            f"Unknown layer {layer_name!r} for task {task!r}. "
+            f"Available layers: {', '.join(layers_config)}"
+        )
+    layer_config = layers_config[layer_name]
+    if dtype not in supported_dtypes(layer_config):
+        raise ValueError(
+            f"{layer_name!r} does not run in {dtype!r}. "
+            f"Supported dtypes: {', '.join(supported_dtypes(layer_config))}"
+        )
+    layer_args = {**layer_config["layer_args"], **(overrides or {})}
+    layer_cls = layer_config["layer_cls"]
+    return get_layer(layer_name, layer_cls, layer_args, compiled=compiled, dtype=dtype)
@@ -0,0 +1,143 @@
+import contextlib
+import importlib
+import sys
+import threading
+import time
+import typing
+
+import streamlit as st
+
+
+# Reference point for the startup report; this module is imported first.
+PROCESS_START = time.perf_counter()
+
+
+class StartupTimes:
+    """One-off durations recorded while the app starts, e.g. how long each
+    heavy import took and on which thread. Entries are only recorded once,
+    so Streamlit reruns do not overwrite them with near-zero times.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            self._entries.setdefault(
+                name,
+                {
+                    "name": name,
+                    "ms": 1000 * seconds,
+                    "at_ms": 1000 * (time.perf_counter() - PROCESS_START),
+                    "thread": threading.current_thread().name,
+                },
+            )
+
+    def mark(self, name: str):
+        """Record the time since process start, e.g. when the shell renders."""
+        self.record(name, time.perf_counter() - PROCESS_START)
+
+    @contextlib.contextmanager
+    def timed(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def report(self) -> typing.List[typing.Dict]:
+        with self._lock:
+            return sorted(self._entries.values(), key=lambda entry: entry["at_ms"])
+
+
+STARTUP = StartupTimes()
+
+
+class LazyModule:
+    """Stand-in for a heavy module that imports it on first attribute access.
+
+    `requires` are loaded first, and `on_load` callbacks run once right after
+    the import, before any other thread can use the module (e.g. to hide
+    GPUs before TensorFlow initializes its devices).
+    """
+
+    def __init__(self, name: str, requires: typing.Sequence["LazyModule"] = ()):
+        self._name = name
+        self._requires = tuple(requires)
+        self._module = None
+        self._on_load = []
+        self._lock = threading.RLock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def on_load(self, callback: typing.Callable):
+        with self._lock:
+            if self._module is not None:
+                callback(self._module)
+            else:
+                self._on_load.append(callback)
+
+    def load(self):
+        module = self._module
+        if module is not None:
+            return module
+        for requirement in self._requires:
+            requirement.load()
+        with self._lock:
+            if self._module is None:
+                already_imported = self._name in sys.modules
+                start = time.perf_counter()
+                module = importlib.import_module(self._name)
+                if not already_imported:
+                    STARTUP.record(f"import {self._name}", time.perf_counter() - start)
+                for callback in self._on_load:
+                    callback(module)
+                self._module = module
+            return self._module
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<LazyModule {self._name!r} ({state})>"
+
+
+tf = LazyModule("tensorflow")
+keras_cv = LazyModule("keras_cv", requires=(tf,))
+
+_warm_up_thread = None
+
+
+def warm_up(modules: typing.Sequence[LazyModule] = (tf, keras_cv)):
+    """Import `modules` on a background thread so they are usually ready by
+    the time a layer is needed, without delaying the first page render.
+    """
+    global _warm_up_thread
+    if _warm_up_thread is None:
+        _warm_up_thread = threading.Thread(
+            target=lambda: [module.load() for module in modules],
+            name="warm-up",
+            daemon=True,
+        )
+        _warm_up_thread.start()
+
+
+def wait_for(module: LazyModule):
+    """Load `module`, showing a spinner if it is still being imported."""
+    if module.loaded:
+        return module.load()
+    with st.spinner("Loading TensorFlow and KerasCV..."):
+        return module.load()
+
+
+def resolve_layer_cls(layer_cls):
+    """Configs name layers symbolically ("RandomFlip"); resolve such names to
+    `keras_cv.layers` classes. Classes are returned unchanged.
+    """
+    if isinstance(layer_cls, str):
+        return getattr(keras_cv.layers, layer_cls)
+    return layer_cls
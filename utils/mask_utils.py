@@ -0,0 +1,123 @@
+import io
+import os
+import typing
+
+import numpy as np
+from PIL import Image
+
+from utils.decode_utils import DECODED_IMAGE_CACHE, content_hash
+
+# Class ids are stored as uint8, so a mask can hold at most this many colors.
+MAX_CLASSES = 256
+
+
+class ClassMask(typing.NamedTuple):
+    """A segmentation mask as a `(H, W)` uint8 class-id array plus the
+    `(num_classes, 3)` uint8 palette that maps ids back to colors.
+    """
+
+    ids: np.ndarray
+    palette: np.ndarray
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + self.palette.nbytes
+
+
+def pack_colors(rgb) -> np.ndarray:
+    """Pack `(..., 3)` uint8 colors into single uint32 codes."""
+    rgb = np.asarray(rgb, dtype=np.uint32)
+    return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+
+def encode_mask(rgb, palette=None) -> ClassMask:
+    """Map an RGB mask to class ids through a color-to-id table.
+
+    Without a `palette` the table is built from the colors present in the
+    mask, in sorted order. With one, colors missing from it map to class 0.
+    """
+    codes = pack_colors(np.asarray(rgb)[..., :3])
+    if palette is None:
+        palette_codes, ids = np.unique(codes, return_inverse=True)
+        if len(palette_codes) > MAX_CLASSES:
+            raise ValueError(
+                f"Mask has {len(palette_codes)} colors, at most {MAX_CLASSES} "
+                "classes are supported"
+            )
+        palette = np.stack(
+            [palette_codes >> 16, (palette_codes >> 8) & 255, palette_codes & 255],
+            axis=-1,
+        ).astype(np.uint8)
+    else:
+        palette = np.asarray(palette, dtype=np.uint8).reshape(-1, 3)
+        palette_codes = pack_colors(palette)
+        order = np.argsort(palette_codes)
+        sorted_codes = palette_codes[order]
+        positions = np.searchsorted(sorted_codes, codes).clip(0, len(order) - 1)
+        ids = np.where(sorted_codes[positions] == codes, order[positions], 0)
+    ids = ids.reshape(codes.shape).astype(np.uint8)
+    return ClassMask(ids, palette)
+
+
+def colorize_mask(ids, palette) -> np.ndarray:
+    """Turn class ids of any shape `(...)` or `(..., 1)` into RGB colors.
+    Ids outside the palette (e.g. from interpolation) are clipped to it.
+    """
+    ids = np.asarray(ids)
+    if ids.ndim and ids.shape[-1] == 1:
+        ids = ids[..., 0]
+    ids = np.clip(np.rint(ids), 0, len(palette) - 1).astype(np.intp)
+    return np.asarray(palette)[ids]
+
+
+def decode_mask(
+    content, key: typing.Optional[typing.Hashable] = None, cache: bool = True
+) -> ClassMask:
+    """Decode an encoded mask (bytes, a memory map or an `UploadedFile`)
+    straight to class ids. Palette PNGs use their stored indices and palette;
+    other images are mapped through `encode_mask`. Only the compact result
+    is cached, unless `cache=False`.
+    """
+    if hasattr(content, "getvalue"):
+        content = content.getvalue()
+
+    def decode():
+        stream = content if hasattr(content, "seek") else io.BytesIO(content)
+        image = Image.open(stream)
+        if image.mode == "P":
+            ids = np.asarray(image, dtype=np.uint8)
+            palette = np.asarray(image.getpalette(), dtype=np.uint8).reshape(-1, 3)
+            mask = ClassMask(ids, palette[: int(ids.max()) + 1])
+        else:
+            mask = encode_mask(np.asarray(image.convert("RGB")))
+        mask.ids.flags.writeable = False
+        mask.palette.flags.writeable = False
+        return mask
+
+    if not cache:
+        return decode()
+    if key is None:
+        key = content_hash(content)
+    return DECODED_IMAGE_CACHE.get_or_create(("mask", key), decode)
+
+
+def decode_mask_file(path: str, cache: bool = True) -> ClassMask:
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with open(path, "rb") as f:
+        return decode_mask(f, key=key, cache=cache)
+
+
+def encode_mask_png(ids, palette) -> bytes:
+    """Encode `(H, W)` class ids as a palette PNG, the format `decode_mask`
+    reads back to the same ids and palette.
+    """
+    ids = np.asarray(ids, dtype=np.uint8)
+    if ids.ndim == 3:
+        ids = ids[..., 0]
+    image = Image.fromarray(np.ascontiguousarray(ids))
+    # `putpalette` turns the "L" image into a "P" one.
+    image.putpalette(np.asarray(palette, dtype=np.uint8).reshape(-1).tolist())
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
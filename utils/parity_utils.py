@@ -0,0 +1,421 @@
+import typing
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from utils.catalog_utils import get_catalog
+from utils.fast_utils import fast_layer_cls
+from utils.layer_utils import TASK_CONFIGS, SeededLayer, get_layer
+from utils.precision_utils import (
+    DEFAULT_DTYPE,
+    EXECUTION_DTYPES,
+    round_to_uint8,
+    supported_dtypes,
+)
+
+
+def make_inputs(task: str, height: int, width: int, batch_size: int, seed: int = 0):
+    """Random inputs shaped like the ones the demo pages pass to the layer."""
+    rng = np.random.default_rng(seed)
+    images = tf.constant(
+        rng.integers(0, 256, (batch_size, height, width, 3)), dtype=tf.float32
+    )
+    if task == "image":
+        return images
+    if task == "bbox":
+        boxes = np.stack(
+            [
+                rng.uniform(0, width / 2, (batch_size, 4)),
+                rng.uniform(0, height / 2, (batch_size, 4)),
+                rng.uniform(1, width / 2, (batch_size, 4)),
+                rng.uniform(1, height / 2, (batch_size, 4)),
+            ],
+            axis=-1,
+        )
+        return {
+            "images": images,
+            "bounding_boxes": {
+                "boxes": tf.constant(boxes, dtype=tf.float32),
+                "classes": tf.zeros((batch_size, 4)),
+            },
+        }
+    masks = tf.constant(
+        rng.integers(0, 4, (batch_size, height, width, 1)), dtype=tf.float32
+    )
+    return {"images": images, "segmentation_masks": masks}
+
+
+def sample_photos(height: int, width: int, batch_size: int):
+    """The bundled photos resized to `height` x `width`. Unlike uniform noise
+    they have the flat regions and narrow value ranges in which reduced
+    precision drifts, e.g. `RandomContrast` in float16.
+    """
+    catalog = get_catalog("images/")
+    names = catalog.names()
+    photos = [
+        cv2.resize(
+            catalog.load_image(names[i % len(names)]),
+            (width, height),
+            interpolation=cv2.INTER_AREA,
+        )
+        for i in range(batch_size)
+    ]
+    return tf.constant(np.stack(photos), dtype=tf.float32)
+
+
+def cast_images(inputs, dtype: str):
+    if isinstance(inputs, dict):
+        # Copy the boxes too: keras_cv casts them in place to its compute dtype.
+        inputs = {
+            key: dict(value) if isinstance(value, dict) else value
+            for key, value in inputs.items()
+        }
+        return {**inputs, "images": tf.cast(inputs["images"], dtype)}
+    return tf.cast(inputs, dtype)
+
+
+def _images_and_boxes(outputs):
+    if not isinstance(outputs, dict):
+        return np.asarray(round_to_uint8(outputs)), None
+    boxes = outputs.get("bounding_boxes")
+    if boxes is not None:
+        boxes = boxes["boxes"]
+        if isinstance(boxes, tf.RaggedTensor):
+            boxes = boxes.to_tensor(default_value=-1)
+        boxes = np.asarray(tf.cast(boxes, tf.float32))
+    return np.asarray(round_to_uint8(outputs["images"])), boxes
+
+
+# Arguments that make each layer actually change the image; most configs
+# default to a no-op factor of 0.0, which would trivially match float32.
+DTYPE_PARITY_CASES = {
+    "image": {
+        "RandomChannelShift": {"factor": 0.5},
+        "RandomColorDegeneration": {"factor": 0.5},
+        "RandomHue": {"factor": 0.5},
+        "RandomSaturation": {"factor": 0.5},
+        "RandomContrast": {"factor": 0.5},
+        "RandomBrightness": {"factor": 0.5},
+        "RandomSharpness": {"factor": 0.5},
+        "RandomShear": {"x_factor": 0.3, "y_factor": 0.3},
+        "RandomRotation": {"factor": 0.2},
+        "RandomTranslation": {"height_factor": 0.2, "width_factor": 0.2},
+        "Solarization": {"addition_factor": 0.3, "threshold_factor": 0.3},
+        "Equalization": {"bins": 128},
+    },
+    "bbox": {
+        "RandomShear": {"x_factor": 0.3, "y_factor": 0.3},
+        "RandomRotation": {"factor": 0.2},
+        "RandomTranslation": {"height_factor": 0.2, "width_factor": 0.2},
+    },
+}
+
+
+def parity_report(
+    task: str,
+    layer_name: str,
+    dtypes: typing.Sequence[str] = EXECUTION_DTYPES,
+    height: int = 256,
+    width: int = 256,
+    batch_size: int = 4,
+    seed: int = 1,
+    tolerance: float = 1.0,
+    p99_tolerance: int = 2,
+) -> typing.List[typing.Dict]:
+    """Compare a layer's uint8-rounded outputs in each of `dtypes` against
+    float32 on the same photos, using seeded layers so random transforms
+    match.
+
+    Layers run with their `DTYPE_PARITY_CASES` arguments. A dtype is `valid`
+    if the layer runs in it, the mean absolute pixel difference is at most
+    `tolerance` and 99% of pixels are within `p99_tolerance`; `supported` is
+    whether the layer's config offers it. Layers whose seeded float32 output is not reproducible
+    (e.g. `AugMix`) are marked `deterministic: False` and only have to run.
+    The layer must also run as a `CompiledLayer` in the dtype, with float32
+    bounding boxes.
+    """
+    layer_config = TASK_CONFIGS[task][layer_name]
+    layer_cls = layer_config["layer_cls"]
+    case_args = DTYPE_PARITY_CASES.get(task, {}).get(layer_name, {})
+    layer_args = {**layer_config["layer_args"], **case_args}
+    inputs = make_inputs(task, height, width, batch_size)
+    photos = sample_photos(height, width, batch_size)
+    inputs = {**inputs, "images": photos} if isinstance(inputs, dict) else photos
+
+    def run(dtype):
+        layer = SeededLayer(layer_name, layer_cls, layer_args, seed, dtype)
+        return _images_and_boxes(layer(cast_images(inputs, dtype)))
+
+    def run_compiled(dtype):
+        layer = get_layer(layer_name, layer_cls, layer_args, compiled=True, dtype=dtype)
+        outputs = layer(cast_images(inputs, dtype))
+        if isinstance(outputs, dict) and "bounding_boxes" in outputs:
+            boxes_dtype = outputs["bounding_boxes"]["boxes"].dtype
+            if boxes_dtype != tf.float32:
+                raise TypeError(f"compiled boxes are {boxes_dtype.name}")
+
+    reference, reference_boxes = run(DEFAULT_DTYPE)
+    deterministic = np.array_equal(run(DEFAULT_DTYPE)[0], reference)
+    report = []
+    for dtype in dtypes:
+        result = {
+            "task": task,
+            "layer": layer_name,
+            "dtype": dtype,
+            "layer_args": case_args,
+            "supported": dtype in supported_dtypes(layer_config),
+            "deterministic": deterministic,
+        }
+        try:
+            images, boxes = run(dtype)
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}".splitlines()[0]
+            result["valid"] = False
+            report.append(result)
+            continue
+        if images.shape != reference.shape:
+            result["error"] = f"output shape {images.shape} != {reference.shape}"
+            result["valid"] = False
+            report.append(result)
+            continue
+        diff = np.abs(images.astype(np.int16) - reference.astype(np.int16))
+        result.update(
+            {
+                "max_abs_diff": int(diff.max()),
+                "mean_abs_diff": float(diff.mean()),
+                "p99_abs_diff": int(np.percentile(diff, 99)),
+                "exact_fraction": float(np.mean(diff == 0)),
+            }
+        )
+        if boxes is not None and boxes.shape == reference_boxes.shape:
+            result["max_box_diff"] = float(np.max(np.abs(boxes - reference_boxes)))
+        result["valid"] = not deterministic or (
+            result["mean_abs_diff"] <= tolerance
+            and result["p99_abs_diff"] <= p99_tolerance
+        )
+        try:
+            run_compiled(dtype)
+        except Exception as e:
+            result["compiled_error"] = f"{type(e).__name__}: {e}".splitlines()[0]
+            result["valid"] = False
+        report.append(result)
+    return report
+
+
+def format_parity(result: typing.Dict) -> str:
+    name = f"{result['task']}/{result['layer']} {result['dtype']}"
+    flags = "supported" if result["supported"] else "not offered"
+    if "error" in result:
+        return f"{name} ({flags}): {result['error']}"
+    if not result["deterministic"]:
+        line = f"{name} ({flags}): runs; nondeterministic, parity not measured"
+    else:
+        line = (
+            f"{name} ({flags}): max {result['max_abs_diff']} "
+            f"p99 {result['p99_abs_diff']} mean {result['mean_abs_diff']:.3f} "
+            f"exact {result['exact_fraction']:.1%}"
+        )
+    if "compiled_error" in result:
+        line += f"; compiled: {result['compiled_error']}"
+    return line + ("" if result["valid"] else " INVALID")
+
+
+# Deterministic arguments for layers outside `POINTWISE_LAYERS`, run at a
+# size that is not a resolution bucket so a `CompiledLayer` would have to pad
+# or resample if it bucketed them.
+COMPILED_PARITY_CASES = {
+    "image": {
+        "AutoContrast": {},
+        "RandomRotation": {"factor": (0.125, 0.125), "fill_mode": "constant"},
+        "RandomTranslation": {
+            "height_factor": (0.1, 0.1),
+            "width_factor": (-0.2, -0.2),
+        },
+        "Resizing": {"height": 150, "width": 130},
+    },
+    "bbox": {
+        "RandomRotation": {"factor": (0.125, 0.125)},
+    },
+}
+
+
+def compiled_parity_report(
+    task: str,
+    layer_name: str,
+    height: int = 260,
+    width: int = 1000,
+    batch_size: int = 2,
+    tolerance: float = 0.0,
+) -> typing.Dict:
+    """Compare a `CompiledLayer` with the eager layer on the deterministic
+    `COMPILED_PARITY_CASES` arguments of `layer_name`; `valid` if the mean
+    absolute difference of the uint8 outputs is at most `tolerance`.
+    """
+    layer_config = TASK_CONFIGS[task][layer_name]
+    case_args = COMPILED_PARITY_CASES[task][layer_name]
+    layer_args = {**layer_config["layer_args"], **case_args}
+    inputs = make_inputs(task, height, width, batch_size)
+    result = {"task": task, "layer": layer_name, "layer_args": case_args}
+    try:
+        reference, reference_boxes = _images_and_boxes(
+            get_layer(layer_name, layer_config["layer_cls"], layer_args)(
+                cast_images(inputs, DEFAULT_DTYPE)
+            )
+        )
+        images, boxes = _images_and_boxes(
+            get_layer(layer_name, layer_config["layer_cls"], layer_args, compiled=True)(
+                cast_images(inputs, DEFAULT_DTYPE)
+            )
+        )
+    except Exception as e:
+        result.update(valid=False, error=f"{type(e).__name__}: {e}".splitlines()[0])
+        return result
+    if images.shape != reference.shape:
+        result.update(
+            valid=False, error=f"output shape {images.shape} != {reference.shape}"
+        )
+        return result
+    diff = np.abs(images.astype(np.int16) - reference.astype(np.int16))
+    result["max_abs_diff"] = int(diff.max())
+    result["mean_abs_diff"] = float(diff.mean())
+    if boxes is not None and boxes.shape == reference_boxes.shape:
+        result["max_box_diff"] = float(np.max(np.abs(boxes - reference_boxes)))
+    result["valid"] = result["mean_abs_diff"] <= tolerance
+    return result
+
+
+def format_compiled_parity(result: typing.Dict) -> str:
+    name = f"compiled/{result['task']}/{result['layer']}"
+    if "error" in result:
+        return f"{name}: {result['error']}"
+    summary = f"max {result['max_abs_diff']} mean {result['mean_abs_diff']:.3f}"
+    if "max_box_diff" in result:
+        summary += f" boxes {result['max_box_diff']:.3f}"
+    return f"{name}: {summary}{'' if result['valid'] else ' INVALID'}"
+
+
+# Arguments exercising each fast-path layer: "fixed" cases have no
+# randomness and must match keras_cv to within rounding; "random" cases are
+# compared by the distribution of per-sample output statistics.
+FAST_PARITY_CASES = {
+    "ChannelShuffle": [("fixed", {"groups": 1}), ("random", {"groups": 3})],
+    "Grayscale": [
+        ("fixed", {"output_channels": 1}),
+        ("fixed", {"output_channels": 3}),
+    ],
+    "RandomBrightness": [
+        ("fixed", {"factor": (0.2, 0.2)}),
+        ("fixed", {"factor": (-0.3, -0.3)}),
+        ("random", {"factor": 0.5}),
+    ],
+    "RandomContrast": [
+        ("fixed", {"factor": (0.5, -0.5)}),
+        ("fixed", {"factor": (-0.8, 0.8)}),
+        ("random", {"factor": 0.5}),
+    ],
+    "RandomFlip": [
+        ("fixed", {"mode": "horizontal_and_vertical", "rate": 1.0}),
+        ("random", {"mode": "horizontal", "rate": 0.5}),
+        ("random", {"mode": "horizontal_and_vertical", "rate": 0.3}),
+    ],
+    "Resizing": [
+        ("fixed", {"height": 41, "width": 57, "interpolation": "bilinear"}),
+        ("fixed", {"height": 150, "width": 130, "interpolation": "bilinear"}),
+        ("fixed", {"height": 41, "width": 57, "interpolation": "nearest"}),
+        ("fixed", {"height": 32, "width": 32, "interpolation": "area"}),
+    ],
+    "Solarization": [
+        ("fixed", {"addition_factor": (40, 40), "threshold_factor": (128, 128)}),
+        ("random", {"addition_factor": 100.0, "threshold_factor": (64, 192)}),
+    ],
+}
+
+
+def _ks_statistic(a: np.ndarray, b: np.ndarray) -> float:
+    """Two-sample Kolmogorov-Smirnov statistic."""
+    values = np.concatenate([a, b])
+    cdf_a = np.searchsorted(np.sort(a), values, side="right") / len(a)
+    cdf_b = np.searchsorted(np.sort(b), values, side="right") / len(b)
+    return float(np.max(np.abs(cdf_a - cdf_b)))
+
+
+def _sample_statistics(images: np.ndarray, outputs: np.ndarray) -> np.ndarray:
+    """Per-sample mean output value and, for same-shaped outputs, the mean
+    absolute change from the input (which tells flips and shuffles apart).
+    """
+    outputs = outputs.astype(np.float32)
+    statistics = [outputs.mean(axis=(1, 2, 3))]
+    if outputs.shape == images.shape:
+        statistics.append(np.abs(outputs - images).mean(axis=(1, 2, 3)))
+    return np.stack(statistics, axis=-1)
+
+
+def fast_parity_report(
+    layer_name: str,
+    image: typing.Optional[np.ndarray] = None,
+    samples: int = 256,
+    seed: int = 0,
+) -> typing.List[typing.Dict]:
+    """Compare the NumPy/OpenCV fast path of an image layer with keras_cv on
+    the `FAST_PARITY_CASES` of that layer.
+
+    Fixed cases are `valid` if no pixel differs by more than one level.
+    Random cases run `samples` copies of `image` through both backends and
+    are `valid` if the KS statistic of every per-sample statistic is below
+    the 0.1% critical value (several statistics and cases are tested).
+    """
+    layer_config = TASK_CONFIGS["image"][layer_name]
+    if image is None:
+        image = get_catalog("images/").load_image("cat.jpeg")
+        image = cv2.resize(image, (64, 64), interpolation=cv2.INTER_AREA)
+
+    report = []
+    for kind, case_args in FAST_PARITY_CASES[layer_name]:
+        layer_args = {**layer_config["layer_args"], **case_args}
+        result = {"layer": layer_name, "kind": kind, "layer_args": case_args}
+        fast_cls = fast_layer_cls(layer_config["layer_cls"], layer_args)
+        if fast_cls is None:
+            result.update(valid=False, error="not supported by the fast path")
+            report.append(result)
+            continue
+        fast_layer = fast_cls(layer_name, layer_args, seed=seed)
+        # Seed keras_cv as well so reports are reproducible.
+        layer = SeededLayer(layer_name, layer_config["layer_cls"], layer_args, seed)
+        batch_size = 4 if kind == "fixed" else samples
+        images = np.repeat(image[np.newaxis], batch_size, axis=0)
+        reference = np.asarray(round_to_uint8(layer(tf.cast(images, tf.float32))))
+        outputs = fast_layer(images)
+        if outputs.shape != reference.shape:
+            result.update(
+                valid=False,
+                error=f"output shape {outputs.shape} != {reference.shape}",
+            )
+        elif kind == "fixed":
+            diff = np.abs(outputs.astype(np.int16) - reference.astype(np.int16))
+            result["max_abs_diff"] = int(diff.max())
+            result["mean_abs_diff"] = float(diff.mean())
+            result["valid"] = result["max_abs_diff"] <= 1
+        else:
+            statistics = _sample_statistics(images, outputs)
+            reference_statistics = _sample_statistics(images, reference)
+            result["ks"] = max(
+                _ks_statistic(statistics[:, index], reference_statistics[:, index])
+                for index in range(statistics.shape[1])
+            )
+            result["ks_critical"] = 1.95 * np.sqrt(2 / samples)
+            result["valid"] = result["ks"] <= result["ks_critical"]
+        report.append(result)
+    return report
+
+
+def format_fast_parity(result: typing.Dict) -> str:
+    args = ", ".join(f"{key}={value}" for key, value in result["layer_args"].items())
+    name = f"fast/{result['layer']} {result['kind']} ({args})"
+    if "error" in result:
+        return f"{name}: {result['error']}"
+    if result["kind"] == "fixed":
+        summary = f"max {result['max_abs_diff']} mean {result['mean_abs_diff']:.3f}"
+    else:
+        summary = f"KS {result['ks']:.3f} (critical {result['ks_critical']:.3f})"
+    return f"{name}: {summary}{'' if result['valid'] else ' INVALID'}"
@@ -0,0 +1,240 @@
+import threading
+import time
+import typing
+from collections import deque
+
+import numpy as np
+import streamlit as st
+
+from utils.layer_utils import (
+    LAYER_CACHE,
+    TASK_CONFIGS,
+    TASK_PIPELINES,
+    freeze_args,
+    get_layer,
+)
+from utils.lazy_utils import tf
+from utils.precision_utils import DEFAULT_DTYPE, common_dtypes, select_dtype
+
+
+class AugmentationPipeline:
+    """Chain of augmentation layers executed as a single fused `tf.function`.
+
+    Calling the pipeline runs all stages in one graph without converting
+    intermediate results back to numpy. `profile()` runs the same stages
+    eagerly, one by one, to record how long each stage takes.
+    """
+
+    def __init__(
+        self,
+        stages: typing.List[typing.Tuple[str, typing.Any]],
+        dtype: str = DEFAULT_DTYPE,
+    ):
+        self.stages = stages
+        self.execution_dtype = dtype
+        self.stage_timings = {
+            index: deque(maxlen=100) for index in range(len(stages))
+        }
+        self.fused_timings = deque(maxlen=100)
+        self._lock = threading.Lock()
+        self._function = tf.function(self._run, reduce_retracing=True)
+
+    @property
+    def names(self) -> typing.List[str]:
+        return [name for name, _ in self.stages]
+
+    def _run(self, inputs):
+        for _, layer in self.stages:
+            inputs = layer(inputs)
+        return inputs
+
+    def __call__(self, inputs):
+        start = time.perf_counter()
+        outputs = self._function(inputs)
+        with self._lock:
+            self.fused_timings.append(time.perf_counter() - start)
+        return outputs
+
+    def profile(self, inputs):
+        for index, (_, layer) in enumerate(self.stages):
+            start = time.perf_counter()
+            inputs = layer(inputs)
+            with self._lock:
+                self.stage_timings[index].append(time.perf_counter() - start)
+        return inputs
+
+    def timings_summary(self) -> typing.List[typing.Dict]:
+        def summarize(stage, timings):
+            timings = list(timings)
+            return {
+                "stage": stage,
+                "calls": len(timings),
+                "mean_ms": 1000 * float(np.mean(timings)) if timings else None,
+                "last_ms": 1000 * timings[-1] if timings else None,
+            }
+
+        with self._lock:
+            rows = [
+                summarize(f"{index + 1}. {name}", self.stage_timings[index])
+                for index, (name, _) in enumerate(self.stages)
+            ]
+            rows.append(summarize("Fused pipeline", self.fused_timings))
+        return rows
+
+
+def _get_stage_layer(layers_config: typing.Dict, name: str, args, dtype: str):
+    return get_layer(name, layers_config[name]["layer_cls"], args, dtype=dtype)
+
+
+def get_pipeline(
+    layers_config: typing.Dict,
+    stages: typing.List[typing.Tuple[str, typing.Dict]],
+    dtype: str = DEFAULT_DTYPE,
+) -> AugmentationPipeline:
+    """Build (or reuse) a pipeline from `(layer_name, layer_args)` pairs whose
+    stages all compute in `dtype`.
+    """
+    key = ("pipeline", dtype)
+    key += tuple((name, freeze_args(args)) for name, args in stages)
+
+    def build():
+        return AugmentationPipeline(
+            [
+                (name, _get_stage_layer(layers_config, name, args, dtype))
+                for name, args in stages
+            ],
+            dtype,
+        )
+
+    return LAYER_CACHE.get_or_create(key, build)
+
+
+def get_preset_pipeline(
+    task: str,
+    preset: str,
+    fixed_args: typing.Optional[typing.Dict] = None,
+    dtype: str = DEFAULT_DTYPE,
+) -> AugmentationPipeline:
+    """Build a `PIPELINES_CONFIG` preset of `task` with its default args."""
+    layers_config = TASK_CONFIGS[task]
+    if preset not in TASK_PIPELINES[task]:
+        raise ValueError(
+            f"Unknown pipeline {preset!r} for task {task!r}. "
+            f"Available pipelines: {', '.join(TASK_PIPELINES[task])}"
+        )
+    presets = TASK_PIPELINES[task][preset]
+    dtypes = common_dtypes(layers_config, [stage["layer"] for stage in presets])
+    if dtype not in dtypes:
+        raise ValueError(
+            f"Pipeline {preset!r} does not run in {dtype!r}. "
+            f"Supported dtypes: {', '.join(dtypes)}"
+        )
+    stages = [
+        (
+            stage["layer"],
+            {
+                **layers_config[stage["layer"]]["layer_args"],
+                **stage["layer_args"],
+                **(fixed_args or {}),
+            },
+        )
+        for stage in presets
+    ]
+    return get_pipeline(layers_config, stages, dtype)
+
+
+def _clamp(value, min_value, max_value):
+    return min(max(value, min_value), max_value)
+
+
+def set_stage_args(
+    control_args: typing.Dict, layer_args: typing.Dict, key: str
+) -> typing.Dict:
+    """Like `set_control_args`, but without a form and with widget keys scoped
+    to a single pipeline stage so several stages can be edited at once.
+    """
+    layer_args = dict(layer_args)
+    for arg, options in control_args.items():
+        default_value = layer_args[arg]
+        widget_key = f"{key}_{arg}"
+        if isinstance(default_value, (str, bool)):
+            layer_args[arg] = st.selectbox(
+                arg, options=options, index=options.index(default_value), key=widget_key
+            )
+        elif isinstance(default_value, (list, tuple)):
+            layer_args[arg] = st.slider(
+                arg,
+                options[0],
+                options[1],
+                tuple(_clamp(value, options[0], options[1]) for value in default_value),
+                key=widget_key,
+            )
+        else:
+            layer_args[arg] = st.slider(
+                arg,
+                options[0],
+                options[1],
+                _clamp(default_value, options[0], options[1]),
+                key=widget_key,
+            )
+    return layer_args
+
+
+def select_pipeline(
+    task: str,
+    layers_config: typing.Dict,
+    pipelines_config: typing.Dict,
+    fixed_args: typing.Optional[typing.Dict] = None,
+):
+    """Sidebar builder for an ordered multi-layer pipeline. Presets come from
+    `PIPELINES_CONFIG`; layers run in the order they are selected.
+    """
+    fixed_args = fixed_args or {}
+    preset = st.selectbox(
+        "Preset", ["Custom"] + list(pipelines_config), key=f"pipeline_{task}_preset"
+    )
+    preset_stages = pipelines_config.get(preset, [])
+    preset_args = {stage["layer"]: stage["layer_args"] for stage in preset_stages}
+
+    names = st.multiselect(
+        "Layers (applied in the order selected)",
+        list(layers_config),
+        default=[stage["layer"] for stage in preset_stages],
+        key=f"pipeline_{task}_{preset}_layers",
+    )
+
+    stages = []
+    for index, name in enumerate(names):
+        layer_config = layers_config[name]
+        layer_args = {
+            **layer_config["layer_args"],
+            **preset_args.get(name, {}),
+            **fixed_args,
+        }
+        control_args = {
+            arg: options
+            for arg, options in layer_config["control_args"].items()
+            if arg not in fixed_args
+        }
+        with st.expander(f"{index + 1}. {name}"):
+            layer_args = set_stage_args(
+                control_args, layer_args, key=f"pipeline_{task}_{preset}_{name}"
+            )
+        stages.append((name, layer_args))
+
+    if not stages:
+        st.info("Select at least one layer to build a pipeline.")
+        st.stop()
+
+    dtype = select_dtype(
+        common_dtypes(layers_config, names), key=f"pipeline_{task}_dtype"
+    )
+    pipeline = get_pipeline(layers_config, stages, dtype)
+    profile = st.checkbox(
+        "Profile stages",
+        key=f"pipeline_{task}_profile",
+        help="Run the stages one at a time to record per-stage timings.",
+    )
+    with st.expander("Pipeline timings"):
+        st.dataframe(pipeline.timings_summary(), hide_index=True)
+    return pipeline.profile if profile else pipeline
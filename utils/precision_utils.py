@@ -0,0 +1,63 @@
+import typing
+
+import streamlit as st
+
+from utils.lazy_utils import tf
+
+
+EXECUTION_DTYPES = ("float32", "float16", "bfloat16", "uint8")
+DEFAULT_DTYPE = "float32"
+
+# Layers run in any float dtype unless their config lists `dtypes`; uint8 is
+# only offered for layers that are exact on integer pixels (e.g. flips and
+# crops, which only move pixels around).
+FLOAT_DTYPES = ("float32", "float16", "bfloat16")
+
+
+def supported_dtypes(layer_config: typing.Dict) -> typing.Tuple[str, ...]:
+    return tuple(layer_config.get("dtypes", FLOAT_DTYPES))
+
+
+def common_dtypes(
+    layers_config: typing.Dict, names: typing.Sequence[str]
+) -> typing.Tuple[str, ...]:
+    """Dtypes supported by every layer in `names`, e.g. for a pipeline."""
+    return tuple(
+        dtype
+        for dtype in EXECUTION_DTYPES
+        if all(dtype in supported_dtypes(layers_config[name]) for name in names)
+    )
+
+
+def execution_dtype(layer) -> str:
+    """The dtype `layer` expects its images in."""
+    # `AugmentationPipeline.profile` is passed around as a bound method.
+    layer = getattr(layer, "__self__", layer)
+    dtype = getattr(layer, "execution_dtype", None)
+    if dtype is None:
+        dtype = getattr(layer, "compute_dtype", None) or DEFAULT_DTYPE
+    return dtype
+
+
+def to_layer_input(images, layer):
+    """Cast uint8 `images` (array or tensor) to the execution dtype of `layer`."""
+    return tf.cast(images, execution_dtype(layer))
+
+
+def round_to_uint8(tensor):
+    """Round and clip a layer output of any execution dtype to uint8."""
+    tensor = tf.convert_to_tensor(tensor)
+    if tensor.dtype == tf.uint8:
+        return tensor
+    tensor = tf.round(tf.cast(tensor, tf.float32))
+    return tf.cast(tf.clip_by_value(tensor, 0, 255), tf.uint8)
+
+
+def select_dtype(options: typing.Sequence[str], key: str) -> str:
+    return st.selectbox(
+        "Execution dtype",
+        options,
+        key=key,
+        help="float16/bfloat16 halve and uint8 quarters the memory traffic of "
+        "elementwise layers; compare against float32 with `python parity.py`.",
+    )
@@ -0,0 +1,227 @@
+import collections
+import hashlib
+import os
+import tempfile
+import threading
+import typing
+
+import numpy as np
+import streamlit as st
+
+from utils.layer_utils import freeze_args
+from utils.timing_utils import TIMINGS
+
+
+RESULT_CACHE_DIR = os.environ.get(
+    "KERASCV_DEMO_RESULT_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "kerascv-demo", "results"),
+)
+RESULT_CACHE_MB = int(os.environ.get("KERASCV_DEMO_RESULT_CACHE_MB", 1024))
+
+# Separates path components of flattened results, e.g. "#1/images".
+_SEPARATOR = "/"
+
+
+def _flatten(value, prefix="") -> typing.Dict[str, np.ndarray]:
+    """Flatten nested tuples/dicts of arrays (or tensors) into a flat
+    `{path: array}` dict; tuple items are marked with "#" so `_unflatten`
+    can rebuild the structure.
+    """
+    if isinstance(value, dict):
+        items = [(str(key), item) for key, item in value.items()]
+    elif isinstance(value, (tuple, list)):
+        items = [(f"#{index}", item) for index, item in enumerate(value)]
+    else:
+        return {prefix: np.asarray(value)}
+    flat = {}
+    for key, item in items:
+        flat.update(_flatten(item, f"{prefix}{_SEPARATOR}{key}" if prefix else key))
+    return flat
+
+
+def _unflatten(flat: typing.Dict[str, np.ndarray]):
+    if list(flat) == [""]:
+        return flat[""]
+    groups = {}
+    for path, array in flat.items():
+        head, _, rest = path.partition(_SEPARATOR)
+        groups.setdefault(head, {})[rest] = array
+    values = {head: _unflatten(group) for head, group in groups.items()}
+    if all(head.startswith("#") for head in values):
+        heads = sorted(values, key=lambda head: int(head[1:]))
+        return tuple(values[head] for head in heads)
+    return values
+
+
+def result_key(*parts) -> str:
+    """Content address of an augmentation: arrays are hashed by dtype, shape
+    and bytes, everything else by the repr of its canonical form.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part)
+            digest.update(f"{part.dtype.str}{part.shape}".encode())
+            digest.update(memoryview(part).cast("B"))
+        else:
+            digest.update(repr(freeze_args(part)).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """Size-bounded directory of compressed `.npz` results shared by every
+    Streamlit process on the machine.
+
+    Files are written to a temporary name and moved into place with
+    `os.replace`, so readers in other processes never see partial results.
+    The directory is scanned once, on first use; after that an in-memory
+    index of file sizes in least recently used order keeps the running
+    total, so eviction never rescans it. Files other processes write are
+    picked up when this process reads them; reads also refresh a file's
+    modification time, which orders the next startup scan.
+    """
+
+    def __init__(self, root_dir: str, max_bytes: int):
+        self.root_dir = root_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # path -> size in bytes, least recently used first; None until scanned.
+        self._index = None
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root_dir, key[:2], key + ".npz")
+
+    def _load_index(self):
+        # Called with the lock held.
+        if self._index is not None:
+            return
+        files = sorted(self._files(), key=lambda item: item[1].st_mtime)
+        self._index = collections.OrderedDict(
+            (path, stat.st_size) for path, stat in files
+        )
+        self._total = sum(self._index.values())
+
+    def _touch(self, path: str, size: int):
+        # Called with the lock held; marks `path` as the most recently used.
+        self._load_index()
+        self._total += size - self._index.pop(path, 0)
+        self._index[path] = size
+
+    def _forget(self, path: str):
+        # Called with the lock held.
+        if self._index is not None:
+            self._total -= self._index.pop(path, 0)
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            size = os.stat(path).st_size
+            with np.load(path) as data:
+                flat = {name: data[name] for name in data.files}
+            os.utime(path)
+        except (OSError, ValueError):
+            # Missing, evicted by another process, or unreadable.
+            with self._lock:
+                self._forget(path)
+                self.misses += 1
+            return None
+        with self._lock:
+            self._touch(path, size)
+            self.hits += 1
+        return _unflatten(flat)
+
+    def put(self, key: str, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, **_flatten(value))
+                size = f.tell()
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._touch(path, size)
+        self.evict()
+
+    def _files(self):
+        if not os.path.isdir(self.root_dir):
+            return
+        for directory in os.scandir(self.root_dir):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if entry.name.endswith(".npz"):
+                    try:
+                        yield entry.path, entry.stat()
+                    except FileNotFoundError:
+                        continue
+
+    def evict(self):
+        """Delete the least recently used files until the indexed total fits
+        in `max_bytes`.
+        """
+        with self._lock:
+            self._load_index()
+            while self._total > self.max_bytes and self._index:
+                path, size = self._index.popitem(last=False)
+                self._total -= size
+                self.evictions += 1
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    # Already evicted by another process.
+                    pass
+
+    def stats(self) -> typing.Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "bytes": self._total,
+            }
+
+
+RESULT_CACHE = DiskCache(RESULT_CACHE_DIR, RESULT_CACHE_MB * 1024 * 1024)
+
+
+def cached_result(task: str, layer, compute: typing.Callable, *inputs):
+    """Return `compute()`, served from `RESULT_CACHE` when `layer` is seeded.
+
+    The key covers `inputs` (arrays by content) and the layer's name,
+    canonical args and seed; unseeded layers are random and never cached.
+    """
+    cache_key = getattr(layer, "cache_key", None)
+    if cache_key is None:
+        return compute()
+    key = result_key(task, cache_key, *inputs)
+    with TIMINGS.stage(task, "result_cache", layer):
+        result = RESULT_CACHE.get(key)
+    if result is None:
+        result = compute()
+        with TIMINGS.stage(task, "result_cache_write", layer):
+            RESULT_CACHE.put(key, result)
+    return result
+
+
+def select_seed() -> typing.Optional[int]:
+    seed = st.number_input(
+        "Seed (0 = random)",
+        min_value=0,
+        value=0,
+        step=1,
+        key="seed",
+        help="A fixed seed makes the augmentation deterministic, so its "
+        "result can be served from the shared on-disk cache. Seeded layers "
+        "always run eagerly.",
+    )
+    return int(seed) or None
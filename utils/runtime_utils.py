@@ -0,0 +1,118 @@
+import json
+import os
+import typing
+
+
+# JSON file such as {"intra_op_threads": 4, "inter_op_threads": 2}; the
+# KERASCV_DEMO_*_THREADS environment variables override its values.
+RUNTIME_CONFIG_FILE = os.environ.get("KERASCV_DEMO_RUNTIME_CONFIG")
+
+_ENV_VARS = {
+    "intra_op_threads": "KERASCV_DEMO_INTRA_OP_THREADS",
+    "inter_op_threads": "KERASCV_DEMO_INTER_OP_THREADS",
+    "data_threads": "KERASCV_DEMO_DATA_THREADS",
+}
+
+
+class RuntimeConfig(typing.NamedTuple):
+    """TensorFlow thread pool sizes; 0 keeps TensorFlow's default, which
+    sizes every pool to the number of cores.
+    """
+
+    intra_op_threads: int = 0
+    inter_op_threads: int = 0
+    data_threads: int = 0
+
+    def to_env(self) -> typing.Dict[str, str]:
+        return {_ENV_VARS[name]: str(value) for name, value in self._asdict().items()}
+
+
+def load_runtime_config(
+    path: typing.Optional[str] = RUNTIME_CONFIG_FILE,
+    environ: typing.Mapping[str, str] = os.environ,
+) -> RuntimeConfig:
+    values = {}
+    if path:
+        with open(path) as f:
+            values.update(json.load(f))
+    unknown = set(values) - set(RuntimeConfig._fields)
+    if unknown:
+        raise ValueError(
+            f"Unknown runtime settings in {path}: {', '.join(sorted(unknown))}"
+        )
+    for name, env_var in _ENV_VARS.items():
+        if environ.get(env_var):
+            values[name] = environ[env_var]
+    return RuntimeConfig(**{name: int(value) for name, value in values.items()})
+
+
+RUNTIME = load_runtime_config()
+
+
+def apply_runtime_config(tf_module, config: RuntimeConfig = RUNTIME) -> bool:
+    """Size TensorFlow's intra-op and inter-op thread pools.
+
+    This only works before TensorFlow runs its first op, so call it right
+    after the import (e.g. from `tf.on_load`). Returns False if the runtime
+    was already initialized and the defaults stay in effect.
+    """
+    try:
+        if config.intra_op_threads:
+            tf_module.config.threading.set_intra_op_parallelism_threads(
+                config.intra_op_threads
+            )
+        if config.inter_op_threads:
+            tf_module.config.threading.set_inter_op_parallelism_threads(
+                config.inter_op_threads
+            )
+    except RuntimeError:
+        return False
+    return True
+
+
+def dataset_options(tf_module, config: RuntimeConfig = RUNTIME):
+    """`tf.data.Options` giving input pipelines their own thread pool of
+    `data_threads` instead of sharing the inter-op pool.
+    """
+    options = tf_module.data.Options()
+    if config.data_threads:
+        options.threading.private_threadpool_size = config.data_threads
+    if config.intra_op_threads:
+        options.threading.max_intra_op_parallelism = config.intra_op_threads
+    return options
+
+
+def parse_split(value: str) -> typing.Tuple[int, int]:
+    """Parse an "INTRAxINTER" thread split such as "4x2"."""
+    intra, inter = value.lower().split("x")
+    return int(intra), int(inter)
+
+
+def default_splits(cpu_count: int) -> typing.List[typing.Tuple[int, int]]:
+    """Thread splits worth trying on a machine with `cpu_count` cores, from
+    one thread per op up to TensorFlow's default of every core; (0, 0) is
+    the untuned default itself.
+    """
+    intra = sorted({1, 2, 4, max(1, cpu_count // 4), max(1, cpu_count // 2)})
+    splits = [(0, 0)]
+    splits += [(threads, 1) for threads in intra if threads <= cpu_count]
+    splits += [(threads, 2) for threads in intra if 1 < threads <= cpu_count]
+    return splits
+
+
+def recommend_split(
+    results: typing.Sequence[typing.Dict], concurrency: int
+) -> typing.Optional[typing.Dict]:
+    """The trial with the highest total throughput at `concurrency`
+    concurrent callers, ties broken by lower p90 latency.
+    """
+    trials = [
+        result
+        for result in results
+        if result["concurrency"] == concurrency and "error" not in result
+    ]
+    if not trials:
+        return None
+    return max(
+        trials, key=lambda result: (result["images_per_second"], -result["p90_ms"])
+    )
@@ -1,13 +1,36 @@
-import io
 import os
 import typing
 
+import cv2
 import numpy as np
 import streamlit as st
-import tensorflow as tf
-from PIL import Image
 
-from configs.seg_config import LAYERS_CONFIG
+from configs.seg_config import LAYERS_CONFIG, PIPELINES_CONFIG
+from utils.catalog_utils import get_catalog
+from utils.decode_utils import decode_image
+from utils.display_utils import (
+    make_grid,
+    resize_to_max_side,
+    show_image,
+    to_uint8,
+)
+from utils.layer_utils import get_layer, get_seeded_layer
+from utils.lazy_utils import keras_cv, tf, wait_for
+from utils.mask_utils import colorize_mask, decode_mask, decode_mask_file
+from utils.pipeline_utils import select_pipeline
+from utils.precision_utils import (
+    round_to_uint8,
+    select_dtype,
+    supported_dtypes,
+    to_layer_input,
+)
+from utils.result_cache_utils import cached_result, select_seed
+from utils.tile_utils import augment_tiled, flip_args, open_image, open_mask
+from utils.timing_utils import TIMINGS
+from utils.worker_utils import Job, job_token, render_job
+
+
+IMAGE_FOLDER = "images/seg/"
 
 
 def set_control_args(control_args: typing.Dict, layer_args: typing.Dict):
@@ -37,6 +60,13 @@ def set_control_args(control_args: typing.Dict, layer_args: typing.Dict):
 
 def select_layer_seg_aug():
     st.subheader("Select a Layer")
+    wait_for(keras_cv)
+    mode = st.radio(
+        "Mode", ["Single layer", "Pipeline"], horizontal=True, key="layer_mode"
+    )
+    if mode == "Pipeline":
+        return select_pipeline("seg", LAYERS_CONFIG, PIPELINES_CONFIG)
+
     layer_option = st.selectbox(
         "Select an option", list(LAYERS_CONFIG.keys()), index=0, key="layer_option"
     )
@@ -49,15 +79,32 @@ def select_layer_seg_aug():
 
     # Set control arguments
     layer_args = set_control_args(control_args, layer_args)
-
-    # Instantiate layer
-    layer = layer_cls(**layer_args)
+    dtype = select_dtype(supported_dtypes(layer_config), key="execution_dtype")
+
+    # Instantiate layer, reusing a cached instance when possible
+    compiled = st.checkbox(
+        "Compiled mode (tf.function)",
+        key="compiled_mode",
+        help="Run the layer as a graph, with inputs bucketed to a few fixed "
+        "resolutions so new image sizes do not trigger retracing.",
+    )
+    seed = select_seed()
+    if seed is not None:
+        layer = get_seeded_layer(layer_option, layer_cls, layer_args, seed, dtype)
+    else:
+        layer = get_layer(
+            layer_option, layer_cls, layer_args, compiled=compiled, dtype=dtype
+        )
+    if compiled and seed is None:
+        st.caption(f"Graphs traced so far: {layer.trace_count}")
 
     return layer
 
 
-def download_images_seg():
-    root_dir = "images/seg/"
+def default_images_seg():
+    """Image/mask pairs for the bundled examples. Pixel data is loaded lazily
+    from the image catalog once a pair is selected.
+    """
     default_images = {}
 
     image_data = {
@@ -66,17 +113,9 @@ def download_images_seg():
     }
 
     for name, image_info in image_data.items():
-        image_path = os.path.join(root_dir, image_info["image_name"])
-        mask_path = os.path.join(root_dir, image_info["mask_name"])
-
-        with open(image_path, "rb") as f:
-            image_content = f.read()
-        with open(mask_path, "rb") as f:
-            mask_content = f.read()
-
         default_images[name] = {
-            "image": image_content,
-            "mask": mask_content,
+            "image": image_info["image_name"],
+            "mask": image_info["mask_name"],
         }
 
     return default_images
@@ -84,16 +123,18 @@ def download_images_seg():
 
 def image_dropdown(image_dict=None):
     if image_dict is None:
-        image_dict = download_images_seg()
+        image_dict = default_images_seg()
 
     st.subheader("Upload Image and Mask")
     uploaded_image = st.file_uploader("Upload Image", type=["jpg", "jpeg", "png"])
     uploaded_mask = st.file_uploader("Upload Mask", type=["jpg", "jpeg", "png"])
 
     if uploaded_image and uploaded_mask:
-        image = Image.open(uploaded_image).convert("RGB")
-        mask = Image.open(uploaded_mask).convert("RGB")
-        return np.array(image), np.array(mask)
+        with TIMINGS.stage("seg", "decode") as timing:
+            image = decode_image(uploaded_image)
+            mask = decode_mask(uploaded_mask)
+            timing.image = image
+        return image, mask
 
     st.subheader("Or select an existing image")
     image_option = st.selectbox(
@@ -104,63 +145,190 @@ def image_dropdown(image_dict=None):
     )
 
     image_data = image_dict[image_option]
-    image = Image.open(io.BytesIO(image_data["image"])).convert("RGB")
-    mask = Image.open(io.BytesIO(image_data["mask"])).convert("RGB")
-    return np.array(image), np.array(mask)
+    catalog = get_catalog(IMAGE_FOLDER)
+    with TIMINGS.stage("seg", "decode") as timing:
+        image = catalog.load_image(image_data["image"])
+        mask = decode_mask_file(catalog[image_data["mask"]].path)
+        timing.image = image
+    return image, mask
 
 
-def Preprocessing(layer, image, mask):
+def Preprocessing(layer, image, mask, num_samples=1):
     """
     Input Format : {"images": tf.cast(image, tf.float32),
-                    "segmentation_masks": mask}
+                    "segmentation_masks": class_ids[..., None]}
+
+    `mask` is a `(H, W)` uint8 class-id array. Masks stay uint8 in the
+    inputs and outputs; colors are only applied by `display_img_with_mask`.
+
+    With `num_samples > 1` the image and mask are tiled into a batch and
+    augmented in a single layer call. Results of seeded layers are cached.
     """
-    image = image.copy()
-    mask = mask.copy()
+    return cached_result(
+        "seg",
+        layer,
+        lambda: _preprocessing(layer, image, mask, num_samples),
+        image,
+        mask,
+        num_samples,
+    )
+
 
-    image = tf.convert_to_tensor(image, dtype=tf.float32)
-    image = tf.expand_dims(image, axis=0)
+def _preprocessing(layer, image, mask, num_samples):
+    with TIMINGS.stage("seg", "to_tensor", layer, image):
+        image = tf.convert_to_tensor(image, dtype=tf.uint8)
+        image = tf.repeat(tf.expand_dims(image, axis=0), num_samples, axis=0)
 
-    mask = tf.convert_to_tensor(mask, dtype=tf.float32)
-    mask = tf.expand_dims(mask, axis=0)
+        mask = tf.convert_to_tensor(mask, dtype=tf.uint8)[tf.newaxis, ..., tf.newaxis]
+        mask = tf.repeat(mask, num_samples, axis=0)
 
     inputs = {"images": image, "segmentation_masks": mask}
 
-    outputs = layer(inputs)
+    with TIMINGS.stage("seg", "layer", layer, image):
+        outputs = dict(layer({**inputs, "images": to_layer_input(image, layer)}))
+        # keras_cv computes masks in the layer's dtype; snap interpolated ids
+        # back to classes.
+        outputs["images"] = round_to_uint8(outputs["images"])
+        outputs["segmentation_masks"] = round_to_uint8(outputs["segmentation_masks"])
     return inputs, outputs
 
 
-def display_img_with_mask(inputs, outputs):
+def display_img_with_mask(job, palette):
+    """Run the `Preprocessing` job returned by `seg` in the background and
+    display its inputs and outputs.
+    """
+
+    def render(result):
+        inputs, outputs = result
+        with TIMINGS.stage("seg", "display", image=inputs["images"]):
+            _display_img_with_mask(inputs, outputs, palette)
+
+    render_job("seg", job, render)
+
+
+def _display_img_with_mask(inputs, outputs, palette):
     col1, col2 = st.columns(2)
 
     with col1:
         st.subheader("Input Image and Mask")
-        st.image(
-            np.array(inputs["images"]).astype(np.uint8),
-            use_column_width=True,
-            caption="Image",
-        )
-        st.image(
-            np.array(inputs["segmentation_masks"]).astype(np.uint8),
-            use_column_width=True,
+        show_image(to_uint8(inputs["images"][0]), caption="Image")
+        show_image(
+            colorize_mask(np.asarray(inputs["segmentation_masks"][0]), palette),
             caption="Mask",
+            lossless=True,
         )
 
     with col2:
         st.subheader("Output Image and Mask")
-        st.image(
-            np.array(outputs["images"]).astype(np.uint8),
-            use_column_width=True,
-            caption="Augmented Image",
-        )
-        st.image(
-            np.array(outputs["segmentation_masks"]).astype(np.uint8),
-            use_column_width=True,
+        show_image(make_grid(to_uint8(outputs["images"])), caption="Augmented Image")
+        show_image(
+            make_grid(
+                colorize_mask(np.asarray(outputs["segmentation_masks"]), palette)
+            ),
             caption="Augmented Mask",
+            lossless=True,
         )
 
 
-def seg():
+def select_tiling():
+    """Options for tiled execution, or None to augment the whole image in one
+    call. The tiled source defaults to the selected image and mask but can be
+    any image or `.npy` file, which is read region by region.
+    """
+    with st.expander("Tiled mode (large images)"):
+        tiled = st.checkbox("Augment in tiles", key="tiled_mode")
+        tile_size = st.select_slider(
+            "Tile size", options=[256, 512, 1024], value=512, key="tile_size"
+        )
+        overlap = st.slider("Overlap", 0, 128, 32, step=8, key="tile_overlap")
+        batch_size = st.slider("Tiles per batch", 1, 16, 4, key="tile_batch_size")
+        image_path = st.text_input("Image path (.npy or image)", key="tile_image")
+        mask_path = st.text_input("Mask path (.npy or image)", key="tile_mask")
+    if not tiled:
+        return None
+    return {
+        "tile_size": tile_size,
+        "overlap": overlap,
+        "batch_size": batch_size,
+        "image_path": image_path,
+        "mask_path": mask_path,
+    }
+
+
+def tiled_preprocessing(layer, image, mask, tiling):
+    """Run `augment_tiled` and shape its stitched previews like the batched
+    inputs and outputs of `Preprocessing`.
+    """
+    previews = augment_tiled(
+        layer,
+        image,
+        mask,
+        tile_size=tiling["tile_size"],
+        overlap=tiling["overlap"],
+        batch_size=tiling["batch_size"],
+    )
+    inputs = {
+        "images": previews["images"][np.newaxis],
+        "segmentation_masks": previews["segmentation_masks"][np.newaxis],
+    }
+    outputs = {
+        "images": previews["augmented_images"][np.newaxis],
+        "segmentation_masks": previews["augmented_masks"][np.newaxis],
+    }
+    return inputs, outputs
+
+
+def _tile_source(path: str, array) -> tuple:
+    """Job token parts of a tiled source: a file by path and stat, so large
+    memory maps are never hashed, or the selected in-memory array.
+    """
+    if not path:
+        return (array,)
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def seg(num_samples=1, preview=False):
     image, mask = image_dropdown()
+    ids = mask.ids
+    tiling = select_tiling()
+    if tiling is not None:
+        palette = mask.palette
+        if tiling["image_path"]:
+            image = open_image(tiling["image_path"])
+        if tiling["mask_path"]:
+            ids, palette = open_mask(tiling["mask_path"])
+        if ids.shape[:2] != image.shape[:2]:
+            st.error(
+                f"Mask size {ids.shape[:2]} does not match image size "
+                f"{image.shape[:2]}."
+            )
+            st.stop()
+        layer = select_layer_seg_aug()
+        try:
+            flip_args(layer)
+        except ValueError as error:
+            st.error(str(error))
+            st.stop()
+        job = Job(
+            tiled_preprocessing,
+            (layer, image, ids, tiling),
+            token=job_token(
+                layer,
+                *_tile_source(tiling["image_path"], image),
+                *_tile_source(tiling["mask_path"], ids),
+                *tiling.values(),
+            ),
+        )
+        return job, palette
+    if preview:
+        image, _ = resize_to_max_side(image)
+        ids, _ = resize_to_max_side(ids, interpolation=cv2.INTER_NEAREST)
     layer = select_layer_seg_aug()
-    inputs, outputs = Preprocessing(layer, image, mask)
-    return inputs, outputs
+    job = Job(
+        Preprocessing,
+        (layer, image, ids),
+        {"num_samples": num_samples},
+        token=job_token(layer, image, ids, num_samples),
+    )
+    return job, mask.palette
@@ -0,0 +1,576 @@
+import base64
+import binascii
+import collections
+import concurrent.futures
+import json
+import threading
+import time
+import typing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from utils.box_utils import BOX_FORMATS, BoxStore, pad_batch
+from utils.compile_utils import POINTWISE_LAYERS, bucket_size
+from utils.decode_utils import decode_image
+from utils.display_utils import DISPLAY_FORMATS, encode_image
+from utils.layer_utils import TASK_CONFIGS, freeze_args, get_layer_from_config
+from utils.lazy_utils import tf
+from utils.mask_utils import decode_mask, encode_mask_png
+from utils.precision_utils import (
+    DEFAULT_DTYPE,
+    round_to_uint8,
+    supported_dtypes,
+    to_layer_input,
+)
+
+
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+
+class ServiceBusy(RuntimeError):
+    """Raised when the batcher already holds `max_queue_depth` requests."""
+
+
+class _Pending(typing.NamedTuple):
+    item: typing.Any
+    future: concurrent.futures.Future
+    enqueued: float
+
+
+class MicroBatcher:
+    """Groups concurrent submissions that share a key into single batch calls.
+
+    A key's batch is dispatched once it holds `max_batch_size` items or its
+    oldest item has waited `max_wait` seconds. Batches are only taken while a
+    worker is free, so under load requests keep accumulating into larger
+    batches instead of queueing up as many small ones. `run_batch(key,
+    items)` returns one result per item.
+    """
+
+    def __init__(
+        self,
+        run_batch: typing.Callable[[typing.Hashable, list], list],
+        max_batch_size: int = 16,
+        max_wait: float = 0.005,
+        workers: int = 1,
+        max_queue_depth: int = 1024,
+    ):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.workers = max(1, workers)
+        self.max_queue_depth = max_queue_depth
+        self._pending = collections.OrderedDict()
+        self._queue_depth = 0
+        self._idle = self.workers
+        self._closed = False
+        self._condition = threading.Condition()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="batch"
+        )
+        self._dispatcher = threading.Thread(
+            target=self._dispatch, name="batch-dispatcher", daemon=True
+        )
+
+        self.submitted = 0
+        self.batches = 0
+        self.errors = 0
+        self.peak_queue_depth = 0
+        self.batch_size_counts = collections.Counter()
+        self.waits = collections.deque(maxlen=1000)
+        self.run_times = collections.deque(maxlen=1000)
+        self._dispatcher.start()
+
+    def submit(self, key: typing.Hashable, item) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The batcher is closed")
+            if self._queue_depth >= self.max_queue_depth:
+                raise ServiceBusy(
+                    f"{self._queue_depth} requests are already queued, "
+                    "try again later"
+                )
+            pending = self._pending.setdefault(key, [])
+            pending.append(_Pending(item, future, time.perf_counter()))
+            self._queue_depth += 1
+            self.submitted += 1
+            self.peak_queue_depth = max(self.peak_queue_depth, self._queue_depth)
+            self._condition.notify()
+        return future
+
+    def _next_batch(self):
+        """Pop the first batch that is due, or return how long until one is."""
+        now = time.perf_counter()
+        next_due = None
+        for key, pending in self._pending.items():
+            due = pending[0].enqueued + self.max_wait
+            if len(pending) >= self.max_batch_size or due <= now:
+                batch = pending[: self.max_batch_size]
+                del pending[: self.max_batch_size]
+                if pending:
+                    # Let other keys go first next time.
+                    self._pending.move_to_end(key)
+                else:
+                    del self._pending[key]
+                self._queue_depth -= len(batch)
+                return key, batch, None
+            next_due = due if next_due is None else min(next_due, due)
+        return None, None, None if next_due is None else next_due - now
+
+    def _dispatch(self):
+        with self._condition:
+            while not self._closed:
+                if not self._idle:
+                    self._condition.wait()
+                    continue
+                key, batch, timeout = self._next_batch()
+                if batch is None:
+                    self._condition.wait(timeout)
+                    continue
+                self._idle -= 1
+                self._executor.submit(self._run, key, batch)
+
+    def _run(self, key, batch: typing.List[_Pending]):
+        start = time.perf_counter()
+        try:
+            results = self.run_batch(key, [pending.item for pending in batch])
+        except Exception as error:
+            results, failure = None, error
+        seconds = time.perf_counter() - start
+        with self._condition:
+            self._idle += 1
+            self.batches += 1
+            self.batch_size_counts[len(batch)] += 1
+            self.waits.extend(start - pending.enqueued for pending in batch)
+            self.run_times.append(seconds)
+            if results is None:
+                self.errors += 1
+            self._condition.notify()
+        for index, pending in enumerate(batch):
+            if results is None:
+                pending.future.set_exception(failure)
+            else:
+                pending.future.set_result(results[index])
+
+    def metrics(self) -> typing.Dict:
+        def mean_ms(values):
+            return 1000 * float(np.mean(values)) if values else None
+
+        with self._condition:
+            batched = sum(
+                size * count for size, count in self.batch_size_counts.items()
+            )
+            return {
+                "queue_depth": self._queue_depth,
+                "peak_queue_depth": self.peak_queue_depth,
+                "queued_keys": len(self._pending),
+                "busy_workers": self.workers - self._idle,
+                "workers": self.workers,
+                "submitted": self.submitted,
+                "batches": self.batches,
+                "errors": self.errors,
+                "mean_batch_size": batched / self.batches if self.batches else None,
+                "batch_sizes": dict(sorted(self.batch_size_counts.items())),
+                "mean_wait_ms": mean_ms(list(self.waits)),
+                "mean_batch_ms": mean_ms(list(self.run_times)),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": 1000 * self.max_wait,
+            }
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+        for pending in self._pending.values():
+            for item in pending:
+                item.future.cancel()
+
+
+class AugmentRequest(typing.NamedTuple):
+    image: np.ndarray
+    boxes: typing.Optional[BoxStore] = None
+    mask_ids: typing.Optional[np.ndarray] = None
+    palette: typing.Optional[np.ndarray] = None
+
+
+class BatchKey(typing.NamedTuple):
+    """Requests with equal keys are augmented in the same layer call."""
+
+    task: str
+    layer_name: str
+    layer_args: typing.Hashable
+    dtype: str
+    shape: tuple
+
+
+def _decode_base64(payload: typing.Dict, field: str) -> bytes:
+    if not isinstance(payload.get(field), str):
+        raise ValueError(f"{field!r} must be a base64-encoded string")
+    try:
+        return base64.b64decode(payload[field], validate=True)
+    except binascii.Error as error:
+        raise ValueError(f"{field!r} is not valid base64: {error}")
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _matches_default(value, default) -> bool:
+    """Whether an `args` override has the JSON type of the config default.
+    keras_cv accepts most bad values when building a layer and only fails
+    once it runs, which would be a server error.
+    """
+    if isinstance(default, bool):
+        return isinstance(value, bool)
+    if isinstance(default, str):
+        return isinstance(value, str)
+    if isinstance(default, int):
+        return isinstance(value, int) and not isinstance(value, bool)
+    if isinstance(default, float):
+        # Factors are a number or a [low, high] range.
+        return _is_number(value) or (
+            isinstance(value, list) and len(value) == 2 and all(map(_is_number, value))
+        )
+    if isinstance(default, (list, tuple)):
+        return (
+            isinstance(value, list)
+            and len(value) == len(default)
+            and all(map(_is_number, value))
+        )
+    return True
+
+
+def _encode_base64(content: bytes) -> str:
+    return base64.b64encode(content).decode("ascii")
+
+
+def shape_bucket(task: str, layer_name: str, image_shape, pad: bool = True) -> tuple:
+    """The shape requests are batched under. Images for pointwise layers
+    (where zero padding is exact, see `compile_utils`) are padded into
+    resolution buckets so that different sizes share a call; all other
+    requests are batched with others of exactly the same shape.
+    """
+    height, width, channels = image_shape
+    if pad and task == "image" and layer_name in POINTWISE_LAYERS:
+        return ("pad", bucket_size(height), bucket_size(width), channels)
+    return (height, width, channels)
+
+
+def parse_request(
+    task: str, payload: typing.Dict, pad_buckets: bool = True
+) -> typing.Tuple[BatchKey, AugmentRequest]:
+    """Validate a request body and decode its image, boxes or mask.
+
+    Bodies look like `{"layer": "RandomFlip", "args": {...}, "image": b64}`,
+    plus `"boxes"`, `"classes"` and `"box_format"` for bbox, `"mask"` (a
+    base64 PNG) for seg and optionally `"dtype"`.
+    """
+    if task not in TASK_CONFIGS:
+        raise ValueError(
+            f"Unknown task {task!r}. Available tasks: {', '.join(TASK_CONFIGS)}"
+        )
+    if not isinstance(payload, dict):
+        raise ValueError("The request body must be a JSON object")
+    layer_name = payload.get("layer")
+    if not isinstance(layer_name, str) or layer_name not in TASK_CONFIGS[task]:
+        raise ValueError(
+            f"Unknown layer {layer_name!r} for task {task!r}. "
+            f"Available layers: {', '.join(TASK_CONFIGS[task])}"
+        )
+    overrides = payload.get("args", {})
+    if not isinstance(overrides, dict):
+        raise ValueError("'args' must be a JSON object")
+    dtype = payload.get("dtype", DEFAULT_DTYPE)
+    layer_config = TASK_CONFIGS[task][layer_name]
+    for name, value in overrides.items():
+        default = layer_config["layer_args"].get(name)
+        if name in layer_config["layer_args"] and not _matches_default(value, default):
+            raise ValueError(
+                f"Invalid args for {layer_name!r}: {name!r} should look like "
+                f"{json.dumps(default)}, got {json.dumps(value)}"
+            )
+    if dtype not in supported_dtypes(layer_config):
+        raise ValueError(
+            f"{layer_name!r} does not run in {dtype!r}. "
+            f"Supported dtypes: {', '.join(supported_dtypes(layer_config))}"
+        )
+
+    try:
+        image = decode_image(_decode_base64(payload, "image"))
+    except OSError as error:
+        raise ValueError(f"Could not decode 'image': {error}")
+
+    request = AugmentRequest(image)
+    if task == "bbox":
+        box_format = payload.get("box_format", "xywh")
+        if box_format not in BOX_FORMATS:
+            raise ValueError(
+                f"Unknown box format {box_format!r}, expected one of {BOX_FORMATS}"
+            )
+        # Boxes are fed to and returned from the layer in the request's format.
+        overrides = {**overrides, "bounding_box_format": box_format}
+        boxes = payload.get("boxes", [])
+        if not isinstance(boxes, list) or not all(
+            isinstance(box, list) and len(box) == 4 and all(map(_is_number, box))
+            for box in boxes
+        ):
+            raise ValueError("'boxes' must be a list of [4] coordinate lists")
+        classes = payload.get("classes")
+        if classes is not None:
+            if not isinstance(classes, list) or not all(map(_is_number, classes)):
+                raise ValueError("'classes' must be a list of numbers")
+            if len(classes) != len(boxes):
+                raise ValueError("'classes' must have one entry per box")
+        request = request._replace(
+            boxes=BoxStore.from_arrays(boxes, classes, box_format=box_format)
+        )
+    elif task == "seg":
+        try:
+            mask = decode_mask(_decode_base64(payload, "mask"))
+        except OSError as error:
+            raise ValueError(f"Could not decode 'mask': {error}")
+        if mask.ids.shape != image.shape[:2]:
+            raise ValueError(
+                f"Mask shape {mask.ids.shape} does not match the image "
+                f"{image.shape[:2]}"
+            )
+        request = request._replace(mask_ids=mask.ids, palette=mask.palette)
+
+    try:
+        # Build (and cache) the layer now so bad args fail only this request.
+        get_layer_from_config(task, layer_name, overrides, dtype=dtype)
+    except (TypeError, ValueError) as error:
+        raise ValueError(f"Invalid args for {layer_name!r}: {error}")
+
+    layer_args = {**layer_config["layer_args"], **overrides}
+    key = BatchKey(
+        task,
+        layer_name,
+        freeze_args(layer_args),
+        dtype,
+        shape_bucket(task, layer_name, image.shape, pad_buckets),
+    )
+    return key, request
+
+
+def _dense_boxes(bounding_boxes):
+    boxes, classes = bounding_boxes["boxes"], bounding_boxes["classes"]
+    if isinstance(boxes, tf.RaggedTensor):
+        boxes = boxes.to_tensor(default_value=-1)
+        classes = classes.to_tensor(default_value=-1)
+    return np.asarray(boxes), np.asarray(classes)
+
+
+def augment_batch(
+    key: BatchKey, requests: typing.Sequence[AugmentRequest]
+) -> typing.List[typing.Dict]:
+    """Augment all `requests` of one `BatchKey` in a single layer call."""
+    layer = get_layer_from_config(
+        key.task, key.layer_name, dict(key.layer_args), dtype=key.dtype
+    )
+    if key.shape[0] == "pad":
+        height, width, channels = key.shape[1:]
+    else:
+        height, width, channels = key.shape
+    images = np.zeros((len(requests), height, width, channels), dtype=np.uint8)
+    for index, request in enumerate(requests):
+        image_height, image_width = request.image.shape[:2]
+        images[index, :image_height, :image_width] = request.image
+    inputs = {"images": to_layer_input(images, layer)}
+
+    if key.task == "bbox":
+        inputs["bounding_boxes"] = tf.nest.map_structure(
+            tf.convert_to_tensor, pad_batch([request.boxes for request in requests])
+        )
+    elif key.task == "seg":
+        masks = np.stack([request.mask_ids for request in requests])
+        inputs["segmentation_masks"] = tf.convert_to_tensor(masks[..., np.newaxis])
+
+    outputs = layer(inputs if key.task != "image" else inputs["images"])
+    if not isinstance(outputs, dict):
+        outputs = {"images": outputs}
+    output_images = np.asarray(round_to_uint8(outputs["images"]))
+    results = []
+    for index, request in enumerate(requests):
+        result = {"image": output_images[index], "batch_size": len(requests)}
+        if key.shape[0] == "pad":
+            # Pointwise layers keep the size; crop the padding off again.
+            image_height, image_width = request.image.shape[:2]
+            result["image"] = result["image"][:image_height, :image_width]
+        results.append(result)
+
+    if key.task == "bbox":
+        boxes, classes = _dense_boxes(outputs["bounding_boxes"])
+        for index, result in enumerate(results):
+            valid = classes[index] >= 0
+            result["boxes"] = boxes[index][valid]
+            result["classes"] = classes[index][valid].astype(np.int64)
+    elif key.task == "seg":
+        masks = np.asarray(round_to_uint8(outputs["segmentation_masks"]))
+        for index, result in enumerate(results):
+            result["mask"] = masks[index]
+            result["palette"] = requests[index].palette
+    return results
+
+
+def encode_response(
+    key: BatchKey, result: typing.Dict, image_format: str, quality: int
+) -> typing.Dict:
+    image = result["image"]
+    response = {
+        "image": _encode_base64(encode_image(image, image_format, quality)),
+        "format": image_format,
+        "height": int(image.shape[0]),
+        "width": int(image.shape[1]),
+        "batch_size": result["batch_size"],
+    }
+    if "boxes" in result:
+        response["boxes"] = result["boxes"].tolist()
+        response["classes"] = result["classes"].tolist()
+        response["box_format"] = dict(key.layer_args)["bounding_box_format"]
+    if "mask" in result:
+        response["mask"] = _encode_base64(
+            encode_mask_png(result["mask"], result["palette"])
+        )
+    return response
+
+
+class AugmentationService:
+    """Micro-batching front end for the `LAYERS_CONFIG` layers of all tasks."""
+
+    def __init__(
+        self,
+        max_batch_size: int = 16,
+        max_wait: float = 0.005,
+        workers: int = 1,
+        max_queue_depth: int = 1024,
+        pad_buckets: bool = True,
+        timeout: float = 60.0,
+    ):
+        self.pad_buckets = pad_buckets
+        self.timeout = timeout
+        self.start = time.time()
+        self.requests = collections.Counter()
+        self._lock = threading.Lock()
+        self.batcher = MicroBatcher(
+            augment_batch,
+            max_batch_size=max_batch_size,
+            max_wait=max_wait,
+            workers=workers,
+            max_queue_depth=max_queue_depth,
+        )
+
+    def augment(self, task: str, payload: typing.Dict) -> typing.Dict:
+        image_format = str(payload.get("format", "PNG")).upper()
+        if image_format == "WEBP":
+            image_format = "WebP"
+        if image_format not in DISPLAY_FORMATS:
+            raise ValueError(
+                f"Unsupported format {image_format!r}, expected one of "
+                f"{DISPLAY_FORMATS}"
+            )
+        quality = int(payload.get("quality", 95))
+        key, request = parse_request(task, payload, self.pad_buckets)
+        with self._lock:
+            self.requests[task] += 1
+        result = self.batcher.submit(key, request).result(self.timeout)
+        return encode_response(key, result, image_format, quality)
+
+    def layers(self) -> typing.Dict:
+        return {
+            task: {
+                name: {
+                    "layer_args": config["layer_args"],
+                    "dtypes": supported_dtypes(config),
+                }
+                for name, config in layers_config.items()
+            }
+            for task, layers_config in TASK_CONFIGS.items()
+        }
+
+    def metrics(self) -> typing.Dict:
+        with self._lock:
+            requests = dict(self.requests)
+        return {
+            "uptime_s": time.time() - self.start,
+            "requests": requests,
+            **self.batcher.metrics(),
+        }
+
+    def close(self):
+        self.batcher.close()
+
+
+class AugmentationHandler(BaseHTTPRequestHandler):
+    """`POST /augment/{image,bbox,seg}`, `GET /layers` and `GET /metrics`."""
+
+    server_version = "KerasCVDemo/1.0"
+    verbose = False
+
+    def _send_json(self, status: int, body):
+        data = json.dumps(body, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send_json(200, self.server.service.metrics())
+        elif self.path == "/layers":
+            self._send_json(200, self.server.service.layers())
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path!r}"})
+
+    def do_POST(self):
+        prefix = "/augment/"
+        if not self.path.startswith(prefix):
+            self._send_json(404, {"error": f"Unknown path {self.path!r}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_json(400, {"error": "Invalid Content-Length"})
+            return
+        if length > MAX_BODY_BYTES:
+            error = f"Bodies are limited to {MAX_BODY_BYTES} bytes"
+            self._send_json(413, {"error": error})
+            return
+        try:
+            payload = json.loads(self.rfile.read(length))
+            response = self.server.service.augment(self.path[len(prefix) :], payload)
+        except ServiceBusy as error:
+            self._send_json(503, {"error": str(error)})
+        except concurrent.futures.TimeoutError:
+            self._send_json(504, {"error": "Augmentation timed out"})
+        except ValueError as error:
+            # Also covers invalid JSON and layer args keras_cv rejects.
+            self._send_json(400, {"error": str(error)})
+        except Exception as error:
+            self._send_json(500, {"error": f"{type(error).__name__}: {error}"})
+        else:
+            self._send_json(200, response)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+class AugmentationServer(ThreadingHTTPServer):
+    """One thread per connection; each blocks until its batch has run."""
+
+    daemon_threads = True
+    # Bursts of concurrent clients are the point; the default backlog is 5.
+    request_queue_size = 256
+
+    def __init__(self, address, service: AugmentationService):
+        super().__init__(address, AugmentationHandler)
+        self.service = service
@@ -0,0 +1,266 @@
+import os
+import typing
+
+import cv2
+import numpy as np
+
+from utils.decode_utils import decode_file
+from utils.display_utils import PREVIEW_MAX_SIDE
+from utils.mask_utils import MAX_CLASSES, decode_mask_file
+from utils.timing_utils import TIMINGS
+
+
+class Window(typing.NamedTuple):
+    """A tile read from `[start, end)` of which only `[core_start, core_end)`
+    is written back, so neighbouring tiles meet halfway through their
+    overlap instead of showing seams at the tile borders.
+    """
+
+    start: int
+    end: int
+    core_start: int
+    core_end: int
+
+
+def axis_windows(size: int, tile_size: int, overlap: int) -> typing.List[Window]:
+    if size <= tile_size:
+        return [Window(0, size, 0, size)]
+    stride = max(1, tile_size - overlap)
+    starts = list(range(0, size - tile_size, stride)) + [size - tile_size]
+    windows = []
+    for index, start in enumerate(starts):
+        end = start + tile_size
+        core_start = 0 if index == 0 else windows[-1].core_end
+        core_end = size
+        if index + 1 < len(starts):
+            # Midpoint of the overlap with the next tile.
+            core_end = (starts[index + 1] + end) // 2
+        windows.append(Window(start, end, core_start, core_end))
+    return windows
+
+
+def tile_windows(height: int, width: int, tile_size: int = 512, overlap: int = 32):
+    """All `(row_window, column_window)` pairs covering a `height` x `width`
+    image with tiles of at most `tile_size` pixels per side. Every tile has
+    the same shape, so tiles batch together and traced graphs are reused.
+    """
+    return [
+        (row, column)
+        for row in axis_windows(height, tile_size, overlap)
+        for column in axis_windows(width, tile_size, overlap)
+    ]
+
+
+def default_palette(num_classes: int = MAX_CLASSES) -> np.ndarray:
+    palette = np.random.default_rng(0).integers(0, 256, (num_classes, 3))
+    palette[0] = 0
+    return palette.astype(np.uint8)
+
+
+def open_image(path: str) -> np.ndarray:
+    """`.npy` files are memory-mapped so tiles are read as regions; other
+    formats have no region decode here and are decoded once (cached).
+    """
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    return decode_file(path)
+
+
+def open_mask(path: str) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Return `(class_ids, palette)` for a mask file, see `open_image`."""
+    if path.endswith(".npy"):
+        ids = np.load(path, mmap_mode="r")
+        if ids.ndim == 3:
+            ids = ids[..., 0]
+        return ids, default_palette()
+    mask = decode_mask_file(path)
+    return mask.ids, mask.palette
+
+
+class TiledPreview:
+    """Downscaled canvas that tiles are pasted into as they are produced.
+    Its size depends only on `max_side`, not on the image size.
+    """
+
+    def __init__(self, height, width, channels, max_side=PREVIEW_MAX_SIDE):
+        self.scale = min(1.0, max_side / max(height, width))
+        self.shape = (
+            max(1, round(height * self.scale)),
+            max(1, round(width * self.scale)),
+        )
+        self.canvas = np.zeros(self.shape + (channels,), dtype=np.uint8)
+
+    def paste(self, tile, row: Window, column: Window, interpolation):
+        top, bottom = (round(value * self.scale) for value in row[2:])
+        left, right = (round(value * self.scale) for value in column[2:])
+        if bottom <= top or right <= left:
+            return
+        core = tile[_core_region(row, column)]
+        resized = cv2.resize(
+            np.ascontiguousarray(core),
+            (right - left, bottom - top),
+            interpolation=interpolation,
+        )
+        self.canvas[top:bottom, left:right] = resized.reshape(
+            resized.shape[:2] + (-1,)
+        )
+
+
+def _region(row: Window, column: Window):
+    return slice(row.start, row.end), slice(column.start, column.end)
+
+
+def _core_region(row: Window, column: Window, relative: bool = True):
+    row_offset = row.start if relative else 0
+    column_offset = column.start if relative else 0
+    return (
+        slice(row.core_start - row_offset, row.core_end - row_offset),
+        slice(column.core_start - column_offset, column.core_end - column_offset),
+    )
+
+
+def _mirror(window: Window, size: int) -> Window:
+    return Window(
+        size - window.end,
+        size - window.start,
+        size - window.core_end,
+        size - window.core_start,
+    )
+
+
+def flip_args(layer) -> typing.List[typing.Dict]:
+    """`layer_args` of every `RandomFlip` that `layer` (a layer, seeded or
+    compiled layer, or pipeline) applies, in order.
+
+    A flip is the only transform tiled mode can split across tiles: its
+    random parameters are sampled once per image and the tile grid is
+    mirrored to match. Any other layer raises a ValueError.
+    """
+    # `AugmentationPipeline.profile` is passed around as a bound method.
+    layer = getattr(layer, "__self__", layer)
+    if hasattr(layer, "stages"):
+        return [args for _, stage in layer.stages for args in flip_args(stage)]
+    if hasattr(layer, "bucket_mode"):
+        return flip_args(layer.layer)
+    name = getattr(layer, "layer_name", type(layer).__name__)
+    if name != "RandomFlip":
+        raise ValueError(
+            f"Tiled mode cannot split {name} across tiles; only RandomFlip is "
+            "supported"
+        )
+    if hasattr(layer, "layer_args"):
+        return [layer.layer_args]
+    return [{"mode": layer.mode, "rate": layer.rate}]
+
+
+def sample_flips(layer, rng: np.random.Generator) -> typing.Tuple[bool, bool]:
+    """Whether the whole image is flipped `(vertically, horizontally)`."""
+    flip_rows = flip_columns = False
+    for args in flip_args(layer):
+        mode, rate = args.get("mode", "horizontal"), args.get("rate", 0.5)
+        if "horizontal" in mode and rng.random() < rate:
+            flip_columns = not flip_columns
+        if "vertical" in mode and rng.random() < rate:
+            flip_rows = not flip_rows
+    return flip_rows, flip_columns
+
+
+def _tile_batches(windows, batch_size):
+    for index in range(0, len(windows), batch_size):
+        yield windows[index : index + batch_size]
+
+
+def augment_tiled(
+    layer,
+    image,
+    mask=None,
+    tile_size: int = 512,
+    overlap: int = 32,
+    batch_size: int = 8,
+    output_image=None,
+    output_mask=None,
+):
+    """Augment `image` (and its `(H, W)` class-id `mask`) tile by tile.
+
+    `image` and `mask` may be memory maps: only one batch of tiles is read
+    at a time. Augmented tiles are streamed into the optional full-size
+    `output_image` / `output_mask` arrays (e.g. from
+    `np.lib.format.open_memmap`) and into downscaled previews, so peak memory
+    depends on `tile_size` and `batch_size` rather than on the image size.
+
+    `layer` must be made of flips (see `flip_args`). They are sampled once
+    per image, with the seed of a seeded layer; every output tile is then
+    read from its mirrored position and flipped, so the stitched result
+    equals augmenting the whole image.
+
+    Returns a dict of input and output previews.
+    """
+    height, width = image.shape[:2]
+    rng = np.random.default_rng(getattr(layer, "seed", None))
+    flip_rows, flip_columns = sample_flips(layer, rng)
+    previews = {
+        "images": TiledPreview(height, width, 3),
+        "augmented_images": TiledPreview(height, width, 3),
+    }
+    if mask is not None:
+        previews["segmentation_masks"] = TiledPreview(height, width, 1)
+        previews["augmented_masks"] = TiledPreview(height, width, 1)
+
+    flip_axes = tuple(
+        axis for axis, flip in ((1, flip_rows), (2, flip_columns)) if flip
+    )
+
+    def source(row, column):
+        # The input window an output window is flipped from.
+        return (
+            _mirror(row, height) if flip_rows else row,
+            _mirror(column, width) if flip_columns else column,
+        )
+
+    windows = tile_windows(height, width, tile_size, overlap)
+    for batch in _tile_batches(windows, batch_size):
+        sources = [source(*window) for window in batch]
+        with TIMINGS.stage("seg", "tile_read", layer) as timing:
+            tiles = np.stack([image[_region(*window)] for window in sources])
+            timing.image = tiles
+            if mask is not None:
+                mask_tiles = np.stack(
+                    [mask[_region(*window)] for window in sources]
+                )[..., np.newaxis]
+
+        with TIMINGS.stage("seg", "tile_layer", layer, tiles):
+            augmented = np.flip(tiles, flip_axes) if flip_axes else tiles
+            if mask is not None:
+                augmented_masks = (
+                    np.flip(mask_tiles, flip_axes) if flip_axes else mask_tiles
+                )
+
+        with TIMINGS.stage("seg", "tile_write", layer, tiles):
+            for index, (row, column) in enumerate(batch):
+                previews["images"].paste(
+                    tiles[index], *sources[index], cv2.INTER_AREA
+                )
+                previews["augmented_images"].paste(
+                    augmented[index], row, column, cv2.INTER_AREA
+                )
+                core = _core_region(row, column)
+                target = _core_region(row, column, relative=False)
+                if output_image is not None:
+                    output_image[target] = augmented[index][core]
+                if mask is not None:
+                    previews["segmentation_masks"].paste(
+                        mask_tiles[index], *sources[index], cv2.INTER_NEAREST
+                    )
+                    previews["augmented_masks"].paste(
+                        augmented_masks[index], row, column, cv2.INTER_NEAREST
+                    )
+                    if output_mask is not None:
+                        output_mask[target] = augmented_masks[index][core][..., 0]
+
+    return {key: preview.canvas for key, preview in previews.items()}
+
+
+def open_output(path: str, shape, dtype=np.uint8):
+    """Full-size output array streamed to disk as a `.npy` memory map."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=tuple(shape))
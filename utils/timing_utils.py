@@ -0,0 +1,179 @@
+import contextlib
+import json
+import os
+import threading
+import time
+import types
+import typing
+from collections import defaultdict, deque
+
+import numpy as np
+import streamlit as st
+
+from utils.decode_utils import DECODED_IMAGE_CACHE
+from utils.display_utils import ENCODED_IMAGE_CACHE
+from utils.layer_utils import LAYER_CACHE
+from utils.lazy_utils import STARTUP
+from utils.runtime_utils import RUNTIME
+from utils.worker_utils import ENGINE
+
+
+TIMINGS_FILE = os.environ.get("KERASCV_DEMO_TIMINGS_FILE")
+
+SIZE_BUCKETS = (256, 512, 1024, 2048, 4096)
+
+
+def size_label(image) -> typing.Optional[str]:
+    """Bucket an image by its longest side, e.g. "<=1024px"."""
+    if image is None:
+        return None
+    shape = getattr(image, "shape", None)
+    if shape is None or len(shape) < 2:
+        return None
+    # (height, width), (height, width, channels) or a batch of either.
+    height, width = (shape[0], shape[1]) if len(shape) <= 3 else (shape[1], shape[2])
+    longest = max(int(height), int(width))
+    for bucket in SIZE_BUCKETS:
+        if longest <= bucket:
+            return f"<={bucket}px"
+    return f">{SIZE_BUCKETS[-1]}px"
+
+
+def describe_layer(layer) -> typing.Optional[str]:
+    if layer is None:
+        return None
+    # `AugmentationPipeline.profile` is passed around as a bound method.
+    layer = getattr(layer, "__self__", layer)
+    if hasattr(layer, "names"):
+        return " > ".join(layer.names)
+    if hasattr(layer, "layer_name"):
+        return layer.layer_name
+    return type(layer).__name__
+
+
+class StageTimings:
+    """Rolling per-stage latency samples for the image, bbox and seg flows,
+    grouped by task, stage, layer and image size.
+    """
+
+    def __init__(self, maxlen: int = 500, max_records: int = 10000):
+        self.maxlen = maxlen
+        self._samples = defaultdict(lambda: deque(maxlen=self.maxlen))
+        self._records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    def record(self, task, stage, seconds, layer=None, size=None):
+        record = {
+            "time": time.time(),
+            "task": task,
+            "stage": stage,
+            "layer": layer,
+            "size": size,
+            "ms": 1000 * seconds,
+        }
+        with self._lock:
+            self._samples[(task, stage, layer, size)].append(record["ms"])
+            self._records.append(record)
+        # Write outside the lock so slow disks do not stall other stages; one
+        # short append per record keeps lines whole.
+        if TIMINGS_FILE:
+            with open(TIMINGS_FILE, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+    @contextlib.contextmanager
+    def stage(self, task: str, stage: str, layer=None, image=None):
+        """Time the enclosed block. The yielded object's `layer` and `image`
+        can be set inside the block when they are only known afterwards
+        (e.g. the size of a freshly decoded image).
+        """
+        context = types.SimpleNamespace(layer=layer, image=image)
+        start = time.perf_counter()
+        try:
+            yield context
+        finally:
+            self.record(
+                task,
+                stage,
+                time.perf_counter() - start,
+                layer=describe_layer(context.layer),
+                size=size_label(context.image),
+            )
+
+    def summary(self) -> typing.List[typing.Dict]:
+        with self._lock:
+            items = [(key, list(samples)) for key, samples in self._samples.items()]
+        rows = []
+        for (task, stage, layer, size), samples in sorted(
+            items, key=lambda item: tuple(str(part) for part in item[0])
+        ):
+            rows.append(
+                {
+                    "task": task,
+                    "stage": stage,
+                    "layer": layer,
+                    "size": size,
+                    "calls": len(samples),
+                    "p50_ms": float(np.percentile(samples, 50)),
+                    "p90_ms": float(np.percentile(samples, 90)),
+                    "max_ms": float(np.max(samples)),
+                }
+            )
+        return rows
+
+    def histogram(self, key, bins: int = 20):
+        with self._lock:
+            samples = list(self._samples.get(key, ()))
+        return np.histogram(samples, bins=bins) if samples else None
+
+    def to_jsonl(self) -> str:
+        with self._lock:
+            records = list(self._records)
+        return "".join(json.dumps(record) + "\n" for record in records)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._records.clear()
+
+
+TIMINGS = StageTimings()
+
+
+def display_timings_panel():
+    with st.expander("Startup"):
+        st.dataframe(STARTUP.report(), hide_index=True)
+
+    st.subheader("Stage timings")
+    rows = TIMINGS.summary()
+    if not rows:
+        st.caption("No timings recorded yet.")
+        return
+    st.dataframe(rows, hide_index=True)
+
+    keys = [(row["task"], row["stage"], row["layer"], row["size"]) for row in rows]
+    key = st.selectbox(
+        "Histogram",
+        keys,
+        format_func=lambda key: " / ".join(str(part) for part in key if part),
+        key="timings_histogram",
+    )
+    counts, edges = TIMINGS.histogram(key)
+    st.bar_chart({f"{edge:.1f}ms": int(count) for edge, count in zip(edges, counts)})
+
+    st.caption(f"Layer cache: {LAYER_CACHE.stats()}")
+    st.caption(f"Decoded image cache: {DECODED_IMAGE_CACHE.stats()}")
+    st.caption(f"Encoded image cache: {ENCODED_IMAGE_CACHE.stats()}")
+    st.caption(f"Augmentation workers: {ENGINE.stats()}")
+    st.caption(f"TensorFlow threads (0 = default): {RUNTIME._asdict()}")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            "Export JSONL",
+            TIMINGS.to_jsonl(),
+            file_name="timings.jsonl",
+            mime="application/json",
+        )
+    with col2:
+        if st.button("Clear"):
+            TIMINGS.clear()
@@ -0,0 +1,446 @@
+import os
+import queue
+import tempfile
+import threading
+import time
+import typing
+from collections import deque
+
+import cv2
+import numpy as np
+import streamlit as st
+
+from utils.display_utils import resize_to_max_side, show_image
+from utils.fast_utils import FastLayer
+from utils.image_utils import select_layer_for_image_aug
+from utils.precision_utils import round_to_uint8, to_layer_input
+from utils.timing_utils import describe_layer
+
+
+VIDEO_TYPES = ["mp4", "avi", "mov", "mkv"]
+
+# Codecs for the output container, picked by file extension.
+VIDEO_FOURCCS = {".mp4": "mp4v", ".avi": "MJPG"}
+
+# The page redraws at most this often; every frame still goes to the file.
+DISPLAY_INTERVAL = 0.1
+
+
+class FrameReader:
+    """Decodes the frames of a video file in a background thread.
+
+    Frames are handed over as `(index, rgb_frame)` through a bounded queue,
+    so decoding runs ahead of augmentation by at most `queue_size` frames.
+    The file is opened in the constructor so that unreadable files fail
+    before the thread starts.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        queue_size: int = 64,
+        max_frames: typing.Optional[int] = None,
+    ):
+        self.path = path
+        self.max_frames = max_frames
+        self._capture = cv2.VideoCapture(path)
+        if not self._capture.isOpened():
+            raise ValueError(f"Could not open video {path!r}")
+        self.fps = self._capture.get(cv2.CAP_PROP_FPS) or None
+        frame_count = int(self._capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.frame_count = frame_count or None
+        self.decoded = 0
+        self.error = None
+        self.frames = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._read, name="video-reader", daemon=True
+        )
+
+    def start(self) -> "FrameReader":
+        self._thread.start()
+        return self
+
+    def _put(self, item) -> bool:
+        # Wake up regularly so `close` is not blocked by a full queue.
+        while not self._stop.is_set():
+            try:
+                self.frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self):
+        try:
+            while self.max_frames is None or self.decoded < self.max_frames:
+                ok, frame = self._capture.read()
+                if not ok:
+                    break
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                if not self._put((self.decoded, frame)):
+                    return
+                self.decoded += 1
+        except Exception as error:
+            self.error = error
+        finally:
+            self._capture.release()
+            self._put(None)
+
+    def get(self):
+        """The next `(index, frame)`, or None at the end of the video."""
+        item = self.frames.get()
+        if item is None and self.error is not None:
+            raise self.error
+        return item
+
+    def close(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        else:
+            self._capture.release()
+
+
+class VideoStats:
+    """Throughput, latency and drop counters of a `VideoStream`.
+
+    Latency is measured from the moment a frame is due (its position in the
+    video at the target FPS, or when it was dequeued if unpaced) to the end
+    of the batch call that augmented it, so it includes the time a frame
+    waits for its batch to fill.
+    """
+
+    def __init__(self, target_fps: typing.Optional[float], maxlen: int = 500):
+        self.target_fps = target_fps
+        self.start = time.perf_counter()
+        self.processed = 0
+        self.dropped = 0
+        self.batches = 0
+        self.latencies = deque(maxlen=maxlen)
+        self.batch_times = deque(maxlen=maxlen)
+        self.queue_depth = 0
+
+    def record_batch(self, seconds: float, latencies: typing.Sequence[float]):
+        self.processed += len(latencies)
+        self.batches += 1
+        self.batch_times.append(seconds)
+        self.latencies.extend(latencies)
+
+    def summary(self) -> typing.Dict:
+        elapsed = time.perf_counter() - self.start
+        frames = self.processed + self.dropped
+        latencies = 1000 * np.asarray(self.latencies)
+        p50, p90 = np.percentile(latencies, [50, 90]) if len(latencies) else (None,) * 2
+        return {
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "drop_rate": self.dropped / frames if frames else 0.0,
+            "fps": self.processed / elapsed if elapsed else 0.0,
+            "target_fps": self.target_fps,
+            "latency_p50_ms": None if p50 is None else float(p50),
+            "latency_p90_ms": None if p90 is None else float(p90),
+            "batch_ms": 1000 * float(np.mean(self.batch_times))
+            if self.batch_times
+            else None,
+            "queue_depth": self.queue_depth,
+            "seconds": elapsed,
+        }
+
+
+def format_video_stats(summary: typing.Dict) -> str:
+    target = summary["target_fps"]
+    text = f"{summary['fps']:.1f} fps"
+    text += f" (target {target:.1f})" if target else " (unpaced)"
+    text += f", {summary['processed']} frames, {summary['dropped']} dropped"
+    text += f" ({100 * summary['drop_rate']:.1f}%)"
+    if summary["latency_p50_ms"] is not None:
+        text += f", latency p50 {summary['latency_p50_ms']:.1f}ms"
+        text += f" p90 {summary['latency_p90_ms']:.1f}ms"
+        text += f", batch {summary['batch_ms']:.1f}ms"
+    return text
+
+
+def augment_frames(frames: np.ndarray, layer) -> np.ndarray:
+    """Augment a `(batch, height, width, channels)` uint8 batch in one call."""
+    if isinstance(layer, FastLayer):
+        return layer(frames)
+    return np.asarray(round_to_uint8(layer(to_layer_input(frames, layer))))
+
+
+class VideoStream:
+    """Augments the frames of a `FrameReader` in batches of `batch_size`.
+
+    With a `target_fps` the file is treated as a live source: frame `i` is
+    not processed before `i / target_fps` seconds after the start, and frames
+    that are more than one batch late when dequeued are dropped, so a layer
+    that cannot keep up loses frames instead of falling further behind.
+    Without one, every frame is processed as fast as possible. Iterating
+    yields `(indices, frames, outputs)` for each processed batch.
+    """
+
+    def __init__(
+        self,
+        reader: FrameReader,
+        layer,
+        batch_size: int = 4,
+        target_fps: typing.Optional[float] = None,
+    ):
+        self.reader = reader
+        self.layer = layer
+        self.batch_size = max(1, batch_size)
+        self.target_fps = target_fps
+        self.stats = VideoStats(target_fps)
+
+    def _process(self, indices, frames, due):
+        start = time.perf_counter()
+        frames = np.stack(frames)
+        outputs = augment_frames(frames, self.layer)
+        done = time.perf_counter()
+        self.stats.record_batch(done - start, [done - frame_due for frame_due in due])
+        return indices, frames, outputs
+
+    def close(self):
+        self.reader.close()
+
+    def __iter__(self):
+        interval = 1 / self.target_fps if self.target_fps else 0.0
+        max_lag = self.batch_size * interval
+        indices, frames, due = [], [], []
+        self.stats = VideoStats(self.target_fps)
+        self.reader.start()
+        try:
+            while True:
+                item = self.reader.get()
+                self.stats.queue_depth = self.reader.frames.qsize()
+                if item is None:
+                    break
+                index, frame = item
+                now = time.perf_counter()
+                if interval:
+                    frame_due = self.stats.start + index * interval
+                    if now < frame_due:
+                        time.sleep(frame_due - now)
+                    elif now - frame_due > max_lag:
+                        self.stats.dropped += 1
+                        continue
+                else:
+                    frame_due = now
+                indices.append(index)
+                frames.append(frame)
+                due.append(frame_due)
+                if len(frames) == self.batch_size:
+                    yield self._process(indices, frames, due)
+                    indices, frames, due = [], [], []
+            if frames:
+                yield self._process(indices, frames, due)
+        finally:
+            self.reader.close()
+
+
+class VideoWriter:
+    """Writes augmented frames to a video file.
+
+    The file is opened on the first frame so that layers that change the
+    frame size write at their output size. Dropped frames are filled with
+    the previous output so the video keeps its duration; pass the number of
+    decoded frames to `close` to also fill the ones dropped at the end.
+    """
+
+    def __init__(self, path: str, fps: float):
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in VIDEO_FOURCCS:
+            raise ValueError(
+                f"Unsupported video format {extension!r}, "
+                f"expected one of {', '.join(VIDEO_FOURCCS)}"
+            )
+        self.path = path
+        self.fps = fps
+        self.fourcc = cv2.VideoWriter_fourcc(*VIDEO_FOURCCS[extension])
+        self.frames = 0
+        self._writer = None
+        self._last_frame = None
+
+    def _open(self, frame: np.ndarray):
+        height, width = frame.shape[:2]
+        self._writer = cv2.VideoWriter(
+            self.path, self.fourcc, self.fps, (width, height)
+        )
+        if not self._writer.isOpened():
+            raise ValueError(f"Could not open {self.path!r} for writing")
+
+    def write(self, indices: typing.Sequence[int], outputs: np.ndarray):
+        for index, frame in zip(indices, outputs):
+            if frame.shape[-1] == 1:
+                frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+            else:
+                frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+            if self._writer is None:
+                self._open(frame)
+            while self._last_frame is not None and self.frames < index:
+                self._writer.write(self._last_frame)
+                self.frames += 1
+            self._writer.write(frame)
+            self._last_frame = frame
+            self.frames += 1
+
+    def close(self, frame_count: typing.Optional[int] = None):
+        if self._writer is None:
+            return
+        while frame_count is not None and self.frames < frame_count:
+            self._writer.write(self._last_frame)
+            self.frames += 1
+        self._writer.release()
+
+
+def _uploaded_video_path(uploaded_file) -> str:
+    """Save an upload to a temporary file once, since cv2 reads from paths."""
+    extension = os.path.splitext(uploaded_file.name)[1]
+    path = os.path.join(
+        tempfile.gettempdir(), f"kerascv-demo-{uploaded_file.file_id}{extension}"
+    )
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(uploaded_file.getbuffer())
+    return path
+
+
+def video_aug():
+    """Sidebar controls of the video page: the source file, streaming options
+    and the layer (single layers and pipelines, as on the image page).
+    """
+    st.subheader("Select a Video")
+    path = st.text_input("Video file", key="video_path")
+    with st.expander("Upload a video"):
+        uploaded_video = st.file_uploader(
+            "Video", type=VIDEO_TYPES, key="video_upload", label_visibility="collapsed"
+        )
+    if uploaded_video is not None:
+        path = _uploaded_video_path(uploaded_video)
+
+    batch_size = st.slider(
+        "Frames per batch",
+        1,
+        32,
+        4,
+        key="video_batch_size",
+        help="Frames augmented per layer call. Larger batches raise throughput "
+        "but add latency while a batch fills.",
+    )
+    target_fps = st.number_input(
+        "Target FPS",
+        0.0,
+        240.0,
+        0.0,
+        key="video_target_fps",
+        help="0 uses the video's own frame rate.",
+    )
+    realtime = st.checkbox(
+        "Drop frames to keep up",
+        value=True,
+        key="video_realtime",
+        help="Feed frames at the target FPS like a live source and drop those "
+        "more than one batch late. Untick to augment every frame as fast as "
+        "possible.",
+    )
+    output_path = st.text_input(
+        "Output file (optional)",
+        key="video_output",
+        help=f"Write the augmented video here ({', '.join(VIDEO_FOURCCS)}).",
+    )
+
+    layer = select_layer_for_image_aug()
+    options = {
+        "path": path,
+        "batch_size": batch_size,
+        "target_fps": target_fps,
+        "realtime": realtime,
+        "output_path": output_path,
+    }
+    return layer, options
+
+
+def display_video(layer, options: typing.Dict, preview: bool = True):
+    """Stream the augmented video to the page (and the output file) with live
+    throughput and latency stats.
+    """
+    if not st.button("Start", key="video_start"):
+        st.info("Select a video and a layer, then press Start.")
+        return
+    if not options["path"]:
+        st.error("Enter a video file or upload one first.")
+        return
+
+    try:
+        reader = FrameReader(options["path"])
+    except ValueError as error:
+        st.error(str(error))
+        return
+    fps = options["target_fps"] or reader.fps or 30.0
+    writer = None
+    if options["output_path"]:
+        try:
+            writer = VideoWriter(options["output_path"], fps)
+        except ValueError as error:
+            reader.close()
+            st.error(str(error))
+            return
+    stream = VideoStream(
+        reader,
+        layer,
+        batch_size=options["batch_size"],
+        target_fps=fps if options["realtime"] else None,
+    )
+
+    col1, col2, col3 = st.columns([1, 0.1, 1])
+    with col1:
+        st.subheader("Original Frame")
+        original = st.empty()
+    with col3:
+        st.subheader("Processed Frame")
+        processed = st.empty()
+    stats_text = st.empty()
+    progress_bar = st.progress(0.0)
+
+    last_display = 0.0
+    completed = False
+    try:
+        for indices, frames, outputs in stream:
+            if writer is not None:
+                writer.write(indices, outputs)
+            now = time.perf_counter()
+            if now - last_display < DISPLAY_INTERVAL:
+                continue
+            last_display = now
+            frame, output = frames[-1], outputs[-1]
+            if preview:
+                frame, _ = resize_to_max_side(frame)
+                output, _ = resize_to_max_side(output)
+            with original.container():
+                show_image(frame)
+            with processed.container():
+                show_image(output)
+            stats_text.caption(format_video_stats(stream.stats.summary()))
+            if stream.reader.frame_count:
+                progress_bar.progress(
+                    min(1.0, (indices[-1] + 1) / stream.reader.frame_count)
+                )
+        completed = True
+    except Exception as error:
+        # Streamlit's rerun and stop exceptions are not `Exception`s.
+        message = f"{type(error).__name__}: {error}".splitlines()[0]
+        st.error(f"Augmenting the video failed: {message}")
+    finally:
+        # Also runs when a rerun interrupts the stream.
+        stream.close()
+        if writer is not None:
+            writer.close(frame_count=reader.decoded if completed else None)
+    if not completed:
+        return
+
+    summary = stream.stats.summary()
+    progress_bar.progress(1.0)
+    stats_text.caption(format_video_stats(summary))
+    st.dataframe([{"layer": describe_layer(layer), **summary}], hide_index=True)
+    if writer is not None:
+        st.success(f"Wrote {writer.frames} frames to {writer.path}")
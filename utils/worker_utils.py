@@ -0,0 +1,187 @@
+import concurrent.futures
+import os
+import threading
+import time
+import typing
+
+import numpy as np
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from utils.cache_utils import LRUCache
+from utils.decode_utils import content_hash
+from utils.layer_utils import freeze_args
+
+
+# Number of background augmentation threads; 0 runs jobs on the script thread.
+WORKERS = int(os.environ.get("KERASCV_DEMO_WORKERS", min(4, os.cpu_count() or 1)))
+
+POLL_INTERVAL = 0.05
+
+
+class Job(typing.NamedTuple):
+    """`fn(*args, **kwargs)` plus a token identifying its inputs, so that a
+    rerun with unchanged widgets reuses the job that is already running.
+    """
+
+    fn: typing.Callable
+    args: tuple = ()
+    kwargs: dict = {}
+    token: typing.Hashable = None
+
+
+def layer_token(layer) -> typing.Hashable:
+    """Identity of a layer, pipeline or layer wrapper by configuration, so
+    that equal layers rebuilt on a rerun map to the same token.
+    """
+    bound = getattr(layer, "__self__", None)
+    if bound is not None:
+        # e.g. `AugmentationPipeline.profile`, a new bound method every rerun.
+        return (layer.__name__, layer_token(bound))
+    if hasattr(layer, "stages"):
+        stages = tuple((name, layer_token(stage)) for name, stage in layer.stages)
+        return ("pipeline", layer.execution_dtype, stages)
+    if hasattr(layer, "cache_key"):
+        return ("seeded", layer.cache_key)
+    if hasattr(layer, "bucket_mode"):
+        return ("compiled", layer.buckets, layer_token(layer.layer))
+    if hasattr(layer, "layer_args"):
+        return (type(layer).__name__, freeze_args(layer.layer_args))
+    if hasattr(layer, "get_config"):
+        token = (type(layer).__name__, freeze_args(layer.get_config()))
+        try:
+            hash(token)
+            return token
+        except TypeError:
+            pass
+    return (type(layer).__name__, id(layer))
+
+
+def job_token(*values) -> typing.Hashable:
+    """Hashable identity of job inputs: arrays by dtype, shape and content
+    hash (like the decode and result caches), layers by `layer_token` and
+    plain values as they are.
+    """
+    token = []
+    for value in values:
+        if isinstance(value, (str, int, float, bool, type(None))):
+            token.append(value)
+        elif isinstance(value, np.ndarray):
+            value = np.ascontiguousarray(value)
+            token.append((value.dtype.str, value.shape, content_hash(value)))
+        else:
+            token.append(layer_token(value))
+    return tuple(token)
+
+
+class AugmentationEngine:
+    """Thread pool for augmentation jobs that keeps only the newest job of
+    every `(session, slot)`.
+
+    Submitting a job supersedes the previous one for the same key: it is
+    cancelled if it has not started yet and its result is discarded if it
+    has. The result of the newest finished job is kept so the UI can show
+    it while a newer job is in flight.
+    """
+
+    def __init__(self, max_workers: int = WORKERS, max_results: int = 256):
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, max_workers), thread_name_prefix="augment"
+        )
+        self._jobs = {}
+        self._results = LRUCache(max_entries=max_results)
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.discarded = 0
+
+    def _is_current(self, key, token) -> bool:
+        current = self._jobs.get(key)
+        return current is not None and current[0] == token
+
+    def _run(self, key, token, job: Job):
+        with self._lock:
+            if not self._is_current(key, token):
+                self.cancelled += 1
+                raise concurrent.futures.CancelledError()
+        try:
+            result = job.fn(*job.args, **job.kwargs)
+        except BaseException:
+            # Drop the failed job so that a rerun with the same inputs retries it.
+            with self._lock:
+                if self._is_current(key, token):
+                    del self._jobs[key]
+            raise
+        with self._lock:
+            if self._is_current(key, token):
+                del self._jobs[key]
+                self._results.put(key, result)
+                self.completed += 1
+            else:
+                self.discarded += 1
+        return result
+
+    def submit(self, session_id, slot: str, job: Job) -> concurrent.futures.Future:
+        key = (session_id, slot)
+        # A fresh object when the job has no token, so it never matches.
+        token = job.token if job.token is not None else object()
+        with self._lock:
+            current = self._jobs.get(key)
+            if current is not None:
+                if current[0] == token:
+                    return current[1]
+                if current[1].cancel():
+                    self.cancelled += 1
+            future = self._executor.submit(self._run, key, token, job)
+            self._jobs[key] = (token, future)
+            self.submitted += 1
+        return future
+
+    def last_result(self, session_id, slot: str):
+        return self._results.get((session_id, slot))
+
+    def stats(self) -> typing.Dict[str, int]:
+        with self._lock:
+            return {
+                "in_flight": len(self._jobs),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "discarded": self.discarded,
+            }
+
+
+ENGINE = AugmentationEngine()
+
+
+def render_job(slot: str, job: Job, render: typing.Callable):
+    """Run `job` on the worker pool and `render` its result.
+
+    While the job is in flight the session's last good result for `slot` is
+    shown. The wait loop keeps updating a status element, which lets
+    Streamlit stop this script run as soon as a widget change starts a new
+    one; the new run then supersedes the job.
+    """
+    ctx = get_script_run_ctx()
+    if not WORKERS or ctx is None:
+        render(job.fn(*job.args, **job.kwargs))
+        return
+
+    future = ENGINE.submit(ctx.session_id, slot, job)
+    status = st.empty()
+    output = st.empty()
+    if not future.done():
+        previous = ENGINE.last_result(ctx.session_id, slot)
+        if previous is not None:
+            with output.container():
+                render(previous)
+
+    start = time.perf_counter()
+    while not future.done():
+        status.caption(f"Updating... {time.perf_counter() - start:.1f}s")
+        concurrent.futures.wait([future], timeout=POLL_INTERVAL)
+    status.empty()
+    result = future.result()
+    with output.container():
+        render(result)
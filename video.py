@@ -0,0 +1,135 @@
+"""Augment the frames of a video file and report whether a layer keeps up.
+
+Frames are fed at the target FPS (the video's own by default) and dropped
+when augmentation falls more than one batch behind; --unpaced augments every
+frame as fast as possible instead.
+
+Example:
+    python video.py --layer RandomFlip --input clip.mp4 --batch-size 8
+    python video.py --layer Grayscale --fast --input clip.mp4 --output gray.mp4
+    python video.py --pipeline "Color jitter" --input clip.mp4 --fps 60
+"""
+import argparse
+import json
+import time
+
+from utils.layer_utils import TASK_CONFIGS, get_fast_layer, get_layer_from_config
+from utils.lazy_utils import tf
+from utils.pipeline_utils import get_preset_pipeline
+from utils.precision_utils import DEFAULT_DTYPE, EXECUTION_DTYPES
+from utils.runtime_utils import apply_runtime_config
+from utils.video_utils import (
+    FrameReader,
+    VideoStream,
+    VideoWriter,
+    format_video_stats,
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    layer = parser.add_mutually_exclusive_group(required=True)
+    layer.add_argument("--layer", help="Layer name from the image LAYERS_CONFIG.")
+    layer.add_argument("--pipeline", help="Preset name from PIPELINES_CONFIG.")
+    parser.add_argument(
+        "--args",
+        default="{}",
+        help="JSON object overriding the layer's default layer_args.",
+    )
+    parser.add_argument("--input", required=True, help="Video file.")
+    parser.add_argument("--output", help="Write the augmented video (.mp4, .avi).")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument(
+        "--fps", type=float, help="Target FPS; defaults to the video's frame rate."
+    )
+    parser.add_argument(
+        "--unpaced",
+        action="store_true",
+        help="Augment every frame as fast as possible instead of dropping frames.",
+    )
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--max-frames", type=int)
+    parser.add_argument(
+        "--dtype",
+        choices=EXECUTION_DTYPES,
+        default=DEFAULT_DTYPE,
+        help="Execution dtype; must be one the layer's config offers.",
+    )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="Use the NumPy/OpenCV fast path if the layer has one.",
+    )
+    parser.add_argument("--json", help="Write the final stats to this JSON file.")
+    args = parser.parse_args(argv)
+    if args.pipeline and args.args != "{}":
+        parser.error("--args only applies to --layer")
+    if args.fast and (args.pipeline or args.dtype != DEFAULT_DTYPE):
+        parser.error("--fast only applies to --layer in float32")
+    return args
+
+
+def get_video_layer(args):
+    if args.pipeline:
+        return get_preset_pipeline("image", args.pipeline, dtype=args.dtype)
+    overrides = json.loads(args.args)
+    if args.fast:
+        layer_config = TASK_CONFIGS["image"].get(args.layer)
+        if layer_config is not None:
+            layer_args = {**layer_config["layer_args"], **overrides}
+            fast_layer = get_fast_layer(
+                args.layer, layer_config["layer_cls"], layer_args
+            )
+            if fast_layer is not None:
+                return fast_layer
+        print(f"{args.layer} has no fast path for these args; using keras_cv")
+    return get_layer_from_config("image", args.layer, overrides, dtype=args.dtype)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    apply_runtime_config(tf)
+    layer = get_video_layer(args)
+    reader = FrameReader(
+        args.input, queue_size=args.queue_size, max_frames=args.max_frames
+    )
+    fps = args.fps or reader.fps or 30.0
+    try:
+        writer = VideoWriter(args.output, fps) if args.output else None
+    except ValueError:
+        reader.close()
+        raise
+    stream = VideoStream(
+        reader,
+        layer,
+        batch_size=args.batch_size,
+        target_fps=None if args.unpaced else fps,
+    )
+
+    last_report = time.perf_counter()
+    completed = False
+    try:
+        for indices, _, outputs in stream:
+            if writer is not None:
+                writer.write(indices, outputs)
+            if time.perf_counter() - last_report >= 1.0:
+                last_report = time.perf_counter()
+                print(format_video_stats(stream.stats.summary()), flush=True)
+        completed = True
+    finally:
+        stream.close()
+        if writer is not None:
+            # Fill frames dropped at the end so the video keeps its length.
+            writer.close(frame_count=reader.decoded if completed else None)
+
+    summary = stream.stats.summary()
+    print(format_video_stats(summary))
+    if writer is not None:
+        print(f"Wrote {writer.frames} frames to {writer.path}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()